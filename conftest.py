@@ -0,0 +1 @@
+# Marks the repository root for pytest, so that the tests can import `src`
@@ -0,0 +1,136 @@
+import math
+from functools import lru_cache
+
+_BASE83_CHARACTERS = (
+    "0123456789"
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    "abcdefghijklmnopqrstuvwxyz"
+    "#$%*+,-.:;=?@[]^_{|}~"
+)
+_BASE83_VALUES = {char: value for value, char in enumerate(_BASE83_CHARACTERS)}
+
+# Resolution of the linear to sRGB lookup table
+_SRGB_LUT_SIZE = 4096
+
+
+class BlurHashError(ValueError):
+    """Error raised when decoding an invalid BlurHash"""
+
+
+def _decode_base83(text: str) -> int:
+    value = 0
+    for character in text:
+        try:
+            value = value * 83 + _BASE83_VALUES[character]
+        except KeyError as error:
+            raise BlurHashError(f"Invalid BlurHash character {character!r}") from error
+    return value
+
+
+def _srgb_to_linear(value: int) -> float:
+    value_float = value / 255
+    if value_float <= 0.04045:
+        return value_float / 12.92
+    return ((value_float + 0.055) / 1.055) ** 2.4
+
+
+def _make_linear_to_srgb_lut() -> bytes:
+    values = bytearray(_SRGB_LUT_SIZE)
+    for index in range(_SRGB_LUT_SIZE):
+        value = index / (_SRGB_LUT_SIZE - 1)
+        if value <= 0.0031308:
+            srgb = value * 12.92
+        else:
+            srgb = 1.055 * value ** (1 / 2.4) - 0.055
+        values[index] = min(255, max(0, int(srgb * 255 + 0.5)))
+    return bytes(values)
+
+
+_LINEAR_TO_SRGB = _make_linear_to_srgb_lut()
+
+
+def _sign_pow(value: float, exponent: float) -> float:
+    return math.copysign(abs(value) ** exponent, value)
+
+
+@lru_cache(maxsize=64)
+def _get_cosines(n_components: int, size: int) -> tuple[tuple[float, ...], ...]:
+    """Get the basis cosines of each component, for each pixel along an axis"""
+    return tuple(
+        tuple(math.cos(math.pi * component * pixel / size) for pixel in range(size))
+        for component in range(n_components)
+    )
+
+
+def decode(blur_hash: str, width: int, height: int, punch: float = 1.0) -> bytes:
+    """
+    Decode a BlurHash to RGB pixels (3 bytes per pixel, no row padding).
+
+    The basis is separable, so the rows are computed once per vertical component
+    and then combined, instead of summing every component for every pixel.
+    Meant to produce small images (eg. 32 px wide) that are then scaled up.
+    """
+
+    if len(blur_hash) < 6:
+        raise BlurHashError("BlurHash is too short")
+    size_flag = _decode_base83(blur_hash[0])
+    n_x = size_flag % 9 + 1
+    n_y = size_flag // 9 + 1
+    if len(blur_hash) != 4 + 2 * n_x * n_y:
+        raise BlurHashError("BlurHash length doesn't match its components")
+
+    # Components colors, in linear RGB
+    max_value = (_decode_base83(blur_hash[1]) + 1) / 166 * punch
+    dc = _decode_base83(blur_hash[2:6])
+    colors = [
+        (
+            _srgb_to_linear(dc >> 16),
+            _srgb_to_linear((dc >> 8) & 255),
+            _srgb_to_linear(dc & 255),
+        )
+    ]
+    for index in range(1, n_x * n_y):
+        ac = _decode_base83(blur_hash[4 + index * 2 : 6 + index * 2])
+        colors.append(
+            (
+                _sign_pow((ac // (19 * 19) - 9) / 9, 2) * max_value,
+                _sign_pow((ac // 19 % 19 - 9) / 9, 2) * max_value,
+                _sign_pow((ac % 19 - 9) / 9, 2) * max_value,
+            )
+        )
+
+    # Rows of each vertical component, summed over the horizontal components
+    cosines_x = _get_cosines(n_x, width)
+    rows: list[list[tuple[float, float, float]]] = []
+    for j in range(n_y):
+        row_colors = colors[j * n_x : (j + 1) * n_x]
+        rows.append(
+            [
+                (
+                    sum(c[0] * cosines[x] for c, cosines in zip(row_colors, cosines_x)),
+                    sum(c[1] * cosines[x] for c, cosines in zip(row_colors, cosines_x)),
+                    sum(c[2] * cosines[x] for c, cosines in zip(row_colors, cosines_x)),
+                )
+                for x in range(width)
+            ]
+        )
+
+    # Pixels, summed over the vertical components then converted to sRGB
+    cosines_y = _get_cosines(n_y, height)
+    scale = _SRGB_LUT_SIZE - 1
+    pixels = bytearray(width * height * 3)
+    offset = 0
+    for y in range(height):
+        weights = [cosines[y] for cosines in cosines_y]
+        for x in range(width):
+            red = green = blue = 0.0
+            for weight, row in zip(weights, rows):
+                color = row[x]
+                red += weight * color[0]
+                green += weight * color[1]
+                blue += weight * color[2]
+            pixels[offset] = _LINEAR_TO_SRGB[min(scale, max(0, int(red * scale)))]
+            pixels[offset + 1] = _LINEAR_TO_SRGB[min(scale, max(0, int(green * scale)))]
+            pixels[offset + 2] = _LINEAR_TO_SRGB[min(scale, max(0, int(blue * scale)))]
+            offset += 3
+    return bytes(pixels)
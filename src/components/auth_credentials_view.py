@@ -1,11 +1,9 @@
 import logging
 from http import HTTPStatus
+from typing import TYPE_CHECKING
 
 from gi.repository import Adw, GLib, GObject, Gtk
-from jellyfin_api_client.api.user import authenticate_user_by_name
 from jellyfin_api_client.errors import UnexpectedStatus
-from jellyfin_api_client.models.authenticate_user_by_name import AuthenticateUserByName
-from jellyfin_api_client.models.authentication_result import AuthenticationResult
 
 from src import shared
 from src.components.widget_builder import (
@@ -17,9 +15,12 @@ from src.components.widget_builder import (
     build,
 )
 from src.database.api import ServerInfo, UserInfo
-from src.jellyfin import JellyfinClient, make_device_id
+from src.jellyfin import make_device_id
 from src.task import Task
 
+if TYPE_CHECKING:
+    from jellyfin_api_client.models.authentication_result import AuthenticationResult
+
 
 class InvalidCredentialsError(Exception):
     """Error raised when the user cannot be authenticated"""
@@ -103,20 +104,31 @@ class AuthCredentialsView(Adw.NavigationPage):
     def __on_log_in_request(self, _widget) -> None:
         """Try to authenticate the user with the given credentials"""
 
-        def main(username: str, password: str) -> AuthenticationResult:
-            device_id = make_device_id()
-            client = JellyfinClient(base_url=self.__server.address, device_id=device_id)
-            response = authenticate_user_by_name.sync_detailed(
-                client=client,
-                json_body=AuthenticateUserByName(username=username, pw=password),  # type: ignore
+        def main(username: str, password: str) -> "AuthenticationResult":
+            # Imported here on first use, since it loads all the API models
+            # pylint: disable=import-outside-toplevel
+            from jellyfin_api_client.api.user import authenticate_user_by_name
+            from jellyfin_api_client.models.authenticate_user_by_name import (
+                AuthenticateUserByName,
             )
+
+            device_id = make_device_id()
+            client = shared.clients.get(self.__server.address, device_id=device_id)
+            try:
+                response = authenticate_user_by_name.sync_detailed(
+                    client=client,
+                    json_body=AuthenticateUserByName(username=username, pw=password),  # type: ignore
+                )
+            finally:
+                # The authenticated session will use a client with the token
+                shared.clients.close_client(client)
             if response.status_code == HTTPStatus.OK:
                 return response.parsed
             if response.status_code == HTTPStatus.UNAUTHORIZED:
                 raise InvalidCredentialsError()
             raise UnexpectedStatus(response.status_code, response.content)
 
-        def on_success(result: AuthenticationResult) -> None:
+        def on_success(result: "AuthenticationResult") -> None:
             logging.debug(
                 "Authenticated %s on %s",
                 result.user.name,  # type: ignore
@@ -128,6 +140,7 @@ class AuthCredentialsView(Adw.NavigationPage):
                 UserInfo(
                     user_id=result.user.id,  # type: ignore
                     name=result.user.name,  # type: ignore
+                    primary_image_tag=result.user.primary_image_tag or "",  # type: ignore
                 ),
             )
             shared.settings.add_token(
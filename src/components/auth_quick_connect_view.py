@@ -1,14 +1,9 @@
 import logging
 from http import HTTPStatus
-from typing import Type, cast, no_type_check
+from typing import TYPE_CHECKING, Type, cast, no_type_check
 
 from gi.repository import Adw, Gio, GLib, GObject, Gtk, Pango
-from jellyfin_api_client.api.quick_connect import initiate_quick_connect
-from jellyfin_api_client.api.user import authenticate_with_quick_connect
 from jellyfin_api_client.errors import UnexpectedStatus
-from jellyfin_api_client.models.authentication_result import AuthenticationResult
-from jellyfin_api_client.models.quick_connect_dto import QuickConnectDto
-from jellyfin_api_client.models.quick_connect_result import QuickConnectResult
 
 from src import shared
 from src.components.widget_builder import (
@@ -19,9 +14,13 @@ from src.components.widget_builder import (
     build,
 )
 from src.database.api import ServerInfo, UserInfo
-from src.jellyfin import JellyfinClient, make_device_id
+from src.jellyfin import make_device_id
 from src.task import Task
 
+if TYPE_CHECKING:
+    from jellyfin_api_client.models.authentication_result import AuthenticationResult
+    from jellyfin_api_client.models.quick_connect_result import QuickConnectResult
+
 
 class QuickConnectDisabledError(Exception):
     """Exception raised when quick connect is not enabled on the server"""
@@ -177,16 +176,20 @@ class AuthQuickConnectView(Adw.NavigationPage):
         self.refresh()
 
     def refresh(self) -> None:
-        def main() -> QuickConnectResult:
-            client = JellyfinClient(base_url=self.__server.address)
+        def main() -> "QuickConnectResult":
+            # Imported here on first use, since it loads all the API models
+            # pylint: disable=import-outside-toplevel
+            from jellyfin_api_client.api.quick_connect import initiate_quick_connect
+
+            client = shared.clients.get(self.__server.address)
             response = initiate_quick_connect.sync_detailed(client=client)
             if response.status_code == HTTPStatus.OK:
-                return cast(QuickConnectResult, response.parsed)
+                return cast("QuickConnectResult", response.parsed)
             if HTTPStatus.UNAUTHORIZED:
                 raise QuickConnectDisabledError()
             raise UnexpectedStatus(response.status_code, response.content)
 
-        def on_success(result: QuickConnectResult):
+        def on_success(result: "QuickConnectResult"):
             self.__secret = cast(str, result.secret)
             label_markup = f'<span size="xx-large">{result.code}</span>'
             self.__state_ok_view.set_label(label_markup)
@@ -226,23 +229,35 @@ class AuthQuickConnectView(Adw.NavigationPage):
     def on_connect_requested(self, _widget) -> None:
         """Try to authenticate with the server"""
 
-        def main() -> AuthenticationResult:
+        def main() -> "AuthenticationResult":
+            # pylint: disable=import-outside-toplevel
+            from jellyfin_api_client.api.user import authenticate_with_quick_connect
+            from jellyfin_api_client.models.quick_connect_dto import QuickConnectDto
+
             device_id = make_device_id()
-            client = JellyfinClient(base_url=self.__server.address, device_id=device_id)
-            response = authenticate_with_quick_connect.sync_detailed(
-                client=client,
-                body=QuickConnectDto(secret=self.__secret),
-            )
+            client = shared.clients.get(self.__server.address, device_id=device_id)
+            try:
+                response = authenticate_with_quick_connect.sync_detailed(
+                    client=client,
+                    body=QuickConnectDto(secret=self.__secret),
+                )
+            finally:
+                # The authenticated session will use a client with the token
+                shared.clients.close_client(client)
             if response.status_code == HTTPStatus.OK:
-                return cast(AuthenticationResult, response.parsed)
+                return cast("AuthenticationResult", response.parsed)
             if response.status_code == HTTPStatus.NOT_FOUND:
                 raise UnauthorizedQuickConnect()
             raise UnexpectedStatus(response.status_code, response.content)
 
         @no_type_check
-        def on_success(result: AuthenticationResult) -> None:
+        def on_success(result: "AuthenticationResult") -> None:
             logging.debug("Authenticated via quick connect")
-            user_info = UserInfo(user_id=result.user.id, name=result.user.name)
+            user_info = UserInfo(
+                user_id=result.user.id,
+                name=result.user.name,
+                primary_image_tag=result.user.primary_image_tag or "",
+            )
             shared.settings.add_users(self.__server.address, user_info)
             shared.settings.add_token(
                 address=self.__server.address,
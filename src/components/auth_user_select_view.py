@@ -1,12 +1,10 @@
 import logging
 from http import HTTPStatus
-from typing import cast
+from typing import TYPE_CHECKING, cast
 
 from gi.repository import Adw, GObject, Gtk
 from httpx import TimeoutException
-from jellyfin_api_client.api.user import get_public_users
 from jellyfin_api_client.errors import UnexpectedStatus
-from jellyfin_api_client.models import UserDto
 
 from src import shared
 from src.components.loading_view import LoadingView
@@ -20,9 +18,11 @@ from src.components.widget_builder import (
     build,
 )
 from src.database.api import ServerInfo, UserInfo
-from src.jellyfin import JellyfinClient
 from src.task import Task
 
+if TYPE_CHECKING:
+    from jellyfin_api_client.models.user_dto import UserDto
+
 
 class NoPublicUsers(Exception):
     """Error raised when the server doesn't provide public users"""
@@ -129,18 +129,23 @@ class AuthUserSelectView(Adw.NavigationPage):
         """Discover users from the server asynchronously"""
 
         def main() -> list[UserInfo]:
+            # Imported here on first use, since it loads all the API models
+            # pylint: disable=import-outside-toplevel
+            from jellyfin_api_client.api.user import get_public_users
+
             # Get a list of public users
-            client = JellyfinClient(self.server.address)
+            client = shared.clients.get(self.server.address)
             response = get_public_users.sync_detailed(client=client)
             if response.status_code != HTTPStatus.OK:
                 raise UnexpectedStatus(response.status_code, response.content)
-            user_dtos = cast(list[UserDto], response.parsed)
+            user_dtos = cast(list["UserDto"], response.parsed)
             if len(user_dtos) == 0:
                 raise NoPublicUsers()
             public = [
                 UserInfo(
                     user_id=cast(str, dto.id),
                     name=cast(str, dto.name),
+                    primary_image_tag=dto.primary_image_tag or "",
                 )
                 for dto in user_dtos
             ]
@@ -1,15 +1,19 @@
 import logging
+import weakref
 from dataclasses import dataclass
 from http import HTTPStatus
-from typing import Optional
+from typing import NamedTuple, Optional, cast
 
-from gi.repository import Adw, Gdk, GLib, GObject, Gtk, Pango
+from gi.repository import Adw, Gdk, Gio, GLib, GObject, Graphene, Gtk, Pango
 from jellyfin_api_client.errors import UnexpectedStatus
-from jellyfin_api_client.models.image_type import ImageType
 
+from src import shared
 from src.components.widget_builder import Children, Properties, build
+from src.image_cache import ImageDecodeError, ImageKey
+from src.image_format import get_image_format, get_image_params
+from src.item_store import ItemRecord
 from src.jellyfin import JellyfinClient
-from src.task import Task
+from src.task import CancellationScope, TaskPriority
 
 
 class ImageDownloadError(UnexpectedStatus):
@@ -29,17 +33,99 @@ class Size:
 POSTER = Size(200, 300)
 WIDE_SCREENSHOT = Size(200, 112)
 
+# Value of ImageType.PRIMARY, not imported since that loads every API model
+PRIMARY_IMAGE_TYPE = "Primary"
+
+# BlurHash placeholders are decoded at a fraction of the image size, then scaled up
+PLACEHOLDER_SIZE_DIVISOR = 10
+IMAGE_CROSSFADE_DURATION_MS = 200
+# Icon shown for the items without an image
+FALLBACK_ICON_NAME = "image-missing-symbolic"
+
+
+class _ImageLoad(NamedTuple):
+    """Cancellable of an image load, also cancelled by its parent"""
+
+    cancellable: Gio.Cancellable
+    parent: Optional[Gio.Cancellable]
+    handler: int
+
+    @classmethod
+    def create(cls, parent: Optional[Gio.Cancellable]) -> "_ImageLoad":
+        cancellable = Gio.Cancellable()
+        handler = 0
+        if parent is not None:
+            if parent.is_cancelled():
+                cancellable.cancel()
+            else:
+                handler = parent.connect(
+                    "cancelled", lambda _parent: cancellable.cancel()
+                )
+        return cls(cancellable, parent, handler)
+
+    def cancel(self) -> None:
+        if self.handler:
+            # Not using Gio.Cancellable.disconnect, it deadlocks from within a handler
+            GObject.signal_handler_disconnect(self.parent, self.handler)
+        self.cancellable.cancel()
+
+
+class _ScaledTexture(GObject.Object, Gdk.Paintable):
+    """
+    Texture drawn at a fraction of its pixel size, eg. at half on a 2x display.
+    Textures have no scale of their own, a picture would otherwise request their
+    pixel size in logical pixels.
+    """
+
+    __gtype_name__ = "MarmaladeScaledTexture"
+
+    __texture: Gdk.Texture
+    __scale: int
+
+    def __init__(self, texture: Gdk.Texture, scale: int) -> None:
+        super().__init__()
+        self.__texture = texture
+        self.__scale = scale
+
+    def do_get_intrinsic_width(self) -> int:
+        return self.__texture.get_width() // self.__scale
+
+    def do_get_intrinsic_height(self) -> int:
+        return self.__texture.get_height() // self.__scale
+
+    def do_get_flags(self) -> Gdk.PaintableFlags:
+        return Gdk.PaintableFlags.SIZE | Gdk.PaintableFlags.CONTENTS
+
+    def do_snapshot(self, snapshot: Gtk.Snapshot, width: float, height: float) -> None:
+        bounds = Graphene.Rect().init(0, 0, width, height)
+        snapshot.append_texture(self.__texture, bounds)
+
 
 class ItemCard(Adw.Bin):
     __gtype_name__ = "MarmaladeItemCard"
 
     __button: Gtk.Button
+    __image_stack: Gtk.Stack
+    __placeholder_picture: Gtk.Picture
     __picture: Gtk.Picture
     __title_label: Gtk.Label
     __subtitle_label: Gtk.Label
 
+    __image_key: Optional[ImageKey] = None
+    __image_client: Optional[JellyfinClient] = None
+    __image_scope: Optional[CancellationScope] = None
+    __image_priority: TaskPriority = TaskPriority.VISIBLE_IMAGE
+    __image_load: Optional["_ImageLoad"] = None
+    __is_image_interrupted: bool = False
+    __image_blur_hash: str = ""
+    __record: Optional[ItemRecord] = None
+    __record_handler: int = 0
+
     def __init_widget(self):
 
+        self.__placeholder_picture = build(
+            Gtk.Picture + Properties(content_fit=Gtk.ContentFit.FILL)
+        )
         self.__picture = build(
             Gtk.Picture
             + Properties(
@@ -47,6 +133,26 @@ class ItemCard(Adw.Bin):
                 content_fit=Gtk.ContentFit.COVER,
             )
         )
+        self.__image_stack = build(
+            Gtk.Stack
+            + Properties(
+                transition_type=Gtk.StackTransitionType.CROSSFADE,
+                transition_duration=IMAGE_CROSSFADE_DURATION_MS,
+            )
+        )
+        self.__image_stack.add_named(self.__placeholder_picture, "placeholder")
+        self.__image_stack.add_named(self.__picture, "image")
+        self.__image_stack.add_named(
+            build(
+                Gtk.Image
+                + Properties(
+                    icon_name=FALLBACK_ICON_NAME,
+                    pixel_size=48,
+                    css_classes=["dim-label"],
+                )
+            ),
+            "fallback",
+        )
         self.__title_label = build(
             Gtk.Label
             + Properties(
@@ -70,7 +176,7 @@ class ItemCard(Adw.Bin):
                 Gtk.Box
                 + Properties(orientation=Gtk.Orientation.VERTICAL)
                 + Children(
-                    self.__picture,
+                    self.__image_stack,
                     Gtk.Box
                     + Properties(
                         orientation=Gtk.Orientation.VERTICAL,
@@ -128,20 +234,20 @@ class ItemCard(Adw.Bin):
 
     # image_type property
 
-    __image_type: ImageType = ImageType.PRIMARY
+    __image_type: str = PRIMARY_IMAGE_TYPE
 
-    @GObject.Property(type=str, default=ImageType.PRIMARY)
-    def image_type(self) -> ImageType:
+    @GObject.Property(type=str, default=PRIMARY_IMAGE_TYPE)
+    def image_type(self) -> str:
         return self.__image_type
 
-    def get_image_type(self) -> ImageType:
+    def get_image_type(self) -> str:
         return self.get_property("image_type")
 
     @image_type.setter
-    def image_type_setter(self, value: ImageType) -> None:
+    def image_type_setter(self, value: str) -> None:
         self.__image_type = value
 
-    def set_image_type(self, value: ImageType):
+    def set_image_type(self, value: str):
         self.set_property("image_type", value)
 
     # image_tag property
@@ -232,29 +338,177 @@ class ItemCard(Adw.Bin):
     def __update_subtitle_visible(self, *_args) -> None:
         self.__subtitle_label.set_visible(bool(self.__subtitle_label.get_label()))
 
+    def __update_from_record(self) -> None:
+        record = cast(ItemRecord, self.__record)
+        self.set_item_id(record.item_id)
+        self.set_title(record.name)
+        self.set_image_tag(record.get_image_tag(self.get_image_type()))
+        self.__image_blur_hash = record.get_image_blur_hash(self.get_image_type())
+
+    def __on_record_changed(self, names: list[str]) -> None:
+        previous_image_tag = self.get_image_tag()
+        self.__update_from_record()
+        if "image_tags" in names and self.get_image_tag() != previous_image_tag:
+            self.__reload_image()
+
+    def __reload_image(self) -> None:
+        """Load the image again, with the arguments of the last load"""
+        if self.__image_client is not None:
+            self.load_image(
+                self.__image_client, self.__image_scope, self.__image_priority
+            )
+
+    def __cancel_image_load(self) -> None:
+        if self.__image_load is not None:
+            self.__image_load.cancel()
+            self.__image_load = None
+
+    def __clear_image(self) -> None:
+        """Stop loading the image and show nothing"""
+        self.__cancel_image_load()
+        self.__is_image_interrupted = False
+        self.__image_key = None
+        self.__picture.set_paintable(None)
+        self.__placeholder_picture.set_paintable(None)
+        self.__image_stack.set_visible_child_full(
+            "placeholder", Gtk.StackTransitionType.NONE
+        )
+
+    def __is_image_done(self) -> bool:
+        """Whether the image, or the fallback of an item without one, is shown"""
+        return self.__image_stack.get_visible_child_name() != "placeholder"
+
+    def __on_scale_factor_changed(self, *_args) -> None:
+        # Eg. moved to a monitor of another scale, the texture size no longer matches
+        if self.__image_key is not None:
+            self.__reload_image()
+
+    def __on_mapped(self, *_args) -> None:
+        # Shown again (eg. back to the page) before the image was loaded
+        if self.__is_image_interrupted:
+            self.__reload_image()
+
+    def __on_unmapped(self, *_args) -> None:
+        # Hidden cards (eg. recycled away) don't need their image anymore
+        if self.__image_load is not None and not self.__is_image_done():
+            self.__cancel_image_load()
+            self.__is_image_interrupted = True
+
     # Public methods
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.__init_widget()
         self.__update_subtitle_visible()
+        self.connect("map", self.__on_mapped)
+        self.connect("unmap", self.__on_unmapped)
+        self.connect("notify::scale-factor", self.__on_scale_factor_changed)
+
+    def bind_record(self, record: ItemRecord) -> None:
+        """
+        Show an item record, and follow its changes.
+        Replaces the previously bound record, eg. when the card is recycled.
+        """
+
+        if self.__record is not None:
+            self.__record.disconnect(self.__record_handler)
+        if record is not self.__record:
+            self.__clear_image()
+        self.__record = record
+
+        # The record may outlive the card, it must not keep it alive
+        card_ref = weakref.ref(self)
+
+        def on_record_changed(record: ItemRecord, names: list[str]) -> None:
+            if (card := card_ref()) is None:
+                record.disconnect_by_func(on_record_changed)
+                return
+            card.__on_record_changed(names)
+
+        self.__record_handler = record.connect("changed", on_record_changed)
+        self.__update_from_record()
+
+    def load_image(
+        self,
+        client: JellyfinClient,
+        scope: Optional[CancellationScope] = None,
+        priority: TaskPriority = TaskPriority.VISIBLE_IMAGE,
+    ) -> None:
+        """
+        Load the item's image from the image cache or the server.
+        Pass a cancellation scope to abort the download, eg. when leaving the page.
+        May be called again after changing the item, eg. when the card is recycled,
+        or with a more urgent priority, eg. when a prefetched card becomes visible.
+        When the bound record's image changes, it is reloaded with the same arguments,
+        as when the scale factor changes since the texture matches the device pixels.
+        The load is cancelled when the card is unmapped before it ends,
+        and resumed when it is mapped again.
+        """
+
+        # Textures are requested at the exact size of the picture on screen
+        image_size = self.get_image_size()
+        scale = self.get_scale_factor()
+        key = ImageKey(
+            item_id=self.get_item_id(),
+            image_type=str(self.get_image_type()),
+            image_tag=self.get_image_tag() or "",
+            width=image_size.width * scale,
+            height=image_size.height * scale,
+            image_format=get_image_format(str(self.get_image_type())),
+        )
 
-    def load_image(self, client: JellyfinClient) -> None:
-        """Load the item's image from the server or the cache"""
+        # Nothing to do if the image is shown, or already loading as urgently
+        if key == self.__image_key:
+            if self.__is_image_done():
+                self.__image_client = client
+                self.__image_scope = scope
+                self.__image_priority = priority
+                return
+            is_loading = (
+                self.__image_load is not None
+                and not self.__image_load.cancellable.is_cancelled()
+            )
+            if (
+                is_loading
+                and scope is self.__image_scope
+                and priority >= self.__image_priority
+            ):
+                self.__image_client = client
+                return
+
+        # The previous load is cancelled once this one is registered,
+        # so that the image cache doesn't drop a download that is still wanted.
+        # The scope's cancellable is taken now, it is replaced when the scope resets.
+        previous_load = self.__image_load
+        self.__image_client = client
+        self.__image_scope = scope
+        self.__image_priority = priority
+        self.__is_image_interrupted = False
+        self.__image_load = _ImageLoad.create(
+            None if scope is None else scope.get_cancellable()
+        )
+        load_cancellable = self.__image_load.cancellable
+        self.__image_key = key
+        self.__picture.set_paintable(None)
+        self.__placeholder_picture.set_paintable(None)
+        self.__image_stack.set_visible_child_full(
+            "placeholder", Gtk.StackTransitionType.NONE
+        )
+        # Set until the cache returns, memory hits are delivered in the meantime
+        is_synchronous = True
 
-        def download_image() -> Gdk.Texture:
-            """Download the image in PNG format in the given file"""
+        def download_image() -> bytes:
+            """Download the image in the negotiated format, filling its size"""
 
             # Create query
-            url = f"/Items/{self.get_item_id()}/Images/{self.get_image_type()}"
-            image_size = self.get_image_size()
+            url = f"/Items/{key.item_id}/Images/{key.image_type}"
             params = {
-                "format": "Png",
-                "maxHeight": image_size.height,
-                "maxWidth": image_size.width,
+                **get_image_params(key.image_format),
+                "fillWidth": key.width,
+                "fillHeight": key.height,
             }
-            if tag := self.get_image_tag():
-                params["tag"] = tag
+            if key.image_tag:
+                params["tag"] = key.image_tag
 
             # Make the request
             httpx_client = client.get_httpx_client()
@@ -266,33 +520,75 @@ class ItemCard(Adw.Bin):
                     raise NoImageError(res.status_code, res.content)
                 case _:
                     raise ImageDownloadError(res.status_code, res.content)
+            return res.content
+
+        def on_load_success(texture: Gdk.Texture):
+            if key != self.__image_key:
+                # The card now shows another item
+                return
+            self.__picture.set_paintable(_ScaledTexture(texture, scale))
+            # Images already in memory are shown at once, downloads fade in
+            self.__image_stack.set_visible_child_full(
+                "image",
+                (
+                    Gtk.StackTransitionType.NONE
+                    if is_synchronous
+                    else Gtk.StackTransitionType.CROSSFADE
+                ),
+            )
 
-            # Wrap in a Gtk.Paintable
-            # TODO composite the image to be the exact image format
-            return Gdk.Texture.new_from_bytes(GLib.Bytes.new(res.content))
-
-        def on_download_success(paintable: Gdk.Texture):
-            self.__picture.set_paintable(paintable)
+        def on_placeholder_success(texture: Gdk.Texture):
+            if key != self.__image_key or self.__picture.get_paintable() is not None:
+                # The card now shows another item, or the image is already there
+                return
+            self.__placeholder_picture.set_paintable(texture)
 
-        def on_download_error(error: Exception):
+        def on_load_error(error: Exception):
+            if key == self.__image_key and not isinstance(error, NoImageError):
+                # The load is over, let the next call retry it
+                self.__cancel_image_load()
             match error:
                 case NoImageError():
-                    logging.debug("%s has no image", self.get_item_id())
-                    # TODO set a fallback image
+                    logging.debug("%s has no image", key.item_id)
+                    # Keep the BlurHash placeholder if there is one
+                    if key == self.__image_key and not self.__image_blur_hash:
+                        self.__image_stack.set_visible_child_full(
+                            "fallback", Gtk.StackTransitionType.NONE
+                        )
+                case ImageDecodeError() if (
+                    key == self.__image_key
+                    and get_image_format(key.image_type) != key.image_format
+                    and self.__image_client is not None
+                ):
+                    # Retry in the fallback format
+                    self.__reload_image()
                 case ImageDownloadError():
                     logging.error(
-                        "Item %s image error %d", self.get_item_id(), error.status_code
+                        "Item %s image error %d", key.item_id, error.status_code
                     )
                 case _:
-                    logging.error(
-                        "Unexpected %s error", self.get_item_id(), exc_info=error
-                    )
-
-        # Download the image asynchronously
-        # (Note that caching is done at the HTTP layer on the Client)
-        task = Task(
-            main=download_image,
-            callback=on_download_success,
-            error_callback=on_download_error,
+                    logging.error("Unexpected %s error", key.item_id, exc_info=error)
+
+        shared.image_cache.load(
+            key=key,
+            download=download_image,
+            callback=on_load_success,
+            error_callback=on_load_error,
+            cancellable=load_cancellable,
+            priority=priority,
+            group=client._base_url,
         )
-        task.run()
+        is_synchronous = False
+
+        # Show the BlurHash placeholder while the image downloads
+        if self.__image_blur_hash and self.__picture.get_paintable() is None:
+            shared.image_cache.load_placeholder(
+                blur_hash=self.__image_blur_hash,
+                width=max(1, image_size.width // PLACEHOLDER_SIZE_DIVISOR),
+                height=max(1, image_size.height // PLACEHOLDER_SIZE_DIVISOR),
+                callback=on_placeholder_success,
+                cancellable=load_cancellable,
+            )
+
+        if previous_load is not None:
+            previous_load.cancel()
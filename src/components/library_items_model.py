@@ -0,0 +1,62 @@
+from typing import Optional, Sequence
+
+from gi.repository import Gio, GObject
+
+from src.components.list_store_item import ListStoreItem
+from src.database.library import LibraryItem
+from src.item_store import ItemStore
+
+
+class LibraryItemsModel(GObject.Object, Gio.ListModel):
+    """
+    List model of a library's items, in the order of an index permutation.
+
+    - Items are `ListStoreItem`s wrapping `ItemRecord`s, like the shelves use
+    - Records are only created when a view asks for them, eg. for visible cards
+    - Sorting or filtering swaps the permutation, without touching the items
+    """
+
+    __gtype_name__ = "MarmaladeLibraryItemsModel"
+
+    __store: ItemStore
+    __items: Sequence[LibraryItem]
+    __order: Sequence[int]
+    __wrappers: dict[int, ListStoreItem]
+
+    def __init__(self, store: ItemStore, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.__store = store
+        self.__items = ()
+        self.__order = ()
+        self.__wrappers = {}
+
+    def do_get_item_type(self) -> GObject.GType:
+        return ListStoreItem.__gtype__
+
+    def do_get_n_items(self) -> int:
+        return len(self.__order)
+
+    def do_get_item(self, position: int) -> Optional[ListStoreItem]:
+        if position >= len(self.__order):
+            return None
+        index = self.__order[position]
+        if (wrapper := self.__wrappers.get(index)) is None:
+            item = self.__items[index]
+            # Records already in the store may be more recent than the local library
+            record = self.__store.get(item.item_id) or self.__store.merge(
+                item.to_dict()
+            )
+            wrapper = self.__wrappers[index] = ListStoreItem(record)
+        return wrapper
+
+    def set_items(self, items: Sequence[LibraryItem], order: Sequence[int]) -> None:
+        """Replace the items, shown in the order of a permutation of their indices"""
+        self.__items = items
+        self.__wrappers = {}
+        self.set_order(order)
+
+    def set_order(self, order: Sequence[int]) -> None:
+        """Show the items in the order of a permutation of their indices"""
+        n_removed = len(self.__order)
+        self.__order = order
+        self.items_changed(0, n_removed, len(order))
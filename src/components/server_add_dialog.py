@@ -1,25 +1,10 @@
-import json
 import logging
-import socket
-import time
-from socket import (
-    AF_INET,
-    AF_INET6,
-    IPPROTO_UDP,
-    SO_BINDTODEVICE,
-    SO_BROADCAST,
-    SOCK_DGRAM,
-    SOL_SOCKET,
-)
-from typing import Set
+from typing import TYPE_CHECKING, Set
 
-import psutil
 from gi.repository import Adw, Gio, GLib, GObject, Gtk
 from httpx import InvalidURL, RequestError
-from jellyfin_api_client.api.system import get_public_system_info
-from jellyfin_api_client.client import Client as JfClient
-from jellyfin_api_client.models.public_system_info import PublicSystemInfo
 
+from src import shared
 from src.components.servers_list_row import ServersListRow
 from src.components.widget_builder import (
     Children,
@@ -29,8 +14,12 @@ from src.components.widget_builder import (
     build,
 )
 from src.database.api import ServerInfo
+from src.discovery import ServerDiscovery
 from src.task import Task
 
+if TYPE_CHECKING:
+    from jellyfin_api_client.models.public_system_info import PublicSystemInfo
+
 
 class KnownAddressError(Exception):
     """Error raised when trying to add a duplicate server address"""
@@ -39,20 +28,13 @@ class KnownAddressError(Exception):
 class ServerAddDialog(Adw.ApplicationWindow):
     __gtype_name__ = "MarmaladeServerAddDialog"
 
-    DISCOVERY_PORT: int = 7359
-    DISCOVERY_ENCODING: str = "utf-8"
-    DISCOVERY_SEND_TIMEOUT_SECONDS: float = 5.0
-    DISCOVERY_RECEIVE_TIMEOUT_SECONDS: float = 30.0
-    DISCOVERY_BUFSIZE: int = 4096
-
     __manual_add_editable: Adw.EntryRow
     __detected_server_rows_group: Adw.PreferencesGroup
     __spinner_revealer: Gtk.Revealer
     __toast_overlay: Adw.ToastOverlay
 
     __tasks_cancellable: Gio.Cancellable
-    __discover_subtasks_count: int
-    __discover_subtasks_done_count: int
+    __discovery: ServerDiscovery
     __addresses: set[str]
     __discovered_addresses: set[str]
 
@@ -158,107 +140,23 @@ class ServerAddDialog(Adw.ApplicationWindow):
         self.__init_widget()
 
         self.__tasks_cancellable = Gio.Cancellable.new()
-        self.__discover_subtasks_count = 0
-        self.__discover_subtasks_done_count = 0
         self.__addresses = set(addresses)
         self.__discovered_addresses = set(addresses)
-        discover_task = Task(
-            main=self.discover,
-            cancellable=self.__tasks_cancellable,
-        )
-        discover_task.run()
+        self.__discovery = ServerDiscovery()
+        self.__discovery.connect("server-found", self.__on_server_found)
+        self.__discovery.connect("finished", self.__on_discovery_finished)
+        self.__discovery.start()
 
     def close(self) -> None:
         self.__tasks_cancellable.cancel()
+        self.__discovery.stop()
         super().close()
 
-    def discover(self) -> None:
-        logging.debug("Discovering servers")
-        for name, address_info_list in psutil.net_if_addrs().items():
-            for address_info in address_info_list:
-                if (
-                    address_info.family not in (AF_INET, AF_INET6)
-                    or address_info.broadcast is None
-                ):
-                    continue
-                self.__discover_subtasks_count += 1
-                subtask = Task(
-                    main=self.discover_on_interface,
-                    main_args=(name, address_info.family, address_info.broadcast),
-                    callback=self.on_discover_subtask_finished,
-                    cancellable=self.__tasks_cancellable,
-                )
-                subtask.run()
+    def __on_server_found(self, _discovery, server: ServerInfo) -> None:
+        self.add_discovered_server(server)
 
-    def discover_on_interface(
-        self,
-        interface_name: str,
-        address_family: socket.AddressFamily,  # pylint: disable=no-member
-        broadcast_address: str,
-    ) -> None:
-        """Discover servers by UDP broadcasting on the given interface information"""
-
-        with socket.socket(
-            family=address_family, type=SOCK_DGRAM, proto=IPPROTO_UDP
-        ) as sock:
-            # Set socket up
-            interface_name_buffer = bytearray(interface_name, encoding="utf-8")
-            sock.setsockopt(SOL_SOCKET, SO_BINDTODEVICE, interface_name_buffer)
-            sock.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
-
-            # Broadcast
-            try:
-                self.discover_broadcast(sock, broadcast_address)
-            except TimeoutError:
-                logging.error("Server discovery broadcast send timed out")
-                return
-
-            # Listen for responses
-            try:
-                self.discover_listen(sock)
-            except TimeoutError:
-                logging.debug("Server discovery receive timeout")
-                return
-
-    def discover_broadcast(self, sock, address):
-        """
-        Broadcast a discover message on the socket.
-        Changes the socket's timeout value.
-        May raise TimeoutError.
-        """
-        logging.debug("Discovering servers on %s %d", address, self.DISCOVERY_PORT)
-        sock.settimeout(self.DISCOVERY_SEND_TIMEOUT_SECONDS)
-        message = bytearray("Who is JellyfinServer?", encoding=self.DISCOVERY_ENCODING)
-        sock.sendto(message, (address, self.DISCOVERY_PORT))
-
-    def discover_listen(self, sock):
-        """
-        Receive discover response messages from the socket.
-        Changes the socket timeout value.
-        May raise TimeoutError.
-        """
-        logging.debug("Listening for server responses")
-        start = time.time()
-        elapsed = 0
-        while elapsed < self.DISCOVERY_RECEIVE_TIMEOUT_SECONDS:
-            # Wait for a message
-            sock.settimeout(self.DISCOVERY_RECEIVE_TIMEOUT_SECONDS - elapsed)
-            (response, _address) = sock.recvfrom(self.DISCOVERY_BUFSIZE)
-            # Process the message
-            message = response.decode(encoding=self.DISCOVERY_ENCODING)
-            try:
-                server_info = json.loads(message)
-                server = ServerInfo(
-                    name=server_info["Name"],
-                    address=server_info["Address"],
-                    server_id=server_info["Id"],
-                )
-            except (json.JSONDecodeError, KeyError):
-                # Response isn't JSON or contains invalid data
-                continue
-            # Add a server row in the main thread
-            GLib.idle_add(self.add_discovered_server, server)
-            elapsed = time.time() - start
+    def __on_discovery_finished(self, _discovery) -> None:
+        self.__spinner_revealer.set_reveal_child(False)
 
     def add_discovered_server(self, server: ServerInfo) -> None:
         # Deduplicate servers
@@ -275,11 +173,6 @@ class ServerAddDialog(Adw.ApplicationWindow):
             )
         )
 
-    def on_discover_subtask_finished(self, _result):
-        self.__discover_subtasks_done_count += 1
-        if self.__discover_subtasks_count == self.__discover_subtasks_done_count:
-            self.__spinner_revealer.set_reveal_child(False)
-
     def __on_cancel_button_clicked(self, _button) -> None:
         self.emit("cancelled")
         self.close()
@@ -288,14 +181,22 @@ class ServerAddDialog(Adw.ApplicationWindow):
         self.emit("server-picked", server_row.get_server())
         self.close()
 
-    def query_public_server_info(self, address: str) -> PublicSystemInfo:
-        """Query a server address to check its validity and get its name"""
+    def query_public_server_info(self, address: str) -> "PublicSystemInfo":
+        """
+        Query a server address to check its validity and get its name.
+        Called in a worker thread, since it imports the API models on first use.
+        """
+        # pylint: disable=import-outside-toplevel
+        from jellyfin_api_client.api.system import get_public_system_info
+
+        client = shared.clients.get(address)
         try:
-            client = JfClient(address)
             info = get_public_system_info.sync(client=client)
         except (RequestError, InvalidURL) as error:
+            shared.clients.close_client(client)
             raise ValueError(_("Invalid server address")) from error
         if info is None:
+            shared.clients.close_client(client)
             raise ValueError(_("Server has no public info"))
         return info
 
@@ -317,7 +218,7 @@ class ServerAddDialog(Adw.ApplicationWindow):
                 logging.error('Invalid server address "%s"', address, exc_info=error)
             self.__toast_overlay.add_toast(toast)
 
-        def on_success(address: str, result: PublicSystemInfo):
+        def on_success(address: str, result: "PublicSystemInfo"):
             server = ServerInfo(
                 name=result.server_name,  # type: ignore
                 server_id=result.id,  # type: ignore
@@ -1,6 +1,8 @@
 from gi.repository import Adw, Gio, GLib, GObject
 
+from src.item_store import ItemStore
 from src.jellyfin import JellyfinClient
+from src.task import CancellationScope
 
 
 class ServerBrowser(Adw.NavigationPage):
@@ -8,11 +10,24 @@ class ServerBrowser(Adw.NavigationPage):
 
     __gtype_name__ = "MarmaladeServerBrowser"
 
+    __cancellation_scope: CancellationScope
+    __item_store: ItemStore
+
     def __init__(self, *args, client: JellyfinClient, user_id: str, **kwargs) -> None:
         super().__init__(*args, **kwargs)
+        self.__cancellation_scope = CancellationScope()
+        self.__item_store = ItemStore()
         self.set_client(client)
         self.set_user_id(user_id)
 
+    def get_cancellation_scope(self) -> CancellationScope:
+        """Get the scope of the browser's tasks, parent of its pages' scopes"""
+        return self.__cancellation_scope
+
+    def get_item_store(self) -> ItemStore:
+        """Get the store of the items seen in this browser, shared by its pages"""
+        return self.__item_store
+
     # client property
 
     __client: JellyfinClient
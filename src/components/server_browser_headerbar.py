@@ -3,6 +3,14 @@ from typing import Optional, Sequence
 from gi.repository import Adw, Gio, GLib, GObject, Gtk, Pango
 
 from src.components.widget_builder import Children, Handlers, Properties, build
+from src.library_filter import (
+    SORT_BY_DATE_ADDED,
+    SORT_BY_NAME,
+    SORT_BY_RATING,
+    SORT_BY_RUNTIME,
+    SORT_BY_YEAR,
+    LibraryFilter,
+)
 
 
 class ServerBrowserHeaderbar(Gtk.HeaderBar):
@@ -19,6 +27,12 @@ class ServerBrowserHeaderbar(Gtk.HeaderBar):
     __header_left_stack: Adw.ViewStack
     __title: Adw.WindowTitle
     __path_bar: Gtk.Label
+    __genres_menu: Gio.Menu
+    __official_ratings_menu: Gio.Menu
+    __tags_menu: Gio.Menu
+    __decades_menu: Gio.Menu
+
+    __filter_actions: Gio.SimpleActionGroup
 
     # TODO instead of having everything inside and having to toggle visibility
     # expose the properties and let the parent decide how to use them
@@ -99,17 +113,39 @@ class ServerBrowserHeaderbar(Gtk.HeaderBar):
             )
         )
 
+        sort_menu = Gio.Menu()
+        for key, label in (
+            (SORT_BY_NAME, _("Name")),
+            (SORT_BY_YEAR, _("Release Year")),
+            (SORT_BY_RATING, _("Community Rating")),
+            (SORT_BY_RUNTIME, _("Runtime")),
+            (SORT_BY_DATE_ADDED, _("Date Added")),
+        ):
+            sort_menu.append(label, f"filter.sort-by::{key}")
+        sort_order_section = Gio.Menu()
+        sort_order_section.append(_("Descending"), "filter.sort-descending")
+        sort_menu.append_section(None, sort_order_section)
+        filters_menu = Gio.Menu()
+        filters_menu.append(_("Unplayed Only"), "filter.unplayed-only")
+        self.__genres_menu = Gio.Menu()
+        self.__official_ratings_menu = Gio.Menu()
+        self.__tags_menu = Gio.Menu()
+        self.__decades_menu = Gio.Menu()
+
         filter_menu = Gio.Menu()
         filter_menu_section1 = Gio.Menu()
-        filter_menu_section1.append(_("Sort by"), None)
+        filter_menu_section1.append_submenu(_("Sort by"), sort_menu)
         filter_menu.append_section(None, filter_menu_section1)
         filter_menu_section2 = Gio.Menu()
-        filter_menu_section2.append(_("Filters"), None)
-        filter_menu_section2.append(_("Genres"), None)
-        filter_menu_section2.append(_("Age rating"), None)
-        filter_menu_section2.append(_("Tags"), None)
-        filter_menu_section2.append(_("Year"), None)
+        filter_menu_section2.append_submenu(_("Filters"), filters_menu)
+        filter_menu_section2.append_submenu(_("Genres"), self.__genres_menu)
+        filter_menu_section2.append_submenu(
+            _("Age rating"), self.__official_ratings_menu
+        )
+        filter_menu_section2.append_submenu(_("Tags"), self.__tags_menu)
+        filter_menu_section2.append_submenu(_("Year"), self.__decades_menu)
         filter_menu.append_section(None, filter_menu_section2)
+        self.set_filter_options()
 
         self.__filter_button = build(
             Gtk.MenuButton
@@ -151,8 +187,30 @@ class ServerBrowserHeaderbar(Gtk.HeaderBar):
         self.pack_end(packed_end)
         self.set_title_widget(self.__header_center_stack)
 
+    def __init_actions(self) -> None:
+        self.__filter_actions = Gio.SimpleActionGroup()
+        self.insert_action_group("filter", self.__filter_actions)
+        for name, state in (
+            ("sort-by", GLib.Variant.new_string(SORT_BY_NAME)),
+            ("sort-descending", GLib.Variant.new_boolean(False)),
+            ("unplayed-only", GLib.Variant.new_boolean(False)),
+            ("genre", GLib.Variant.new_string("")),
+            ("official-rating", GLib.Variant.new_string("")),
+            ("tag", GLib.Variant.new_string("")),
+            ("decade", GLib.Variant.new_string("")),
+        ):
+            parameter_type = None if state.is_of_type(GLib.VariantType("b")) else "s"
+            action = Gio.SimpleAction.new_stateful(
+                name,
+                None if parameter_type is None else GLib.VariantType(parameter_type),
+                state,
+            )
+            action.connect("change-state", self.__on_filter_action_changed)
+            self.__filter_actions.add_action(action)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.__init_actions()
         self.__init_widget()
 
     def __on_sidebar_show_clicked(self, *_args) -> None:
@@ -164,6 +222,67 @@ class ServerBrowserHeaderbar(Gtk.HeaderBar):
     def __on_back_clicked(self, *_args) -> None:
         self.activate_action("browser.navigate", GLib.Variant.new_string("back"))
 
+    def __get_filter_state(self, name: str) -> GLib.Variant:
+        return self.__filter_actions.get_action_state(name)
+
+    def __on_filter_action_changed(
+        self, action: Gio.SimpleAction, value: GLib.Variant
+    ) -> None:
+        action.set_state(value)
+        match action.get_name():
+            case "sort-by":
+                self.notify("sort-by")
+            case "sort-descending":
+                self.notify("sort-descending")
+            case _:
+                self.notify("library-filter")
+
+    @staticmethod
+    def __fill_options_menu(
+        menu: Gio.Menu, action_name: str, options: Sequence[tuple[str, str]]
+    ) -> None:
+        """Fill a filter submenu with an "Any" entry, then one entry per option"""
+        menu.remove_all()
+        for label, value in ((_("Any"), ""), *options):
+            item = Gio.MenuItem.new(label, None)
+            item.set_action_and_target_value(
+                f"filter.{action_name}", GLib.Variant.new_string(value)
+            )
+            menu.append_item(item)
+
+    def set_filter_options(
+        self,
+        genres: Sequence[str] = (),
+        official_ratings: Sequence[str] = (),
+        tags: Sequence[str] = (),
+        years: Sequence[int] = (),
+    ) -> None:
+        """
+        Set the values that the filter menu offers, eg. those of a library.
+        The selected values that aren't offered anymore are reset.
+        """
+        decades = sorted({year // 10 * 10 for year in years}, reverse=True)
+        for menu, action_name, options in (
+            (self.__genres_menu, "genre", [(genre, genre) for genre in genres]),
+            (
+                self.__official_ratings_menu,
+                "official-rating",
+                [(rating, rating) for rating in official_ratings],
+            ),
+            (self.__tags_menu, "tag", [(tag, tag) for tag in tags]),
+            (
+                self.__decades_menu,
+                "decade",
+                [(_("{decade}s").format(decade=d), str(d)) for d in decades],
+            ),
+        ):
+            self.__fill_options_menu(menu, action_name, options)
+            selected = self.__get_filter_state(action_name).get_string()
+            if selected and selected not in (value for _label, value in options):
+                self.__filter_actions.change_action_state(
+                    action_name, GLib.Variant.new_string("")
+                )
+
     def toggle_back_button(self, back_button_shown: bool = True) -> None:
         self.__header_left_stack.set_visible_child(
             self.__back_button if back_button_shown else self.__disconnect_button
@@ -233,6 +352,66 @@ class ServerBrowserHeaderbar(Gtk.HeaderBar):
     def set_search_button_visible(self, value: bool):
         self.set_property("search_button_visible", value)
 
+    # sort_by property
+
+    @GObject.Property(type=str, default=SORT_BY_NAME)
+    def sort_by(self) -> str:
+        return self.__get_filter_state("sort-by").get_string()
+
+    def get_sort_by(self) -> str:
+        return self.get_property("sort_by")
+
+    @sort_by.setter
+    def sort_by_setter(self, value: str) -> None:
+        self.__filter_actions.change_action_state(
+            "sort-by", GLib.Variant.new_string(value)
+        )
+
+    def set_sort_by(self, value: str):
+        self.set_property("sort_by", value)
+
+    # sort_descending property
+
+    @GObject.Property(type=bool, default=False)
+    def sort_descending(self) -> bool:
+        return self.__get_filter_state("sort-descending").get_boolean()
+
+    def get_sort_descending(self) -> bool:
+        return self.get_property("sort_descending")
+
+    @sort_descending.setter
+    def sort_descending_setter(self, value: bool) -> None:
+        self.__filter_actions.change_action_state(
+            "sort-descending", GLib.Variant.new_boolean(value)
+        )
+
+    def set_sort_descending(self, value: bool):
+        self.set_property("sort_descending", value)
+
+    # library_filter property (read only, set through the filter menu)
+
+    @GObject.Property(type=object, flags=GObject.ParamFlags.READABLE)
+    def library_filter(self) -> LibraryFilter:
+        def selected(name: str) -> frozenset[str]:
+            value = self.__get_filter_state(name).get_string()
+            return frozenset((value,)) if value else frozenset()
+
+        decade = self.__get_filter_state("decade").get_string()
+        return LibraryFilter(
+            genres=selected("genre"),
+            tags=selected("tag"),
+            official_ratings=selected("official-rating"),
+            years=(
+                frozenset(range(int(decade), int(decade) + 10))
+                if decade
+                else frozenset()
+            ),
+            unplayed_only=self.__get_filter_state("unplayed-only").get_boolean(),
+        )
+
+    def get_library_filter(self) -> LibraryFilter:
+        return self.get_property("library_filter")
+
     # ancestors property
 
     __ancestors: Optional[Sequence[tuple[str, str]]]
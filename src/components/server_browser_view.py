@@ -19,16 +19,11 @@
 
 import logging
 from http import HTTPStatus
-from typing import Callable, cast
+from typing import Any, Callable, Optional, cast
 from urllib.parse import parse_qsl, urlparse
 
 from gi.repository import Adw, Gio, GLib, GObject, Gtk, Pango
-from jellyfin_api_client.api.user import get_current_user
-from jellyfin_api_client.api.user_views import get_user_views
 from jellyfin_api_client.errors import UnexpectedStatus
-from jellyfin_api_client.models.base_item_dto import BaseItemDto
-from jellyfin_api_client.models.base_item_dto_query_result import BaseItemDtoQueryResult
-from jellyfin_api_client.types import UNSET
 
 from src import shared
 from src.components.disconnect_dialog import DisconnectDialog
@@ -36,7 +31,9 @@ from src.components.list_box_row import ListBoxRow
 from src.components.server_browser import ServerBrowser
 from src.components.server_browser_headerbar import ServerBrowserHeaderbar
 from src.components.server_home_page import ServerHomePage
+from src.components.server_library_page import ServerLibraryPage
 from src.components.server_page import ServerPage
+from src.components.server_search_page import ServerSearchPage
 from src.components.widget_builder import (
     Arguments,
     Children,
@@ -46,7 +43,9 @@ from src.components.widget_builder import (
     build,
 )
 from src.jellyfin import JellyfinClient
-from src.task import Task
+from src.library_sync import LibrarySync
+from src.stall_watchdog import watchdog
+from src.task import TaskPriority
 
 
 def _server_link_factory(
@@ -112,6 +111,8 @@ class ServerBrowserView(ServerBrowser):
     __libraries_list_box: Gtk.ListBox
     __navigation_view: Adw.NavigationView
     __search_bar: Gtk.SearchBar
+    __search_entry: Gtk.SearchEntry
+    __search_page: Optional[ServerSearchPage] = None
     __server_links: Gtk.ListBox
     __sidebar_hide_button_revealer: Gtk.Revealer
     __overlay_split_view: Adw.OverlaySplitView
@@ -120,17 +121,28 @@ class ServerBrowserView(ServerBrowser):
     __actions: Gio.SimpleActionGroup
     __search_action: Gio.PropertyAction
 
+    __library_sync: LibrarySync
+
     def __init_widget(self):
         self.__content_header_bar = build(ServerBrowserHeaderbar)
         self.__navigation_view = build(
             Adw.NavigationView
             + Handlers(**{"notify::visible-page": self.__on_page_changed})
         )
-        search_entry = build(Gtk.SearchEntry + Properties(placeholder_text=_("Search")))
+        self.__search_entry = build(
+            Gtk.SearchEntry
+            + Properties(placeholder_text=_("Search"))
+            + Handlers(
+                **{
+                    "search-changed": self.__on_search_changed,
+                    "stop-search": self.__on_search_stopped,
+                }
+            )
+        )
         self.__search_bar = build(
-            Gtk.SearchBar + Children(Adw.Clamp + Children(search_entry))
+            Gtk.SearchBar + Children(Adw.Clamp + Children(self.__search_entry))
         )
-        self.__search_bar.connect_entry(search_entry)
+        self.__search_bar.connect_entry(self.__search_entry)
         self.__libraries_list_box = build(
             Gtk.ListBox
             + Properties(
@@ -266,6 +278,9 @@ class ServerBrowserView(ServerBrowser):
 
     def __init__(self, *args, client: JellyfinClient, user_id: str, **kwargs):
         super().__init__(*args, client=client, user_id=user_id, **kwargs)
+        self.__library_sync = LibrarySync(
+            shared.library, shared.search_index, client, user_id
+        )
         self.__init_widget()
 
         # Actions
@@ -285,6 +300,7 @@ class ServerBrowserView(ServerBrowser):
 
         # Children signals
         self.connect("map", self.__on_mapped)
+        self.connect("unmap", self.__on_unmapped)
 
         # Navigate to the home page
         self.activate_action("browser.navigate", GLib.Variant.new_string("home"))
@@ -295,7 +311,7 @@ class ServerBrowserView(ServerBrowser):
         """Add a simple action and connect it to a callback with optional arguments"""
         variant_type = None if type_str is None else GLib.VariantType(type_str)
         action = Gio.SimpleAction.new(name, variant_type)
-        action.connect("activate", callback, *args)
+        action.connect("activate", watchdog.wrap(f"browser.{name}", callback), *args)
         self.__actions.add_action(action)
         return action
 
@@ -309,14 +325,25 @@ class ServerBrowserView(ServerBrowser):
     def __on_mapped(self, *_args) -> None:
         """Callback executed when this view is about to be shown"""
         shared.settings.update_connected_timestamp(address=self.client._base_url)
+        self.get_cancellation_scope().reset()
         self.__on_sidebar_toggled()
         self.__on_page_changed()
         self.__init_navigation_sidebar()
+        self.__sync_library()
+
+    def __on_unmapped(self, *_args) -> None:
+        """Callback executed when this view is hidden, cancels the pages' tasks too"""
+        self.get_cancellation_scope().cancel()
 
     def __init_navigation_sidebar(self) -> None:
         """Asynchronously initialize the navigation sidebar's content"""
 
+        # The API modules are imported in the worker threads, on first use
+        # pylint: disable=import-outside-toplevel
+
         def query_admin():
+            from jellyfin_api_client.api.user import get_current_user
+
             res = get_current_user.sync_detailed(client=self.client)
             if res.status_code == HTTPStatus.OK:
                 return res.parsed.policy.is_administrator  # type: ignore
@@ -326,15 +353,17 @@ class ServerBrowserView(ServerBrowser):
             logging.debug("Loaded user admin status: %s", str(is_admin))
             self.__admin_dashboard_link.set_visible(is_admin)
 
-        def query_libraries():
+        def query_libraries() -> list[dict[str, Any]]:
+            from jellyfin_api_client.api.user_views import get_user_views
+
             res = get_user_views.sync_detailed(client=self.client, user_id=self.user_id)
             if res.status_code == HTTPStatus.OK:
-                return res.parsed
+                return [item.to_dict() for item in res.parsed.items]  # type: ignore
             raise UnexpectedStatus(res.status_code, res.content)
 
-        def on_libraries_success(result: BaseItemDtoQueryResult) -> None:
+        def on_libraries_success(items: list[dict[str, Any]]) -> None:
             logging.debug("Loaded user libraries")
-            items: list[BaseItemDto] = result.items  # type: ignore
+            records = self.get_item_store().merge_all(items)
             default_icon = "library-unknown-symbolic"
             icon_map = {
                 "books": "library-books-symbolic",
@@ -343,30 +372,69 @@ class ServerBrowserView(ServerBrowser):
                 "movies": "library-movies-symbolic",
                 "music": "library-music-symbolic",
                 "tvshows": "library-shows-symbolic",
-                UNSET: "library-unknown-symbolic",
             }
             self.__libraries_list_box.remove_all()
-            for item in items:
+            for record in records:
                 logging.debug(
                     "Adding library %s (%s) to navigation",
-                    item.name,
-                    item.collection_type,
+                    record.name,
+                    record.collection_type,
                 )
                 library_link = _server_link_factory(
-                    icon_name=icon_map.get(item.collection_type, default_icon),
+                    icon_name=icon_map.get(record.collection_type, default_icon),
                     action_name="browser.navigate",
-                    action_target_string=f"library?id={item.id}",
-                    label=item.name,  # type: ignore
+                    action_target_string=f"library?library_id={record.item_id}",
+                    label=record.name,
                 )
                 self.__libraries_list_box.append(library_link)
             pass
 
+        group = self.client._base_url
+        scope = self.get_cancellation_scope()
         for task in (
-            Task(main=query_admin, callback=on_admin_success),
-            Task(main=query_libraries, callback=on_libraries_success),
+            scope.create_task(main=query_admin, callback=on_admin_success, group=group),
+            scope.create_task(
+                main=query_libraries, callback=on_libraries_success, group=group
+            ),
         ):
             task.run()
 
+    def __sync_library(self) -> None:
+        """Sync the local library and search index in the background"""
+
+        def on_error(error: Exception) -> None:
+            logging.warning("Couldn't sync the library", exc_info=error)
+
+        task = self.get_cancellation_scope().create_task(
+            main=self.__library_sync.sync,
+            error_callback=on_error,
+            priority=TaskPriority.PREFETCH,
+            group=self.client._base_url,
+        )
+        task.run()
+
+    def __on_search_changed(self, entry: Gtk.SearchEntry) -> None:
+        """Show the results of the search entry's text in the search page"""
+        query = entry.get_text().strip()
+        is_shown = (
+            self.__search_page is not None
+            and self.__navigation_view.get_visible_page() is self.__search_page
+        )
+        if not query:
+            if is_shown:
+                self.__navigation_view.pop()
+            return
+        if not is_shown:
+            self.__search_page = ServerSearchPage(
+                browser=self, headerbar=self.__content_header_bar
+            )
+            self.__navigation_view.push(self.__search_page)
+        cast(ServerSearchPage, self.__search_page).set_query(query)
+
+    def __on_search_stopped(self, entry: Gtk.SearchEntry) -> None:
+        entry.set_text("")
+        self.__search_bar.set_search_mode(False)
+
     __current_uri: str
 
     def __on_navigate(self, _widget, variant: GLib.Variant) -> None:
@@ -397,7 +465,7 @@ class ServerBrowserView(ServerBrowser):
             "home": ServerHomePage,
             "user-settings": None,  # TODO implement user settings page
             "admin-dashboard": None,  # TODO implement admin dashboard page
-            "library": None,  # TODO implement library page
+            "library": ServerLibraryPage,
         }
         try:
             klass = page_name_map[name]
@@ -416,6 +484,10 @@ class ServerBrowserView(ServerBrowser):
 
         # Update the view
         if page.get_is_root():
+            # Don't wait for the replaced pages' unmap to stop their work
+            for replaced in self.__navigation_view.get_navigation_stack():
+                if isinstance(replaced, ServerPage):
+                    replaced.get_cancellation_scope().cancel()
             self.__navigation_view.replace([page])
         else:
             self.__navigation_view.push(page)
@@ -473,6 +545,8 @@ class ServerBrowserView(ServerBrowser):
         """Disconnect from the server"""
         logging.debug("Logging off %s", self.client._base_url)
         shared.settings.unset_active_token()
+        self.get_cancellation_scope().cancel()
+        shared.clients.close_client(self.client)
         navigation = cast(Adw.NavigationView, self.get_parent())
         navigation.pop_to_tag("servers-view")
 
@@ -487,5 +561,12 @@ class ServerBrowserView(ServerBrowser):
             address=self.client._base_url,
             user_id=self.user_id,
         )
+        shared.settings.remove_user_items(
+            address=self.client._base_url,
+            user_id=self.user_id,
+        )
+        shared.snapshots.remove(address=self.client._base_url, user_id=self.user_id)
+        self.get_cancellation_scope().cancel()
+        shared.clients.close_client(self.client)
         navigation = cast(Adw.NavigationView, self.get_parent())
         navigation.pop_to_tag("servers-view")
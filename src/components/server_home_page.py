@@ -1,27 +1,30 @@
 import logging
 from http import HTTPStatus
-from typing import Sequence
+from typing import Any, Optional, Sequence, cast
 
-from gi.repository import Adw, GLib, Gtk
-from jellyfin_api_client.api.items import get_resume_items
-from jellyfin_api_client.api.tv_shows import get_next_up
-from jellyfin_api_client.api.user_library import get_latest_media
-from jellyfin_api_client.api.user_views import get_user_views
+from gi.repository import Adw, Gio, GLib, Gtk
 from jellyfin_api_client.errors import UnexpectedStatus
-from jellyfin_api_client.models.base_item_dto import BaseItemDto
-from jellyfin_api_client.models.image_type import ImageType
-from jellyfin_api_client.types import UNSET
 
-from src.components.item_card import POSTER, WIDE_SCREENSHOT, ItemCard
+from src import shared
+from src.components.item_card import (
+    POSTER,
+    PRIMARY_IMAGE_TYPE,
+    WIDE_SCREENSHOT,
+    ItemCard,
+)
+from src.components.list_store_item import ListStoreItem
 from src.components.loading_view import LoadingView
 from src.components.server_page import ServerPage
 from src.components.shelf import Shelf
 from src.components.widget_builder import Children, Properties, build
-from src.task import Task
+from src.item_store import ItemRecord
+from src.task import CancellationScope, TaskPriority
 
 # TODO make sure that the loading view stays up until
 # all the startup requests are done.
 
+SNAPSHOT_VERSION = 1
+
 
 class ServerHomePage(ServerPage):
     __gtype_name__ = "MarmaladeServerHomePage"
@@ -34,6 +37,8 @@ class ServerHomePage(ServerPage):
     __content_box: Gtk.Box
     __resume_shelf: Shelf
     __next_up_shelf: Shelf
+    __library_shelves: dict[str, Shelf]
+    __is_restored: bool = False
 
     def __init_widget(self) -> None:
         self.__next_up_shelf = build(
@@ -107,57 +112,259 @@ class ServerHomePage(ServerPage):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.__library_shelves = {}
         self.__init_widget()
+        for shelf in (self.__resume_shelf, self.__next_up_shelf):
+            self.__bind_shelf_model(shelf)
+
+    def __bind_shelf_model(self, shelf: Shelf) -> None:
+        """Bind a shelf to a model of ListStoreItem wrapping ItemRecord"""
+        shelf.bind_model(
+            Gio.ListStore.new(ListStoreItem),
+            self.__create_card,
+            self.__bind_card,
+            self.__load_card,
+        )
+
+    def __create_card(self) -> ItemCard:
+        return build(
+            ItemCard
+            + Properties(
+                image_type=PRIMARY_IMAGE_TYPE,
+                image_size=POSTER,
+            )
+        )
+
+    def __bind_card(self, card: ItemCard, list_item: ListStoreItem) -> None:
+        card.bind_record(list_item.value)
+        # TODO Properly handle the subtitle
+        # TODO Set the card action
+
+    def __load_card(self, card: ItemCard, is_urgent: bool) -> None:
+        card.load_image(
+            self.get_browser().get_client(),
+            scope=self.get_cancellation_scope(),
+            priority=(
+                TaskPriority.VISIBLE_IMAGE if is_urgent else TaskPriority.PREFETCH
+            ),
+        )
+
+    # Content methods
+
+    def __get_library_shelf(self, library: ItemRecord) -> Shelf:
+        """Get the shelf of a library, creating it if needed"""
+        title = _("Latest in {library}").format(library=library.name)
+        if (shelf := self.__library_shelves.get(library.item_id)) is not None:
+            shelf.set_title(title)
+            return shelf
+        shelf = build(Shelf + Properties(title=title, columns=6, lines=1))
+        self.__bind_shelf_model(shelf)
+        self.__content_box.append(shelf)
+        self.__library_shelves[library.item_id] = shelf
+        return shelf
+
+    def __set_libraries(self, libraries: Sequence[ItemRecord]) -> dict[str, Shelf]:
+        """
+        Make the library shelves match the libraries, in order.
+        Existing shelves are kept with their items.
+        """
+        shelves = {
+            library.item_id: self.__get_library_shelf(library) for library in libraries
+        }
+        for library_id in list(self.__library_shelves.keys()):
+            if library_id not in shelves:
+                self.__content_box.remove(self.__library_shelves.pop(library_id))
+        previous: Gtk.Widget = self.__next_up_shelf
+        for shelf in shelves.values():
+            self.__content_box.reorder_child_after(shelf, previous)
+            previous = shelf
+        return shelves
+
+    def __set_shelf_items(self, shelf: Shelf, items: Sequence[ItemRecord]) -> None:
+        """
+        Update a shelf's items, only replacing the range that changed.
+        Cards of the items still shown aren't rebound,
+        they follow the changes of their record on their own.
+        """
+        model = cast(Gio.ListStore, shelf.get_model())
+        old_keys = [
+            cast(ListStoreItem, model.get_item(i)).value.item_id
+            for i in range(model.get_n_items())
+        ]
+        new_keys = [item.item_id for item in items]
+        if old_keys == new_keys:
+            return
+        n_common = min(len(old_keys), len(new_keys))
+        prefix = 0
+        while prefix < n_common and old_keys[prefix] == new_keys[prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < n_common - prefix
+            and old_keys[-1 - suffix] == new_keys[-1 - suffix]
+        ):
+            suffix += 1
+        added = [ListStoreItem(item) for item in items[prefix : len(items) - suffix]]
+        model.splice(prefix, len(old_keys) - prefix - suffix, added)
+
+    # Snapshot methods
+
+    def __get_shelf_snapshot(self, shelf: Shelf) -> list[dict]:
+        model = cast(Gio.ListModel, shelf.get_model())
+        return [
+            cast(ListStoreItem, model.get_item(i)).value.to_dict()
+            for i in range(model.get_n_items())
+        ]
+
+    def __save_snapshot(self) -> None:
+        """Save the content of the page, to be shown instantly next time"""
+        browser = self.get_browser()
+        libraries = []
+        for library_id, shelf in self.__library_shelves.items():
+            libraries.append(
+                {
+                    "Id": library_id,
+                    "Title": shelf.get_title(),
+                    "Items": self.__get_shelf_snapshot(shelf),
+                }
+            )
+        content = {
+            "Version": SNAPSHOT_VERSION,
+            "Resume": self.__get_shelf_snapshot(self.__resume_shelf),
+            "NextUp": self.__get_shelf_snapshot(self.__next_up_shelf),
+            "Libraries": libraries,
+        }
+
+        def on_error(error: Exception) -> None:
+            logging.warning("Couldn't save the home page snapshot", exc_info=error)
+
+        # The content is gathered here, but serialized and written in a worker thread
+        task = self.get_cancellation_scope().create_task(
+            main=shared.snapshots.save,
+            main_args=(
+                browser.get_client()._base_url,
+                browser.get_user_id(),
+                "home",
+                content,
+            ),
+            error_callback=on_error,
+        )
+        task.run()
+
+    @staticmethod
+    def __read_snapshot(address: str, user_id: str) -> Optional[dict]:
+        """Read the last snapshot, or None if there is none. Called in a worker thread"""
+        content = shared.snapshots.load(address, user_id, "home")
+        if not isinstance(content, dict) or content.get("Version") != SNAPSHOT_VERSION:
+            return None
+        return content
+
+    def __restore_snapshot(self, content: dict) -> None:
+        """Show the content of a snapshot read by `__read_snapshot`"""
+        store = self.get_browser().get_item_store()
+        try:
+            for shelf, key in (
+                (self.__resume_shelf, "Resume"),
+                (self.__next_up_shelf, "NextUp"),
+            ):
+                self.__set_shelf_items(shelf, store.merge_all(content[key]))
+            for library in content["Libraries"]:
+                records = store.merge_all(library["Items"])
+                shelf = build(
+                    Shelf + Properties(title=library["Title"], columns=6, lines=1)
+                )
+                self.__bind_shelf_model(shelf)
+                self.__content_box.append(shelf)
+                self.__library_shelves[library["Id"]] = shelf
+                self.__set_shelf_items(shelf, records)
+        except (KeyError, TypeError, ValueError) as error:
+            logging.warning("Ignoring invalid home page snapshot", exc_info=error)
+            return
+        logging.debug("Restored home page snapshot")
 
     def load(self) -> None:
-        """Load the home page content"""
+        """
+        Load the home page content.
+
+        The last known content is shown first, if any,
+        then revalidated with the server and updated where it differs.
+        The API modules are imported in the worker threads, on first use.
+        Items are converted to dicts there too, then merged into the item store.
+        """
+
+        # pylint: disable=import-outside-toplevel
 
         browser = self.get_browser()
         user_id = browser.get_user_id()
         client = browser.get_client()
+        store = browser.get_item_store()
+        scope: CancellationScope = self.get_cancellation_scope()
+
+        # Number of queries left before the content is fully up to date
+        n_pending = 0
+        is_complete = True
+
+        def on_query_done() -> None:
+            nonlocal n_pending
+            n_pending -= 1
+            if n_pending == 0 and is_complete:
+                self.__save_snapshot()
 
-        def query_libraries() -> Sequence[BaseItemDto]:
+        def run_query(**kwargs) -> None:
+            nonlocal n_pending
+            n_pending += 1
+            task = scope.create_task(group=client._base_url, **kwargs)
+            task.run()
+
+        def query_libraries() -> list[dict[str, Any]]:
             """Query user libraries"""
             logging.debug("Querying libraries")
+            from jellyfin_api_client.api.user_views import get_user_views
+
             res = get_user_views.sync_detailed(client=client, user_id=user_id)  # type: ignore
             if res.status_code != HTTPStatus.OK:
                 raise UnexpectedStatus(res.status_code, res.content)
-            return res.parsed.items  # type: ignore
+            return [item.to_dict() for item in res.parsed.items]  # type: ignore
 
         def on_libraries_error(error: Exception) -> None:
+            nonlocal is_complete
+            is_complete = False
             logging.error("Error while loading user libraries", exc_info=error)
             toast = Adw.Toast(title=_("Could not load user libraries"))
             toast.set_timeout(0)
             toast.set_button_label(_("Reload Page"))
             toast.set_action_name("browser.reload")
             self.__toast_overlay.add_toast(toast)
+            on_query_done()
 
-        def on_libraries_success(items: Sequence[BaseItemDto]) -> None:
-            # Add the library shelves
-            logging.debug("Home libraries: %s", str([item.name for item in items]))
-            included_types = {"books", "movies", "music", "tvshows", UNSET}
-            for item in items:
-                if item.collection_type not in included_types:
-                    continue
-
-                # Create the shelf
-                title = _("Latest in {library}").format(library=item.name)
-                shelf = build(Shelf + Properties(title=title, columns=6, lines=1))
-                self.__content_box.append(shelf)
+        def on_libraries_success(items: list[dict[str, Any]]) -> None:
+            # Update the library shelves
+            records = store.merge_all(items)
+            logging.debug(
+                "Home libraries: %s", str([record.name for record in records])
+            )
+            included_types = {"books", "movies", "music", "tvshows", ""}
+            libraries = [
+                record for record in records if record.collection_type in included_types
+            ]
+            shelves = self.__set_libraries(libraries)
 
-                # Query shelf content in a task
-                task = Task(
+            # Query shelves content in tasks
+            for library_id, shelf in shelves.items():
+                run_query(
                     main=query_library_items,
-                    main_args=(item.id,),
+                    main_args=(library_id,),
                     callback=on_shelf_items_success,
                     callback_args=(shelf,),
                     error_callback=on_shelf_items_error,
                     error_callback_args=(shelf,),
                 )
-                task.run()
+            on_query_done()
 
-        def query_library_items(library_id: str) -> Sequence[BaseItemDto]:
+        def query_library_items(library_id: str) -> list[dict[str, Any]]:
             logging.debug("Querying items for library %s", library_id)
+            from jellyfin_api_client.api.user_library import get_latest_media
+
             res = get_latest_media.sync_detailed(
                 client=client,  # type: ignore
                 user_id=user_id,
@@ -165,29 +372,35 @@ class ServerHomePage(ServerPage):
             )
             if res.status_code != HTTPStatus.OK:
                 raise UnexpectedStatus(res.status_code, res.content)
-            return res.parsed  # type: ignore
+            return [item.to_dict() for item in res.parsed]  # type: ignore
 
-        def query_resume_items() -> Sequence[BaseItemDto]:
+        def query_resume_items() -> list[dict[str, Any]]:
             logging.debug("Querying resume items")
+            from jellyfin_api_client.api.items import get_resume_items
+
             res = get_resume_items.sync_detailed(
                 client=client,  # type: ignore
                 user_id=user_id,
             )
             if res.status_code != HTTPStatus.OK:
                 raise UnexpectedStatus(res.status_code, res.content)
-            return res.parsed.items  # type: ignore
+            return [item.to_dict() for item in res.parsed.items]  # type: ignore
 
-        def query_next_up_items() -> Sequence[BaseItemDto]:
+        def query_next_up_items() -> list[dict[str, Any]]:
             logging.debug("Querying next up items")
+            from jellyfin_api_client.api.tv_shows import get_next_up
+
             res = get_next_up.sync_detailed(
                 client=client,  # type: ignore
                 user_id=user_id,
             )
             if res.status_code != HTTPStatus.OK:
                 raise UnexpectedStatus(res.status_code, res.content)
-            return res.parsed.items  # type: ignore
+            return [item.to_dict() for item in res.parsed.items]  # type: ignore
 
         def on_shelf_items_error(shelf: Shelf, error: Exception) -> None:
+            nonlocal is_complete
+            is_complete = False
             logging.error("Couldn't get %s items", shelf.get_title(), exc_info=error)
             toast = Adw.Toast(title=_("Could not load shelf items"))
             toast.set_button_label(_("Details"))
@@ -196,49 +409,59 @@ class ServerHomePage(ServerPage):
                 GLib.Variant.new_strv([_("Shelf Items Error"), str(error)])
             )
             self.__toast_overlay.add_toast(toast)
-            self.__content_box.remove(shelf)
+            # Keep showing the last known items, only hide a shelf with none
+            if cast(Gio.ListModel, shelf.get_model()).get_n_items() == 0:
+                shelf.set_visible(False)
+            on_query_done()
 
-        def on_shelf_items_success(shelf: Shelf, result: Sequence[BaseItemDto]) -> None:
+        def on_shelf_items_success(shelf: Shelf, result: list[dict[str, Any]]) -> None:
             logging.debug('Shelf "%s": %d items', shelf.get_title(), len(result))
-            client = self.get_browser().get_client()
-            for item in result:
-                card = build(
-                    ItemCard
-                    + Properties(
-                        item_id=item.id,
-                        title=item.name,
-                        image_type=ImageType.PRIMARY,
-                        image_size=POSTER,
-                    )
-                )
-                shelf.append(card)
-                card.load_image(client)
-                # TODO Properly handle the subtitle
-                # TODO Set the card action
-
-        self.__view_stack.set_visible_child(self.__content_view)
+            self.__set_shelf_items(shelf, store.merge_all(result))
+            shelf.set_visible(True)
+            on_query_done()
 
-        # Spawn content query tasks
-        logging.debug("Spawning homepage loading tasks")
-        for task in (
-            Task(
+        def spawn_queries() -> None:
+            logging.debug("Spawning homepage loading tasks")
+            run_query(
                 main=query_libraries,
                 callback=on_libraries_success,
                 error_callback=on_libraries_error,
-            ),
-            Task(
+            )
+            run_query(
                 main=query_resume_items,
                 callback=on_shelf_items_success,
                 callback_args=(self.__resume_shelf,),
                 error_callback=on_shelf_items_error,
                 error_callback_args=(self.__resume_shelf,),
-            ),
-            Task(
+            )
+            run_query(
                 main=query_next_up_items,
                 callback=on_shelf_items_success,
                 callback_args=(self.__next_up_shelf,),
                 error_callback=on_shelf_items_error,
                 error_callback_args=(self.__next_up_shelf,),
-            ),
-        ):
-            task.run()
+            )
+
+        def on_snapshot_read(snapshot: Optional[dict]) -> None:
+            if snapshot is not None:
+                self.__restore_snapshot(snapshot)
+            spawn_queries()
+
+        def on_snapshot_error(error: Exception) -> None:
+            logging.warning("Couldn't read the home page snapshot", exc_info=error)
+            spawn_queries()
+
+        self.__view_stack.set_visible_child(self.__content_view)
+
+        # Show the last known content, then revalidate it
+        if self.__is_restored:
+            spawn_queries()
+            return
+        self.__is_restored = True
+        task = scope.create_task(
+            main=self.__read_snapshot,
+            main_args=(client._base_url, user_id),
+            callback=on_snapshot_read,
+            error_callback=on_snapshot_error,
+        )
+        task.run()
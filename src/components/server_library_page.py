@@ -0,0 +1,204 @@
+import logging
+import time
+from typing import Optional, Sequence, cast
+
+from gi.repository import Adw, Gtk
+
+from src import shared
+from src.components.item_card import POSTER, PRIMARY_IMAGE_TYPE, ItemCard
+from src.components.library_items_model import LibraryItemsModel
+from src.components.list_store_item import ListStoreItem
+from src.components.loading_view import LoadingView
+from src.components.server_page import ServerPage
+from src.components.widget_builder import Children, Handlers, Properties, build
+from src.database.library import LibraryItem
+from src.library_filter import LibraryColumns
+
+
+class ServerLibraryPage(ServerPage):
+    """
+    Page showing the items of a library, from the local library database.
+
+    - The items are synced in the background, see `src.library_sync.LibrarySync`
+    - Sorting and filtering through the headerbar's filter menu doesn't
+      touch the network, see `src.library_filter.LibraryColumns`
+    """
+
+    __gtype_name__ = "MarmaladeServerLibraryPage"
+
+    __view_stack: Adw.ViewStack
+    __loading_view: LoadingView
+    __empty_view: Adw.StatusPage
+    __error_view: Adw.StatusPage
+    __content_view: Gtk.ScrolledWindow
+    __grid_view: Gtk.GridView
+
+    __library_id: str
+    __model: LibraryItemsModel
+    __columns: Optional[LibraryColumns] = None
+    __headerbar_handlers: list[int]
+
+    def __init_widget(self) -> None:
+        factory = build(
+            Gtk.SignalListItemFactory
+            + Handlers(setup=self.__on_setup_card, bind=self.__on_bind_card)
+        )
+        self.__grid_view = build(
+            Gtk.GridView
+            + Properties(
+                model=Gtk.NoSelection.new(self.__model),
+                factory=factory,
+                max_columns=8,
+                margin_start=25,
+                margin_end=25,
+                margin_bottom=25,
+                margin_top=25,
+            )
+        )
+        self.__content_view = build(
+            Gtk.ScrolledWindow
+            + Properties(hscrollbar_policy=Gtk.PolicyType.NEVER)
+            + Children(self.__grid_view)
+        )
+        self.__loading_view = build(LoadingView)
+        self.__empty_view = build(
+            Adw.StatusPage
+            + Properties(
+                title=_("No Items"),
+                description=_(
+                    "The library may still be syncing, try reloading in a moment"
+                ),
+                icon_name="folder-symbolic",
+            )
+        )
+        self.__error_view = build(
+            Adw.StatusPage
+            + Properties(
+                title=_("Error"),
+                description=_("An error occurred while reading the library"),
+                icon_name="dialog-error-symbolic",
+            )
+        )
+        self.__view_stack = build(
+            Adw.ViewStack
+            + Children(
+                self.__loading_view,
+                self.__empty_view,
+                self.__error_view,
+                self.__content_view,
+            )
+        )
+        self.set_is_root(True)
+        self.set_is_filterable(True)
+        self.set_child(self.__view_stack)
+
+    def __init__(self, *args, library_id: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__library_id = library_id
+        self.__headerbar_handlers = []
+        self.__model = LibraryItemsModel(self.get_browser().get_item_store())
+        self.__init_widget()
+        record = self.get_browser().get_item_store().get(library_id)
+        self.set_title(_("Library") if record is None else record.name)
+        self.connect("map", self.__on_mapped)
+        self.connect("unmap", self.__on_unmapped)
+
+    # Cards
+
+    def __on_setup_card(self, _factory, list_item: Gtk.ListItem) -> None:
+        list_item.set_child(
+            build(
+                ItemCard
+                + Properties(
+                    image_type=PRIMARY_IMAGE_TYPE,
+                    image_size=POSTER,
+                )
+            )
+        )
+
+    def __on_bind_card(self, _factory, list_item: Gtk.ListItem) -> None:
+        card = cast(ItemCard, list_item.get_child())
+        card.bind_record(cast(ListStoreItem, list_item.get_item()).value)
+        card.load_image(
+            self.get_browser().get_client(),
+            scope=self.get_cancellation_scope(),
+        )
+
+    # Filtering
+
+    def __on_mapped(self, *_args) -> None:
+        headerbar = self.get_headerbar()
+        self.__headerbar_handlers = [
+            headerbar.connect(f"notify::{name}", self.__on_filter_changed)
+            for name in ("sort-by", "sort-descending", "library-filter")
+        ]
+        self.__update_filter_options()
+
+    def __on_unmapped(self, *_args) -> None:
+        headerbar = self.get_headerbar()
+        for handler in self.__headerbar_handlers:
+            headerbar.disconnect(handler)
+        self.__headerbar_handlers = []
+
+    def __update_filter_options(self) -> None:
+        if self.__columns is None:
+            return
+        self.get_headerbar().set_filter_options(
+            genres=self.__columns.get_genres(),
+            official_ratings=self.__columns.get_official_ratings(),
+            tags=self.__columns.get_tags(),
+            years=self.__columns.get_years(),
+        )
+
+    def __on_filter_changed(self, *_args) -> None:
+        if self.__columns is None:
+            return
+        headerbar = self.get_headerbar()
+        start = time.perf_counter()
+        order = self.__columns.query(
+            headerbar.get_sort_by(),
+            headerbar.get_sort_descending(),
+            headerbar.get_library_filter(),
+        )
+        self.__model.set_order(order)
+        logging.debug(
+            "Filtered %d/%d library items in %.1f ms",
+            len(order),
+            len(self.__columns),
+            (time.perf_counter() - start) * 1000,
+        )
+
+    # Loading
+
+    def __read_library(self) -> tuple[list[LibraryItem], LibraryColumns]:
+        browser = self.get_browser()
+        items = shared.library.get_items(
+            browser.get_client()._base_url, browser.get_user_id(), self.__library_id
+        )
+        return items, LibraryColumns(items)
+
+    def __on_library_read(
+        self, result: tuple[Sequence[LibraryItem], LibraryColumns]
+    ) -> None:
+        items, columns = result
+        if not items:
+            self.__view_stack.set_visible_child(self.__empty_view)
+            return
+        self.__columns = columns
+        self.__update_filter_options()
+        self.__model.set_items(items, ())
+        self.__on_filter_changed()
+        self.__view_stack.set_visible_child(self.__content_view)
+
+    def __on_library_error(self, error: Exception) -> None:
+        logging.error("Couldn't read library %s", self.__library_id, exc_info=error)
+        self.__view_stack.set_visible_child(self.__error_view)
+
+    def load(self) -> None:
+        self.__view_stack.set_visible_child(self.__loading_view)
+        task = self.get_cancellation_scope().create_task(
+            main=self.__read_library,
+            callback=self.__on_library_read,
+            error_callback=self.__on_library_error,
+        )
+        task.run()
@@ -5,6 +5,7 @@ from gi.repository import Adw, GLib, GObject
 
 from src.components.server_browser import ServerBrowser
 from src.components.server_browser_headerbar import ServerBrowserHeaderbar
+from src.task import CancellationScope
 
 
 class ServerPage(Adw.NavigationPage):
@@ -86,6 +87,18 @@ class ServerPage(Adw.NavigationPage):
 
     # Protected methods
 
+    __cancellation_scope: CancellationScope
+    __is_interrupted: bool = False
+
+    def get_cancellation_scope(self) -> CancellationScope:
+        """
+        Get the scope that the page's tasks must be created in.
+        It is cancelled when the page is unmapped while its tasks are pending
+        (the page is then reloaded when shown again), or when the browser's scope is,
+        and reset before the page is shown again.
+        """
+        return self.__cancellation_scope
+
     def _run_in_main_loop(self, func: Callable, *args, **kwargs) -> None:
         """Run a function with args and kwargs in the main loop"""
         partial_func = partial(func, *args, **kwargs)
@@ -103,6 +116,33 @@ class ServerPage(Adw.NavigationPage):
         super().__init__(*args, **kwargs)
         self.set_browser(browser)
         self.set_headerbar(headerbar)
+        self.__cancellation_scope = CancellationScope(
+            parent=browser.get_cancellation_scope()
+        )
+        self.connect("map", self.__on_mapped)
+        self.connect("unmap", self.__on_unmapped)
+
+    def do_map(self) -> None:
+        # Reset before the children are mapped, they may start tasks in the scope
+        if self.__cancellation_scope.is_cancelled():
+            self.__cancellation_scope.reset()
+        Adw.NavigationPage.do_map(self)
+
+    def __on_mapped(self, *_args) -> None:
+        # The loading was interrupted while hidden, start over
+        if self.__is_interrupted:
+            self.__is_interrupted = False
+            self.load()
+
+    def __on_unmapped(self, *_args) -> None:
+        # Stop loading while hidden, content that is already loaded is kept
+        if not self.__cancellation_scope.has_pending_tasks():
+            return
+        self.__cancellation_scope.cancel()
+        self.__is_interrupted = True
 
     def load(self) -> None:
-        """Load the page content"""
+        """
+        Load the page content.
+        May be called again to restart a loading that got cancelled.
+        """
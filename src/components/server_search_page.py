@@ -0,0 +1,237 @@
+import logging
+from typing import Any, cast
+
+from gi.repository import Adw, Gio, GLib, Gtk
+
+from src import shared
+from src.components.item_card import POSTER, PRIMARY_IMAGE_TYPE, ItemCard
+from src.components.list_store_item import ListStoreItem
+from src.components.server_page import ServerPage
+from src.components.shelf import Shelf
+from src.components.widget_builder import Children, Properties, build
+from src.database.search_index import SearchItem
+from src.item_store import ItemRecord
+from src.search import get_item_dict, search_remote
+from src.task import CancellationScope, TaskPriority
+
+LOCAL_SEARCH_LIMIT = 60
+REMOTE_SEARCH_LIMIT = 30
+
+# The server is only searched when the local index finds fewer results
+REMOTE_SEARCH_MIN_RESULTS = 6
+# Time without typing before the server is searched
+REMOTE_SEARCH_DELAY_MS = 500
+
+
+class ServerSearchPage(ServerPage):
+    """
+    Page showing the results of the browser's search bar.
+
+    - Results come from the local search index first, as the user types
+    - When the index has few results (eg. it is still syncing),
+      the server is searched once the user stops typing
+    - Changing the query cancels the searches of the previous one
+    """
+
+    __gtype_name__ = "MarmaladeServerSearchPage"
+
+    __view_stack: Adw.ViewStack
+    __empty_view: Adw.StatusPage
+    __results_view: Gtk.ScrolledWindow
+    __results_shelf: Shelf
+
+    __query: str = ""
+    __query_scope: CancellationScope
+    __remote_source_id: int = 0
+
+    def __init_widget(self) -> None:
+        self.__results_shelf = build(
+            Shelf + Properties(title=_("Results"), columns=6, lines=3)
+        )
+        self.__results_shelf.bind_model(
+            Gio.ListStore.new(ListStoreItem),
+            self.__create_card,
+            self.__bind_card,
+            self.__load_card,
+        )
+        self.__results_view = build(
+            Gtk.ScrolledWindow
+            + Children(
+                Adw.Clamp
+                + Properties(maximum_size=1240)
+                + Children(
+                    Gtk.Box
+                    + Properties(
+                        orientation=Gtk.Orientation.VERTICAL,
+                        margin_start=25,
+                        margin_end=25,
+                        margin_bottom=25,
+                        margin_top=25,
+                    )
+                    + Children(self.__results_shelf)
+                )
+            )
+        )
+        self.__empty_view = build(
+            Adw.StatusPage
+            + Properties(
+                title=_("No Results"),
+                icon_name="system-search-symbolic",
+            )
+        )
+        self.__view_stack = build(
+            Adw.ViewStack + Children(self.__empty_view, self.__results_view)
+        )
+        self.set_title(_("Search"))
+        self.set_child(self.__view_stack)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__query_scope = CancellationScope(parent=self.get_cancellation_scope())
+        self.__init_widget()
+
+    def __create_card(self) -> ItemCard:
+        return build(
+            ItemCard
+            + Properties(
+                image_type=PRIMARY_IMAGE_TYPE,
+                image_size=POSTER,
+            )
+        )
+
+    def __bind_card(self, card: ItemCard, list_item: ListStoreItem) -> None:
+        card.bind_record(list_item.value)
+
+    def __load_card(self, card: ItemCard, is_urgent: bool) -> None:
+        card.load_image(
+            self.get_browser().get_client(),
+            scope=self.__query_scope,
+            priority=(
+                TaskPriority.VISIBLE_IMAGE if is_urgent else TaskPriority.PREFETCH
+            ),
+        )
+
+    def __set_results(self, records: list[ItemRecord]) -> None:
+        """
+        Show the results, in order.
+        The records already shown keep their wrapper, so that the shelf
+        doesn't rebind their cards (and load their images again).
+        """
+        model = cast(Gio.ListStore, self.__results_shelf.get_model())
+        old_items = [
+            cast(ListStoreItem, model.get_item(i)) for i in range(model.get_n_items())
+        ]
+        wrappers = {id(item.value): item for item in old_items}
+        new_items = [wrappers.get(id(r)) or ListStoreItem(r) for r in records]
+        if len(new_items) != len(old_items) or any(
+            a is not b for a, b in zip(new_items, old_items)
+        ):
+            model.splice(0, len(old_items), new_items)
+        self.__view_stack.set_visible_child(
+            self.__results_view if records else self.__empty_view
+        )
+
+    def __get_results(self) -> list[ItemRecord]:
+        model = cast(Gio.ListModel, self.__results_shelf.get_model())
+        return [
+            cast(ListStoreItem, model.get_item(i)).value
+            for i in range(model.get_n_items())
+        ]
+
+    def __cancel_remote_search(self) -> None:
+        if self.__remote_source_id:
+            GLib.source_remove(self.__remote_source_id)
+            self.__remote_source_id = 0
+
+    # Local search
+
+    def __search_local(self, query: str) -> None:
+        browser = self.get_browser()
+        task = self.__query_scope.create_task(
+            main=shared.search_index.search,
+            main_args=(
+                browser.get_client()._base_url,
+                browser.get_user_id(),
+                query,
+                LOCAL_SEARCH_LIMIT,
+            ),
+            callback=self.__on_local_results,
+            callback_args=(query,),
+            error_callback=self.__on_local_error,
+            error_callback_args=(query,),
+        )
+        task.run()
+
+    def __on_local_results(self, query: str, items: list[SearchItem]) -> None:
+        if query != self.__query:
+            return
+        # Records already in the store come from the server, they're more recent
+        store = self.get_browser().get_item_store()
+        records = [
+            store.get(item.item_id) or store.merge(get_item_dict(item))
+            for item in items
+        ]
+        self.__set_results(records)
+        if len(records) < REMOTE_SEARCH_MIN_RESULTS:
+            self.__remote_source_id = GLib.timeout_add(
+                REMOTE_SEARCH_DELAY_MS, self.__on_remote_search_timeout, query
+            )
+
+    def __on_local_error(self, query: str, error: Exception) -> None:
+        logging.error("Local search failed", exc_info=error)
+        if query == self.__query:
+            self.__on_remote_search_timeout(query)
+
+    # Remote search
+
+    def __on_remote_search_timeout(self, query: str) -> bool:
+        self.__remote_source_id = 0
+        browser = self.get_browser()
+        client = browser.get_client()
+        task = self.__query_scope.create_task(
+            main=search_remote,
+            main_args=(client, browser.get_user_id(), query, REMOTE_SEARCH_LIMIT),
+            callback=self.__on_remote_results,
+            callback_args=(query,),
+            error_callback=self.__on_remote_error,
+            group=client._base_url,
+        )
+        task.run()
+        return GLib.SOURCE_REMOVE
+
+    def __on_remote_results(self, query: str, items: list[dict[str, Any]]) -> None:
+        if query != self.__query:
+            return
+        logging.debug('Server search for "%s": %d items', query, len(items))
+        records = self.__get_results()
+        known_ids = {record.item_id for record in records}
+        store = self.get_browser().get_item_store()
+        for record in store.merge_all(items):
+            if record.item_id not in known_ids:
+                records.append(record)
+        self.__set_results(records)
+
+    def __on_remote_error(self, error: Exception) -> None:
+        logging.error("Server search failed", exc_info=error)
+
+    # Public methods
+
+    def get_query(self) -> str:
+        return self.__query
+
+    def set_query(self, query: str) -> None:
+        """Search for a text, cancelling the previous search"""
+        query = query.strip()
+        if query == self.__query:
+            return
+        self.__query = query
+        self.load()
+
+    def load(self) -> None:
+        self.__cancel_remote_search()
+        self.__query_scope.cancel()
+        self.__query_scope.reset()
+        if not self.__query:
+            self.__set_results([])
+            return
+        self.__search_local(self.__query)
@@ -35,7 +35,6 @@ from src.components.widget_builder import (
     build,
 )
 from src.database.api import ServerInfo
-from src.jellyfin import JellyfinClient
 
 
 class ServersListView(Adw.NavigationPage):
@@ -288,7 +287,7 @@ class ServersListView(Adw.NavigationPage):
     def __on_authenticated(self, _widget, address: str, user_id: str) -> None:
         shared.settings.set_active_token(address=address, user_id=user_id)
         info = shared.settings.get_token(address=address, user_id=user_id)
-        client = JellyfinClient(address, device_id=info.device_id, token=info.token)  # type: ignore
+        client = shared.clients.get(address, device_id=info.device_id, token=info.token)  # type: ignore
         server_home_view = ServerBrowserView(client=client, user_id=user_id)
         navigation = cast(Adw.NavigationView, self.get_parent())
         navigation.push(server_home_view)
@@ -1,6 +1,7 @@
-from typing import cast
+from math import ceil
+from typing import Callable, Iterable, Optional, cast
 
-from gi.repository import Adw, GObject, Gtk
+from gi.repository import Adw, Gio, GObject, Gtk
 
 from src.components.shelf_page import ShelfPage
 from src.components.widget_builder import Children, Handlers, Properties, build
@@ -9,8 +10,21 @@ from src.components.widget_builder import Children, Handlers, Properties, build
 class TypeOverrideError(Exception):
     """Error raised when overriding a shelf's item type"""
 
+
+class ModelBoundError(Exception):
+    """Error raised when changing the widgets of a shelf bound to a model"""
+
+
 class Shelf(Gtk.Box):
-    """A paginated item shelf with items of the same type"""
+    """
+    A paginated item shelf with items of the same type
+
+    Items are either widgets added with `append`,
+    or the items of a list model given to `bind_model`.
+    In the latter case, widgets only exist for the visible page and its neighbours,
+    and are recycled as the user navigates.
+    Their content (eg. images) is only loaded for the visible page and the next one.
+    """
 
     __gtype_name__ = "MarmaladeShelf"
 
@@ -54,7 +68,7 @@ class Shelf(Gtk.Box):
             Adw.Carousel
             + Handlers(
                 **{
-                    "page-changed": self.__update_navigation_controls,
+                    "page-changed": self.__on_page_changed,
                     "notify::n-pages": self.__on_n_pages_changed,
                 }
             )
@@ -201,6 +215,7 @@ class Shelf(Gtk.Box):
         """Create a new Shelf widget"""
         super().__init__()
         self.__init_widget()
+        self.connect("map", self.__on_mapped)
 
         self.__update_navigation_controls()
         self.__update_visible_stack_page()
@@ -213,6 +228,11 @@ class Shelf(Gtk.Box):
     def __on_next_button_clicked(self, _button) -> None:
         self._shift_carousel(1)
 
+    def __on_page_changed(self, *_args) -> None:
+        self.__update_navigation_controls()
+        if self.__model is not None:
+            self.__update_model_pages()
+
     def __on_n_pages_changed(self, _carousel, _value) -> None:
         self.__update_navigation_controls()
         self.__update_visible_stack_page()
@@ -260,16 +280,37 @@ class Shelf(Gtk.Box):
         Append an item to the shelf.
         Before appending, adds a page if none exists or the last one is full.
         """
+        if self.__model is not None:
+            raise ModelBoundError()
         if (self._get_n_pages() == 0) or (self._get_nth_page(-1).is_full):
             self.__create_page()
         page = self._get_nth_page(-1)
         page.append(widget)
 
+    def extend(self, widgets: Iterable[Gtk.Widget]) -> None:
+        """
+        Append items to the shelf.
+        Each page receives its share of the widgets in a single model change.
+        """
+        if self.__model is not None:
+            raise ModelBoundError()
+        widgets = list(widgets)
+        page_size = self.__get_page_size()
+        while widgets:
+            if (self._get_n_pages() == 0) or (self._get_nth_page(-1).is_full):
+                self.__create_page()
+            page = self._get_nth_page(-1)
+            n_free = page_size - len(page)
+            page.extend(widgets[:n_free])
+            del widgets[:n_free]
+
     def pop(self) -> Gtk.Widget:
         """
         Pop the last shelf widget.
         Removes the widget's page if empty after popping.
         """
+        if self.__model is not None:
+            raise ModelBoundError()
         if self._get_n_pages() == 0:
             raise IndexError()
         widget = (page := self._get_nth_page(-1)).pop()
@@ -277,17 +318,177 @@ class Shelf(Gtk.Box):
             self.__carousel_view.remove(page)
         return widget
 
+    def remove_all(self) -> None:
+        """Remove all the shelf widgets"""
+        if self.__model is not None:
+            raise ModelBoundError()
+        self.__remove_pages()
+
+    def __remove_pages(self) -> None:
+        while self._get_n_pages() > 0:
+            self.__carousel_view.remove(self._get_nth_page(-1))
+
+    def __get_page_size(self) -> int:
+        return max(1, self.get_lines() * self.get_columns())
+
     def _reflow_items(self) -> None:
         """
         Reflow the items in the different pages.
         Called when lines or columns changes to leave no gap and have no page overflow.
+
+        Only the items crossing a page boundary are moved, pages are kept
+        and only the trailing ones left empty are removed.
         """
-        widgets = []
-        while self._get_n_pages() > 0:
-            widgets.append(self.pop())
-        widgets.reverse()
-        for widget in widgets:
-            self.append(widget)
+        if self.__model is not None:
+            self.__update_model_pages()
+            return
+        page_size = self.__get_page_size()
+        index = 0
+        while index < (n_pages := self._get_n_pages()):
+            page = self._get_nth_page(index)
+            n_items = len(page)
+            if n_items > page_size:
+                # Push the overflow to the start of the next page
+                overflow = page.take(page_size, n_items - page_size)
+                if index == n_pages - 1:
+                    self.__create_page()
+                self._get_nth_page(index + 1).insert(0, overflow)
+            elif n_items < page_size and index < n_pages - 1:
+                # Pull the missing items from the start of the next page
+                next_page = self._get_nth_page(index + 1)
+                n_moved = min(page_size - n_items, len(next_page))
+                page.extend(next_page.take(0, n_moved))
+                if len(next_page) == 0:
+                    self.__carousel_view.remove(next_page)
+                    continue
+            index += 1
+
+    # Model binding methods
+
+    __model: Optional[Gio.ListModel] = None
+    __model_handler: int = 0
+    __create_widget_func: Callable[[], Gtk.Widget]
+    __bind_widget_func: Callable[[Gtk.Widget, GObject.Object], None]
+    __load_widget_func: Optional[Callable[[Gtk.Widget, bool], None]]
+    __page_items: dict[ShelfPage, list[GObject.Object]]
+    __page_widgets: dict[ShelfPage, list[Gtk.Widget]]
+    __page_loads: dict[ShelfPage, bool]
+    __recycled_widgets: list[Gtk.Widget]
+
+    def get_model(self) -> Optional[Gio.ListModel]:
+        return self.__model
+
+    def bind_model(
+        self,
+        model: Optional[Gio.ListModel],
+        create_widget_func: Callable[[], Gtk.Widget],
+        bind_widget_func: Callable[[Gtk.Widget, GObject.Object], None],
+        load_widget_func: Optional[Callable[[Gtk.Widget, bool], None]] = None,
+    ) -> None:
+        """
+        Bind the shelf to a list model, removing its current widgets.
+
+        - `create_widget_func` creates an unbound widget
+        - `bind_widget_func` sets up a widget (new or recycled) to show a model item
+        - `load_widget_func` loads a bound widget's content (eg. its image) once
+          its page gets near, with whether the page is the visible one (urgent)
+          or the next one (may be prefetched). It may be called again for the
+          same binding, when the next page becomes the visible one or when the
+          shelf is shown again.
+        - Pass a `None` model to unbind
+        """
+        if self.__model is not None:
+            self.__model.disconnect(self.__model_handler)
+            self.__model = None
+        self.__remove_pages()
+        self.__page_items = {}
+        self.__page_widgets = {}
+        self.__page_loads = {}
+        self.__recycled_widgets = []
+        if model is None:
+            return
+        self.__model = model
+        self.__create_widget_func = create_widget_func
+        self.__bind_widget_func = bind_widget_func
+        self.__load_widget_func = load_widget_func
+        self.__model_handler = model.connect("items-changed", self.__on_items_changed)
+        self.__update_model_pages()
+
+    def __on_items_changed(self, *_args) -> None:
+        self.__update_model_pages()
+
+    def __on_mapped(self, *_args) -> None:
+        # The widgets may have dropped their unfinished loads while hidden
+        if self.__model is not None:
+            self.__page_loads.clear()
+            self.__update_model_pages()
+
+    def __release_page_widgets(self, page: ShelfPage) -> None:
+        """Remove the widgets of a page, keeping them for later reuse"""
+        self.__recycled_widgets.extend(page.take(0, len(page)))
+        self.__page_items.pop(page, None)
+        self.__page_widgets.pop(page, None)
+        self.__page_loads.pop(page, None)
+
+    def __update_model_pages(self) -> None:
+        """
+        Match the carousel pages with the model items.
+        Only the current page and its neighbours hold widgets.
+        """
+        model = cast(Gio.ListModel, self.__model)
+        n_items = model.get_n_items()
+        page_size = self.__get_page_size()
+        n_pages = ceil(n_items / page_size)
+
+        # Add or remove (empty) pages
+        while self._get_n_pages() > n_pages:
+            page = self._get_nth_page(-1)
+            self.__release_page_widgets(page)
+            self.__carousel_view.remove(page)
+        while self._get_n_pages() < n_pages:
+            self.__create_page()
+
+        # Release the pages away from the current one, then populate its neighbours
+        current = round(self.__carousel_view.get_position())
+        window = range(max(0, current - 1), min(n_pages, current + 2))
+        for index in range(n_pages):
+            if index not in window:
+                self.__release_page_widgets(self._get_nth_page(index))
+        for index in window:
+            page = self._get_nth_page(index)
+            start = index * page_size
+            stop = min(start + page_size, n_items)
+            items = [model.get_item(position) for position in range(start, stop)]
+            bound = self.__page_items.get(page, [])
+            if len(bound) == len(items) and all(a is b for a, b in zip(bound, items)):
+                continue
+            self.__release_page_widgets(page)
+            widgets = []
+            for item in items:
+                if self.__recycled_widgets:
+                    widget = self.__recycled_widgets.pop()
+                else:
+                    widget = self.__create_widget_func()
+                self.__bind_widget_func(widget, item)
+                widgets.append(widget)
+            page.extend(widgets)
+            self.__page_items[page] = items
+            self.__page_widgets[page] = widgets
+
+        # Load the content of the visible page, then the next one
+        if self.__load_widget_func is not None:
+            for index in range(current, min(n_pages, current + 2)):
+                page = self._get_nth_page(index)
+                is_urgent = index == current
+                if self.__page_loads.get(page) in (True, is_urgent):
+                    # Already loaded, as urgently
+                    continue
+                for widget in self.__page_widgets.get(page, []):
+                    self.__load_widget_func(widget, is_urgent)
+                self.__page_loads[page] = is_urgent
+
+        # Cap the spare widgets to what a page swap may need
+        del self.__recycled_widgets[page_size:]
 
 
 # This line is necessary to register as the css element "shelf"
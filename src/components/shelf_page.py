@@ -1,4 +1,4 @@
-from typing import cast
+from typing import Iterable, cast
 
 from gi.repository import Gio, GObject, Gtk
 
@@ -8,7 +8,7 @@ from src.components.list_store_item import ListStoreItem
 class ShelfPage(Gtk.FlowBox):
     __gtype_name__ = "MarmaladeShelfPage"
 
-    __model: Gio.ListStore
+    __model: Gio.ListStore = None
 
     def __init_widget(self):
         self.set_selection_mode(Gtk.SelectionMode.NONE)
@@ -41,7 +41,7 @@ class ShelfPage(Gtk.FlowBox):
 
     # columns property
 
-    __columns: int
+    __columns: int = 0
 
     @GObject.Property(type=int)
     def columns(self) -> int:
@@ -53,6 +53,7 @@ class ShelfPage(Gtk.FlowBox):
     @columns.setter
     def columns_setter(self, value: int) -> None:
         self.__columns = value
+        self.__update_children_per_line()
 
     def set_columns(self, value: int):
         self.set_property("columns", value)
@@ -63,7 +64,12 @@ class ShelfPage(Gtk.FlowBox):
         return item.value
 
     def __on_model_items_changed(self, *args):
-        page_columns = min(self.get_columns(), self.__model.get_n_items())
+        self.__update_children_per_line()
+
+    def __update_children_per_line(self) -> None:
+        if self.__model is None:
+            return
+        page_columns = min(self.__columns, self.__model.get_n_items())
         self.set_max_children_per_line(page_columns)
         self.set_min_children_per_line(page_columns)
 
@@ -92,6 +98,24 @@ class ShelfPage(Gtk.FlowBox):
         self.__model.remove(index)
         return item.value
 
+    def insert(self, position: int, widgets: Iterable[Gtk.Widget]) -> None:
+        """Insert widgets at a position of the page, in a single model change"""
+        wrappers = [ListStoreItem(widget) for widget in widgets]
+        self.__model.splice(position, 0, wrappers)
+
+    def extend(self, widgets: Iterable[Gtk.Widget]) -> None:
+        """Append widgets to the page, in a single model change"""
+        self.insert(len(self), widgets)
+
+    def take(self, position: int, n: int) -> list[Gtk.Widget]:
+        """Remove `n` widgets from a position of the page, and return them"""
+        items = [
+            cast(ListStoreItem, self.__model.get_item(index)).value
+            for index in range(position, position + n)
+        ]
+        self.__model.splice(position, n, [])
+        return items
+
     @property
     def is_full(self) -> bool:
         return len(self) >= self.get_lines() * self.get_columns()
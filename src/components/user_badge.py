@@ -1,15 +1,18 @@
 import logging
 from http import HTTPStatus
-from pathlib import Path
 
-from gi.repository import Adw, GObject, Gtk
+from gi.repository import Adw, Gdk, GObject, Gtk
 from jellyfin_api_client.errors import UnexpectedStatus
 
 from src import shared
 from src.components.widget_builder import Children, Handlers, Properties, build
 from src.database.api import ServerInfo, UserInfo
-from src.jellyfin import JellyfinClient
-from src.task import Task
+from src.image_cache import ImageKey
+from src.image_format import get_image_format, get_image_params
+from src.task import TaskPriority
+
+# Value of ImageType.PRIMARY, not imported since that loads every API model
+PRIMARY_IMAGE_TYPE = "Primary"
 
 
 class ImageDownloadError(UnexpectedStatus):
@@ -27,8 +30,6 @@ class UserBadge(Adw.Bin):
     __avatar: Adw.Avatar
     __label: Gtk.Label
 
-    __image_dir: Path
-    __image_path: Path
     __image_size: int
 
     __server: ServerInfo
@@ -83,42 +84,51 @@ class UserBadge(Adw.Bin):
 
         self.__server = server
         self.__user = user
-        self.__image_dir = (
-            shared.app_cache_dir
-            / "servers"
-            / self.__server.server_id
-            / "users"
-            / self.__user.user_id
-            / "images"
-        )
-        self.__image_path = self.__image_dir / "profile.png"
         self.__image_size = self.__avatar.get_size()
         self.__label.set_label(user.name)
         self.__avatar.set_text(user.name)
 
         self.load_image()
+        self.connect("notify::scale-factor", self.__on_scale_factor_changed)
 
     def __on_button_clicked(self, _button):
         self.emit("clicked")
 
+    def __on_scale_factor_changed(self, *_args) -> None:
+        # The image is loaded at the size of the device pixels
+        self.load_image()
+
     def load_image(self) -> None:
         """
-        Load the user image from disk or from the server.
-
-        - If the image is on disk, will use it
-        - Else downloads from the server and uses that (unless an error happened)
+        Load the user image from the image cache or from the server.
+        The image is cached by its tag, so a changed image is downloaded again.
         """
 
-        def download_image():
-            client = JellyfinClient(
-                base_url=self.__server.address, device_id=""
-            ).get_httpx_client()
-            url = f"/Users/{self.__user.user_id}/Images/Profile"
+        image_tag = self.__user.primary_image_tag
+        if image_tag == "":
+            # The user has no image, the avatar shows their initials
+            return
+
+        scale = self.get_scale_factor()
+        key = ImageKey(
+            item_id=self.__user.user_id,
+            image_type=PRIMARY_IMAGE_TYPE,
+            image_tag=image_tag or "",
+            width=self.__image_size * scale,
+            height=self.__image_size * scale,
+            image_format=get_image_format(PRIMARY_IMAGE_TYPE),
+        )
+
+        def download_image() -> bytes:
+            client = shared.clients.get(self.__server.address).get_httpx_client()
+            url = f"/Users/{self.__user.user_id}/Images/{key.image_type}"
             params = {
-                "format": "Png",
-                "width": self.__image_size,
-                # "height": self.image_size,
+                **get_image_params(key.image_format),
+                "fillWidth": key.width,
+                "fillHeight": key.height,
             }
+            if key.image_tag:
+                params["tag"] = key.image_tag
             response = client.get(url, params=params)
             if response.status_code == HTTPStatus.NOT_FOUND:
                 raise NoUserImageError(
@@ -130,10 +140,7 @@ class UserBadge(Adw.Bin):
                     status_code=response.status_code,
                     content=response.content,
                 )
-            self.__image_dir.mkdir(parents=True, exist_ok=True)
-            with self.__image_path.open("wb") as file:
-                file.write(response.content)
-            return
+            return response.content
 
         def on_error(error: Exception):
             match error:
@@ -146,20 +153,14 @@ class UserBadge(Adw.Bin):
                         exc_info=error,
                     )
 
-        def on_success(_result=None):
-            picture: Gtk.Picture = Gtk.Picture.new_for_filename(str(self.__image_path))  # type: ignore
-            paintable = picture.get_paintable()
-            self.__avatar.set_custom_image(paintable)
-
-        # Use the local image if present
-        if self.__image_path.is_file():
-            on_success()
-            return
+        def on_success(texture: Gdk.Texture):
+            self.__avatar.set_custom_image(texture)
 
-        # Download the image asynchronously
-        task = Task(
-            main=download_image,
+        shared.image_cache.load(
+            key=key,
+            download=download_image,
             callback=on_success,
             error_callback=on_error,
+            priority=TaskPriority.VISIBLE_IMAGE,
+            group=self.__server.address,
         )
-        task.run()
@@ -141,7 +141,9 @@ class UserPicker(Adw.Bin):
                 new_users.append(user)
 
         shelf = cast(Shelf, self.get_child())
+        badges = []
         for user in new_users:
             badge = UserBadge(server=self.__server, user=user)
             badge.connect("clicked", self.__on_user_clicked, user.user_id)
-            shelf.append(badge)
+            badges.append(badge)
+        shelf.extend(badges)
@@ -25,7 +25,6 @@ from src import shared
 from src.components.server_browser_view import ServerBrowserView
 from src.components.servers_list_view import ServersListView
 from src.components.widget_builder import Properties, build
-from src.jellyfin import JellyfinClient
 
 
 class BadToken(Exception):
@@ -59,5 +58,5 @@ class MarmaladeWindow(Adw.ApplicationWindow):
         if info is not None:
             logging.debug("Resuming where we left off")
             address, user_id, (device_id, token) = info
-            client = JellyfinClient(address, device_id=device_id, token=token)
+            client = shared.clients.get(address, device_id=device_id, token=token)
             self.navigation.push(ServerBrowserView(client=client, user_id=user_id))
@@ -1,8 +1,21 @@
 import logging
-from contextlib import closing
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from sqlite3 import Connection, OperationalError, connect
-from typing import NamedTuple, Optional, Sequence
+from typing import Iterator, NamedTuple, Optional, Sequence
+
+# Pragmas applied to every connection.
+# - WAL lets readers and the writer work concurrently, and commits append
+#   to the log instead of rewriting pages of the database file
+# - With WAL, synchronous=NORMAL only syncs at checkpoints, still safe against
+#   application crashes (a power loss may roll back the last commits)
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
 
 
 class CorruptedDatabase(Exception):
@@ -26,10 +39,14 @@ class ServerInfo(NamedTuple):
 
 
 class UserInfo(NamedTuple):
-    """Object describing a user"""
+    """
+    Object describing a user.
+    The primary image tag is None when unknown, empty when the user has no image.
+    """
 
     user_id: str
     name: str
+    primary_image_tag: Optional[str] = None
 
     def __eq__(self, other: "UserInfo") -> bool:
         if not isinstance(other, UserInfo):
@@ -61,21 +78,44 @@ class DataHandler(object):
     """
 
     __db_file: Path
+    __local: threading.local
 
     def __init__(self, *args, file: Path, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.__db_file = file
+        self.__local = threading.local()
         self.__apply_migrations()
 
-    def connect(self) -> Connection:
+    def __open_connection(self) -> Connection:
+        db = connect(str(self.__db_file), check_same_thread=True, cached_statements=64)
+        for pragma in CONNECTION_PRAGMAS:
+            db.execute(pragma)
+        return db
+
+    @contextmanager
+    def connect(self) -> Iterator[Connection]:
         """
-        Get a database connection.
+        Get the database connection of the current thread.
 
         Should be used in a with statement.
-        Will be closed automatically, but not commit.
+        Stays open for reuse, but uncommitted changes are rolled back on exit.
         Enforces thread-locality.
         """
-        return closing(connect(str(self.__db_file), check_same_thread=True))
+        db: Optional[Connection] = getattr(self.__local, "connection", None)
+        if db is None:
+            db = self.__local.connection = self.__open_connection()
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                db.rollback()
+
+    def close(self) -> None:
+        """Close the database connection of the current thread, if any"""
+        db: Optional[Connection] = getattr(self.__local, "connection", None)
+        if db is not None:
+            db.close()
+            self.__local.connection = None
 
     def __execute_blind(self, *query_param_tuples: tuple[str, dict | Sequence]) -> None:
         """Execute queries then commit to the database. Doesn't return a result"""
@@ -151,10 +191,20 @@ class DataHandler(object):
         logging.debug("Saved server to db: %s", server)
 
     def remove_server(self, address: str) -> None:
-        """Remove a server by address from the database"""
-        query = "DELETE FROM Servers WHERE address = ?"
+        """Remove a server by address from the database, with its users' data"""
+        # Foreign keys aren't enforced, the rows referencing the server are removed here
+        tables = (
+            "Tokens",
+            "Users",
+            "SearchItems",
+            "LibraryItems",
+            "LibrarySyncs",
+            "Servers",
+        )
         args = (address,)
-        self.__execute_blind((query, args))
+        self.__execute_blind(
+            *((f"DELETE FROM {table} WHERE address = ?", args) for table in tables)
+        )
         logging.debug("Deleted server with address %s from db", address)
 
     def update_connected_timestamp(self, address: str) -> None:
@@ -242,31 +292,54 @@ class DataHandler(object):
         params = (address, user_id)
         self.__execute_blind((query, params))
 
+    def remove_user_items(self, address: str, user_id: str) -> None:
+        """Remove the library and search items synced for a user"""
+        tables = ("SearchItems", "LibraryItems", "LibrarySyncs")
+        params = (address, user_id)
+        self.__execute_blind(
+            *(
+                (f"DELETE FROM {table} WHERE address = ? AND user_id = ?", params)
+                for table in tables
+            )
+        )
+
     def add_users(self, address: str, *users: UserInfo) -> None:
+        # An unknown image tag doesn't replace a known one
         query = """
-            INSERT OR REPLACE
-            INTO Users (address, user_id, name)
-            VALUES (?, ?, ?)
+            INSERT INTO Users (address, user_id, name, primary_image_tag)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, address) DO UPDATE SET
+                name = excluded.name,
+                primary_image_tag = COALESCE(
+                    excluded.primary_image_tag,
+                    Users.primary_image_tag
+                )
         """
-        row_values = [(address, user.user_id, user.name) for user in users]
+        row_values = [
+            (address, user.user_id, user.name, user.primary_image_tag) for user in users
+        ]
         with self.connect() as db:
             db.executemany(query, row_values)
             db.commit()
 
     def get_user(self, address: str, user_id: str) -> Optional[UserInfo]:
         """Get user info for an address and user id"""
-        query = """SELECT name FROM Users WHERE address = ? AND user_id = ?"""
+        query = """
+            SELECT name, primary_image_tag
+            FROM Users
+            WHERE address = ? AND user_id = ?
+        """
         params = (address, user_id)
         with self.connect() as db:
             row = db.execute(query, params).fetchone()
         if row is None:
             return None
-        return UserInfo(user_id=user_id, name=row[0])
+        return UserInfo(user_id=user_id, name=row[0], primary_image_tag=row[1])
 
     def get_authenticated_users(self, address: str) -> list[UserInfo]:
         """Get a set of authenticated user_id for a server address"""
         query = """
-            SELECT u.user_id, u.name
+            SELECT u.user_id, u.name, u.primary_image_tag
             FROM Tokens AS t
             INNER JOIN Users AS u ON t.address = u.address AND t.user_id = u.user_id
             INNER JOIN Servers AS s ON s.address = t.address
@@ -276,5 +349,5 @@ class DataHandler(object):
         with self.connect() as db:
             cursor = db.execute(query, params)
             rows = cursor.fetchall()
-        user_infos = [UserInfo(user_id=uid, name=name) for uid, name in rows]
+        user_infos = [UserInfo(*row) for row in rows]
         return user_infos
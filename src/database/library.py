@@ -0,0 +1,194 @@
+import json
+import logging
+from typing import Any, Iterable, NamedTuple, Optional
+
+from src.database.api import DataHandler
+
+
+class LibraryItem(NamedTuple):
+    """Library item, as stored by the library sync"""
+
+    library_id: str
+    item_id: str
+    item_type: str
+    name: str
+    sort_name: str = ""
+    series_name: str = ""
+    production_year: Optional[int] = None
+    premiere_date: Optional[str] = None
+    date_created: Optional[str] = None
+    official_rating: str = ""
+    community_rating: Optional[float] = None
+    run_time_ticks: Optional[int] = None
+    genres: tuple[str, ...] = ()
+    tags: tuple[str, ...] = ()
+    image_tags: dict[str, str] = {}
+    image_blur_hashes: dict[str, dict[str, str]] = {}
+    played: bool = False
+    is_favorite: bool = False
+    playback_position_ticks: int = 0
+    played_percentage: float = 0.0
+    unplayed_item_count: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the item as a Jellyfin item dict, eg. to merge it in an `ItemStore`"""
+        return {
+            "Id": self.item_id,
+            "Type": self.item_type,
+            "Name": self.name,
+            "SeriesName": self.series_name,
+            "ProductionYear": self.production_year,
+            "ImageTags": dict(self.image_tags),
+            "ImageBlurHashes": dict(self.image_blur_hashes),
+            "UserData": {
+                "Played": self.played,
+                "IsFavorite": self.is_favorite,
+                "PlaybackPositionTicks": self.playback_position_ticks,
+                "PlayedPercentage": self.played_percentage,
+                "UnplayedItemCount": self.unplayed_item_count,
+            },
+        }
+
+
+class LibrarySyncState(NamedTuple):
+    """State of the library sync of a server and user"""
+
+    full_sync_timestamp: int
+    delta_sync_timestamp: int
+
+
+# Columns of LibraryItems matching the LibraryItem fields, in order
+_ITEM_COLUMNS = LibraryItem._fields
+
+# Columns stored as JSON
+_JSON_COLUMNS = frozenset(("genres", "tags", "image_tags", "image_blur_hashes"))
+
+_JSON_INDICES = tuple(_ITEM_COLUMNS.index(name) for name in sorted(_JSON_COLUMNS))
+_LIST_INDICES = tuple(_ITEM_COLUMNS.index(name) for name in ("genres", "tags"))
+_BOOL_INDICES = tuple(_ITEM_COLUMNS.index(name) for name in ("played", "is_favorite"))
+
+
+def _to_row(item: LibraryItem) -> tuple:
+    return tuple(
+        json.dumps(value) if name in _JSON_COLUMNS else value
+        for name, value in zip(_ITEM_COLUMNS, item)
+    )
+
+
+def _from_row(row: tuple) -> LibraryItem:
+    values = list(row)
+    for index in _JSON_INDICES:
+        values[index] = json.loads(values[index])
+    for index in _LIST_INDICES:
+        values[index] = tuple(values[index])
+    for index in _BOOL_INDICES:
+        values[index] = bool(values[index])
+    return LibraryItem._make(values)
+
+
+class LibraryDatabase:
+    """
+    Local copy of the library items of each server and user.
+
+    - Filled by a background sync, see `src.library_sync.LibrarySync`
+    - Read by the pages with no network round-trip
+    - Safe to use from any thread, through the database's per-thread connections
+    """
+
+    __database: DataHandler
+
+    def __init__(self, database: DataHandler) -> None:
+        self.__database = database
+
+    def get_sync_state(self, address: str, user_id: str) -> Optional[LibrarySyncState]:
+        """Get the state of the last completed sync, or None if never synced"""
+        query = """
+            SELECT full_sync_timestamp, delta_sync_timestamp
+            FROM LibrarySyncs
+            WHERE address = ? AND user_id = ?
+        """
+        with self.__database.connect() as db:
+            row = db.execute(query, (address, user_id)).fetchone()
+        return None if row is None else LibrarySyncState(*row)
+
+    def save_items(
+        self,
+        address: str,
+        user_id: str,
+        sync_timestamp: int,
+        items: Iterable[LibraryItem],
+    ) -> None:
+        """Insert or update items, marking them as seen by a sync"""
+        columns = ", ".join(_ITEM_COLUMNS)
+        placeholders = ", ".join("?" for _ in range(len(_ITEM_COLUMNS) + 3))
+        updates = ", ".join(
+            f"{name} = excluded.{name}"
+            for name in _ITEM_COLUMNS
+            if name not in ("library_id", "item_id")
+        )
+        query = f"""
+            INSERT INTO LibraryItems (address, user_id, {columns}, sync_timestamp)
+            VALUES ({placeholders})
+            ON CONFLICT (address, user_id, library_id, item_id) DO UPDATE SET
+                {updates},
+                sync_timestamp = excluded.sync_timestamp
+        """
+        rows = [(address, user_id, *_to_row(item), sync_timestamp) for item in items]
+        with self.__database.connect() as db:
+            db.executemany(query, rows)
+            db.commit()
+
+    def finish_full_sync(self, address: str, user_id: str, sync_timestamp: int) -> None:
+        """Remove the items that a full sync didn't see, and record its completion"""
+        delete_query = """
+            DELETE FROM LibraryItems
+            WHERE address = ? AND user_id = ? AND sync_timestamp < ?
+        """
+        sync_query = """
+            INSERT OR REPLACE INTO LibrarySyncs (
+                address, user_id, full_sync_timestamp, delta_sync_timestamp
+            )
+            VALUES (?, ?, ?, ?)
+        """
+        params = (address, user_id, sync_timestamp)
+        with self.__database.connect() as db:
+            n_removed = db.execute(delete_query, params).rowcount
+            db.execute(sync_query, (*params, sync_timestamp))
+            db.commit()
+        logging.debug("Removed %d items from the library", n_removed)
+
+    def finish_delta_sync(
+        self, address: str, user_id: str, sync_timestamp: int
+    ) -> None:
+        """Record the completion of a delta sync"""
+        query = """
+            UPDATE LibrarySyncs SET delta_sync_timestamp = ?
+            WHERE address = ? AND user_id = ?
+        """
+        with self.__database.connect() as db:
+            db.execute(query, (sync_timestamp, address, user_id))
+            db.commit()
+
+    def count_items(self, address: str, user_id: str) -> dict[str, int]:
+        """Get the number of items of each library"""
+        query = """
+            SELECT library_id, COUNT(*) FROM LibraryItems
+            WHERE address = ? AND user_id = ?
+            GROUP BY library_id
+        """
+        with self.__database.connect() as db:
+            return dict(db.execute(query, (address, user_id)).fetchall())
+
+    def get_items(
+        self, address: str, user_id: str, library_id: str
+    ) -> list[LibraryItem]:
+        """Get the items of a library, sorted by sort name"""
+        query = f"""
+            SELECT {", ".join(_ITEM_COLUMNS)} FROM LibraryItems
+            WHERE address = ? AND user_id = ? AND library_id = ?
+            ORDER BY sort_name, name
+        """
+        with self.__database.connect() as db:
+            cursor = db.execute(query, (address, user_id, library_id))
+            cursor.row_factory = lambda _cursor, row: _from_row(row)
+            return cursor.fetchall()
@@ -0,0 +1,76 @@
+BEGIN;
+
+-- Searchable fields of the library items, per server and user
+CREATE TABLE SearchItems (
+  rowid INTEGER PRIMARY KEY,
+  address TINYTEXT NOT NULL,
+  user_id CHAR(32) NOT NULL,
+  item_id CHAR(32) NOT NULL,
+  item_type TINYTEXT NOT NULL,
+  name TEXT NOT NULL,
+  original_title TEXT NOT NULL DEFAULT '',
+  people TEXT NOT NULL DEFAULT '',
+  genres TEXT NOT NULL DEFAULT '',
+  production_year INTEGER,
+  primary_image_tag TINYTEXT NOT NULL DEFAULT '',
+  -- Start time of the sync that last saw the item, older items were deleted
+  sync_timestamp INTEGER NOT NULL,
+
+  CONSTRAINT UC_SearchItems
+  UNIQUE (address, user_id, item_id),
+
+  CONSTRAINT FK_SearchItemsAddress
+  FOREIGN KEY (address) REFERENCES Servers (address)
+  ON DELETE CASCADE
+);
+
+CREATE INDEX INDEX_SearchItemsSync ON SearchItems (address, user_id, sync_timestamp);
+
+-- Full text index of the search items, kept up to date by the triggers below
+CREATE VIRTUAL TABLE SearchIndex USING fts5 (
+  name,
+  original_title,
+  people,
+  genres,
+  content = 'SearchItems',
+  content_rowid = 'rowid',
+  tokenize = 'unicode61 remove_diacritics 2',
+  prefix = '2 3'
+);
+
+CREATE TRIGGER SearchItemsInsert AFTER INSERT ON SearchItems BEGIN
+  INSERT INTO SearchIndex (rowid, name, original_title, people, genres)
+  VALUES (new.rowid, new.name, new.original_title, new.people, new.genres);
+END;
+
+CREATE TRIGGER SearchItemsDelete AFTER DELETE ON SearchItems BEGIN
+  INSERT INTO SearchIndex (SearchIndex, rowid, name, original_title, people, genres)
+  VALUES ('delete', old.rowid, old.name, old.original_title, old.people, old.genres);
+END;
+
+CREATE TRIGGER SearchItemsUpdate AFTER UPDATE OF name, original_title, people, genres
+ON SearchItems BEGIN
+  INSERT INTO SearchIndex (SearchIndex, rowid, name, original_title, people, genres)
+  VALUES ('delete', old.rowid, old.name, old.original_title, old.people, old.genres);
+  INSERT INTO SearchIndex (rowid, name, original_title, people, genres)
+  VALUES (new.rowid, new.name, new.original_title, new.people, new.genres);
+END;
+
+-- Completed search index syncs, per server and user
+CREATE TABLE SearchSyncs (
+  address TINYTEXT NOT NULL,
+  user_id CHAR(32) NOT NULL,
+  sync_timestamp INTEGER NOT NULL,
+
+  CONSTRAINT PK_SearchSyncs
+  PRIMARY KEY (address, user_id),
+
+  CONSTRAINT FK_SearchSyncsAddress
+  FOREIGN KEY (address) REFERENCES Servers (address)
+  ON DELETE CASCADE
+);
+
+-- Update DB version
+UPDATE Meta SET row_value = "v6" WHERE row_key = "version";
+
+COMMIT;
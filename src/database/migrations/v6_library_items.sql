@@ -0,0 +1,63 @@
+BEGIN;
+
+-- Library items of each server and user, filled by the library sync.
+-- An item in several libraries has one row per library.
+CREATE TABLE LibraryItems (
+  address TINYTEXT NOT NULL,
+  user_id CHAR(32) NOT NULL,
+  library_id CHAR(32) NOT NULL,
+  item_id CHAR(32) NOT NULL,
+  item_type TINYTEXT NOT NULL,
+  name TEXT NOT NULL,
+  sort_name TEXT NOT NULL DEFAULT '',
+  series_name TEXT NOT NULL DEFAULT '',
+  production_year INTEGER,
+  premiere_date TINYTEXT,
+  date_created TINYTEXT,
+  official_rating TINYTEXT NOT NULL DEFAULT '',
+  community_rating REAL,
+  run_time_ticks INTEGER,
+  -- JSON lists and object
+  genres TEXT NOT NULL DEFAULT '[]',
+  tags TEXT NOT NULL DEFAULT '[]',
+  image_tags TEXT NOT NULL DEFAULT '{}',
+  -- User data
+  played BOOLEAN NOT NULL DEFAULT 0,
+  is_favorite BOOLEAN NOT NULL DEFAULT 0,
+  playback_position_ticks INTEGER NOT NULL DEFAULT 0,
+  played_percentage REAL NOT NULL DEFAULT 0,
+  unplayed_item_count INTEGER NOT NULL DEFAULT 0,
+  -- Start time of the full sync that last saw the item, older items were deleted
+  sync_timestamp INTEGER NOT NULL,
+
+  CONSTRAINT PK_LibraryItems
+  PRIMARY KEY (address, user_id, library_id, item_id),
+
+  CONSTRAINT FK_LibraryItemsAddress
+  FOREIGN KEY (address) REFERENCES Servers (address)
+  ON DELETE CASCADE
+);
+
+CREATE INDEX INDEX_LibraryItemsSync ON LibraryItems (address, user_id, sync_timestamp);
+
+-- Library sync state, per server and user
+CREATE TABLE LibrarySyncs (
+  address TINYTEXT NOT NULL,
+  user_id CHAR(32) NOT NULL,
+  -- Local start time of the last completed full sync, in ns
+  full_sync_timestamp INTEGER NOT NULL,
+  -- Local start time of the last completed sync (full or delta), in ns
+  delta_sync_timestamp INTEGER NOT NULL,
+
+  CONSTRAINT PK_LibrarySyncs
+  PRIMARY KEY (address, user_id),
+
+  CONSTRAINT FK_LibrarySyncsAddress
+  FOREIGN KEY (address) REFERENCES Servers (address)
+  ON DELETE CASCADE
+);
+
+-- Update DB version
+UPDATE Meta SET row_value = "v7" WHERE row_key = "version";
+
+COMMIT;
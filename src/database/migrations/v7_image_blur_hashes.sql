@@ -0,0 +1,13 @@
+BEGIN;
+
+-- BlurHashes of the items' images, shown while the images download
+ALTER TABLE LibraryItems ADD COLUMN image_blur_hashes TEXT NOT NULL DEFAULT '{}';
+ALTER TABLE SearchItems ADD COLUMN primary_image_blur_hash TINYTEXT NOT NULL DEFAULT '';
+
+-- The synced items have no BlurHash yet, make the next sync fetch them all again
+DELETE FROM LibrarySyncs;
+
+-- Update DB version
+UPDATE Meta SET row_value = "v8" WHERE row_key = "version";
+
+COMMIT;
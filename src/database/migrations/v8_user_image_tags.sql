@@ -0,0 +1,9 @@
+BEGIN;
+
+-- Tags of the users' primary images, NULL until known, empty if they have none
+ALTER TABLE Users ADD COLUMN primary_image_tag TINYTEXT DEFAULT NULL;
+
+-- Update DB version
+UPDATE Meta SET row_value = "v9" WHERE row_key = "version";
+
+COMMIT;
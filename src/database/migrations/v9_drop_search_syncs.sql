@@ -0,0 +1,23 @@
+BEGIN;
+
+-- The completed search index syncs were never read
+DROP TABLE SearchSyncs;
+
+-- Foreign keys aren't enforced, remove the rows left behind by removed servers
+-- and logged out users (the ON DELETE CASCADE clauses had no effect)
+DELETE FROM Users WHERE address NOT IN (SELECT address FROM Servers);
+DELETE FROM Tokens WHERE address NOT IN (SELECT address FROM Servers);
+DELETE FROM SearchItems WHERE (address, user_id) NOT IN (
+  SELECT address, user_id FROM Tokens
+);
+DELETE FROM LibraryItems WHERE (address, user_id) NOT IN (
+  SELECT address, user_id FROM Tokens
+);
+DELETE FROM LibrarySyncs WHERE (address, user_id) NOT IN (
+  SELECT address, user_id FROM Tokens
+);
+
+-- Update DB version
+UPDATE Meta SET row_value = "v10" WHERE row_key = "version";
+
+COMMIT;
@@ -0,0 +1,118 @@
+import logging
+import re
+from typing import Iterable, NamedTuple, Optional
+
+from src.database.api import DataHandler
+
+# Relative weight of the indexed columns in the ranking
+# (name, original_title, people, genres)
+RANK_WEIGHTS = (10.0, 5.0, 1.0, 0.5)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class SearchItem(NamedTuple):
+    """Searchable fields of a library item"""
+
+    item_id: str
+    item_type: str
+    name: str
+    original_title: str = ""
+    people: str = ""
+    genres: str = ""
+    production_year: Optional[int] = None
+    primary_image_tag: str = ""
+    primary_image_blur_hash: str = ""
+
+
+def make_match_query(text: str) -> Optional[str]:
+    """
+    Build an FTS5 query matching every word of a text as a prefix,
+    or None if the text has no word.
+    """
+    words = _WORD_PATTERN.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class SearchIndex:
+    """
+    Full text index of the library items of each server and user.
+
+    - Filled by a background sync, see `src.library_sync.LibrarySync`
+    - Queried locally, matching word prefixes and ranking the names first
+    - Safe to use from any thread, through the database's per-thread connections
+    """
+
+    __database: DataHandler
+
+    def __init__(self, database: DataHandler) -> None:
+        self.__database = database
+
+    def save_items(
+        self,
+        address: str,
+        user_id: str,
+        sync_timestamp: int,
+        items: Iterable[SearchItem],
+    ) -> None:
+        """Insert or update items, marking them as seen by a sync"""
+        query = """
+            INSERT INTO SearchItems (
+                address, user_id, item_id, item_type, name, original_title,
+                people, genres, production_year, primary_image_tag,
+                primary_image_blur_hash, sync_timestamp
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (address, user_id, item_id) DO UPDATE SET
+                item_type = excluded.item_type,
+                name = excluded.name,
+                original_title = excluded.original_title,
+                people = excluded.people,
+                genres = excluded.genres,
+                production_year = excluded.production_year,
+                primary_image_tag = excluded.primary_image_tag,
+                primary_image_blur_hash = excluded.primary_image_blur_hash,
+                sync_timestamp = excluded.sync_timestamp
+        """
+        rows = [(address, user_id, *item, sync_timestamp) for item in items]
+        with self.__database.connect() as db:
+            db.executemany(query, rows)
+            db.commit()
+
+    def finish_sync(self, address: str, user_id: str, sync_timestamp: int) -> None:
+        """Remove the items that the sync didn't see"""
+        query = """
+            DELETE FROM SearchItems
+            WHERE address = ? AND user_id = ? AND sync_timestamp < ?
+        """
+        params = (address, user_id, sync_timestamp)
+        with self.__database.connect() as db:
+            n_removed = db.execute(query, params).rowcount
+            db.commit()
+        logging.debug("Removed %d items from the search index", n_removed)
+
+    def search(
+        self, address: str, user_id: str, text: str, limit: int = 50
+    ) -> list[SearchItem]:
+        """Get the items matching a text, best matches first"""
+        match_query = make_match_query(text)
+        if match_query is None:
+            return []
+        query = f"""
+            SELECT
+                i.item_id, i.item_type, i.name, i.original_title,
+                i.people, i.genres, i.production_year, i.primary_image_tag,
+                i.primary_image_blur_hash
+            FROM SearchIndex
+            INNER JOIN SearchItems AS i ON i.rowid = SearchIndex.rowid
+            WHERE SearchIndex MATCH ? AND i.address = ? AND i.user_id = ?
+            ORDER BY bm25(SearchIndex, {", ".join(map(str, RANK_WEIGHTS))})
+            LIMIT ?
+        """
+        params = (match_query, address, user_id, limit)
+        with self.__database.connect() as db:
+            cursor = db.execute(query, params)
+            cursor.row_factory = lambda _cursor, row: SearchItem(*row)
+            return cursor.fetchall()
@@ -0,0 +1,258 @@
+import json
+import logging
+import socket
+from socket import (
+    AF_INET,
+    AF_INET6,
+    IPPROTO_IPV6,
+    IPPROTO_UDP,
+    IPV6_MULTICAST_IF,
+    SO_BINDTODEVICE,
+    SO_BROADCAST,
+    SOCK_DGRAM,
+    SOL_SOCKET,
+)
+from typing import Any, Optional
+
+import psutil
+from gi.repository import GLib, GObject
+
+from src.database.api import ServerInfo
+
+DISCOVERY_PORT: int = 7359
+DISCOVERY_ENCODING: str = "utf-8"
+DISCOVERY_MESSAGE: bytes = "Who is JellyfinServer?".encode(DISCOVERY_ENCODING)
+DISCOVERY_BUFSIZE: int = 4096
+DISCOVERY_IPV6_MULTICAST_ADDRESS: str = "ff02::1"
+
+# Delays between the discovery broadcasts, since UDP datagrams may get lost.
+# The whole schedule fits in the idle timeout, so that every broadcast is sent.
+REBROADCAST_DELAYS_MS: tuple[int, ...] = (250, 500)
+# Time without a new server to end the discovery, from the first broadcast
+IDLE_TIMEOUT_MS: int = 1500
+
+
+class _DiscoverySocket:
+    """A non-blocking UDP socket sending discovery messages to a destination"""
+
+    sock: socket.socket
+    destination: tuple
+    watch_id: int = 0
+
+    def __init__(self, sock: socket.socket, destination: tuple) -> None:
+        self.sock = sock
+        self.destination = destination
+
+
+class ServerDiscovery(GObject.Object):
+    """
+    Discover Jellyfin servers on the local network.
+
+    - Broadcasts on every IPv4 interface, and multicasts on every IPv6 interface
+    - All the sockets are watched from the main loop, no thread is blocked
+    - Broadcasts are repeated on a backoff schedule
+    - Every new server is emitted as soon as its reply is received
+    - Ends when no new server replied for a while, even between rebroadcasts
+    """
+
+    __gtype_name__ = "MarmaladeServerDiscovery"
+
+    __sockets: list[_DiscoverySocket]
+    __found_addresses: set[str]
+    __n_broadcasts: int
+    __broadcast_source_id: int
+    __idle_source_id: int
+    __is_running: bool
+
+    @GObject.Signal(name="server-found", arg_types=[object])
+    def server_found_signal(self, _server: ServerInfo):
+        """Signal emitted when a new server is discovered"""
+
+    @GObject.Signal(name="finished")
+    def finished_signal(self):
+        """Signal emitted when the discovery ends"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.__sockets = []
+        self.__found_addresses = set()
+        self.__n_broadcasts = 0
+        self.__broadcast_source_id = 0
+        self.__idle_source_id = 0
+        self.__is_running = False
+
+    # Socket setup
+
+    @staticmethod
+    def __bind_to_device(sock: socket.socket, interface_name: str) -> None:
+        """Bind a socket to an interface, if permitted"""
+        try:
+            sock.setsockopt(SOL_SOCKET, SO_BINDTODEVICE, interface_name.encode())
+        except OSError as error:
+            logging.debug(
+                "Couldn't bind discovery socket to %s: %s", interface_name, error
+            )
+
+    def __create_ipv4_socket(
+        self, interface_name: str, broadcast_address: str
+    ) -> _DiscoverySocket:
+        sock = socket.socket(family=AF_INET, type=SOCK_DGRAM, proto=IPPROTO_UDP)
+        try:
+            sock.setblocking(False)
+            self.__bind_to_device(sock, interface_name)
+            sock.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
+        except OSError:
+            sock.close()
+            raise
+        return _DiscoverySocket(sock, (broadcast_address, DISCOVERY_PORT))
+
+    def __create_ipv6_socket(self, interface_name: str) -> _DiscoverySocket:
+        index = socket.if_nametoindex(interface_name)
+        sock = socket.socket(family=AF_INET6, type=SOCK_DGRAM, proto=IPPROTO_UDP)
+        try:
+            sock.setblocking(False)
+            self.__bind_to_device(sock, interface_name)
+            sock.setsockopt(IPPROTO_IPV6, IPV6_MULTICAST_IF, index)
+        except OSError:
+            sock.close()
+            raise
+        destination = (DISCOVERY_IPV6_MULTICAST_ADDRESS, DISCOVERY_PORT, 0, index)
+        return _DiscoverySocket(sock, destination)
+
+    def __create_sockets(self) -> None:
+        for name, address_info_list in psutil.net_if_addrs().items():
+            has_ipv6 = False
+            for address_info in address_info_list:
+                try:
+                    if address_info.family == AF_INET and address_info.broadcast:
+                        self.__sockets.append(
+                            self.__create_ipv4_socket(name, address_info.broadcast)
+                        )
+                    elif address_info.family == AF_INET6 and not has_ipv6:
+                        has_ipv6 = True
+                        self.__sockets.append(self.__create_ipv6_socket(name))
+                except OSError as error:
+                    logging.debug("Can't discover servers on %s: %s", name, error)
+
+    # Discovery loop
+
+    def __broadcast(self) -> None:
+        for discovery_socket in self.__sockets:
+            try:
+                discovery_socket.sock.sendto(
+                    DISCOVERY_MESSAGE, discovery_socket.destination
+                )
+            except OSError as error:
+                logging.debug(
+                    "Discovery send to %s failed: %s",
+                    discovery_socket.destination,
+                    error,
+                )
+        self.__n_broadcasts += 1
+
+    def __on_broadcast_timeout(self) -> bool:
+        self.__broadcast()
+        self.__schedule_next_broadcast()
+        return GLib.SOURCE_REMOVE
+
+    def __schedule_next_broadcast(self) -> None:
+        """Schedule the next broadcast, if any is left"""
+        index = self.__n_broadcasts - 1
+        if index < len(REBROADCAST_DELAYS_MS):
+            self.__broadcast_source_id = GLib.timeout_add(
+                REBROADCAST_DELAYS_MS[index], self.__on_broadcast_timeout
+            )
+        else:
+            self.__broadcast_source_id = 0
+
+    def __restart_idle_timeout(self) -> None:
+        if self.__idle_source_id:
+            GLib.source_remove(self.__idle_source_id)
+        self.__idle_source_id = GLib.timeout_add(
+            IDLE_TIMEOUT_MS, self.__on_idle_timeout
+        )
+
+    def __on_idle_timeout(self) -> bool:
+        self.__idle_source_id = 0
+        logging.debug("Server discovery finished")
+        self.stop()
+        return GLib.SOURCE_REMOVE
+
+    def __on_socket_readable(
+        self, _fd: Any, _condition: Any, sock: socket.socket
+    ) -> bool:
+        """Read every pending reply of a socket"""
+        while True:
+            try:
+                response, _address = sock.recvfrom(DISCOVERY_BUFSIZE)
+            except (BlockingIOError, InterruptedError):
+                return GLib.SOURCE_CONTINUE
+            except OSError as error:
+                logging.debug("Discovery receive failed: %s", error)
+                return GLib.SOURCE_CONTINUE
+            if (server := self.__parse_response(response)) is not None:
+                self.__on_server_found(server)
+
+    @staticmethod
+    def __parse_response(response: bytes) -> Optional[ServerInfo]:
+        try:
+            server_info = json.loads(response.decode(encoding=DISCOVERY_ENCODING))
+            return ServerInfo(
+                name=server_info["Name"],
+                address=server_info["Address"],
+                server_id=server_info["Id"],
+            )
+        except (UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError):
+            # Response isn't JSON or contains invalid data
+            return None
+
+    def __on_server_found(self, server: ServerInfo) -> None:
+        if server.address in self.__found_addresses:
+            return
+        self.__found_addresses.add(server.address)
+        self.emit("server-found", server)
+        # Wait for more replies before ending
+        self.__restart_idle_timeout()
+
+    # Public methods
+
+    def start(self) -> None:
+        """Start discovering servers, must be called from the main thread"""
+        if self.__is_running:
+            return
+        self.__is_running = True
+        logging.debug("Discovering servers")
+        self.__create_sockets()
+        if not self.__sockets:
+            logging.debug("No network interface to discover servers on")
+            GLib.idle_add(self.__on_idle_timeout)
+            return
+        for discovery_socket in self.__sockets:
+            discovery_socket.watch_id = GLib.io_add_watch(
+                discovery_socket.sock.fileno(),
+                GLib.PRIORITY_DEFAULT,
+                GLib.IOCondition.IN,
+                self.__on_socket_readable,
+                discovery_socket.sock,
+            )
+        self.__broadcast()
+        self.__schedule_next_broadcast()
+        # Ends early when no new server replies, cancelling the rebroadcasts
+        self.__restart_idle_timeout()
+
+    def stop(self) -> None:
+        """Stop the discovery and release its sockets"""
+        if not self.__is_running:
+            return
+        self.__is_running = False
+        for source_id in (self.__broadcast_source_id, self.__idle_source_id):
+            if source_id:
+                GLib.source_remove(source_id)
+        self.__broadcast_source_id = 0
+        self.__idle_source_id = 0
+        for discovery_socket in self.__sockets:
+            if discovery_socket.watch_id:
+                GLib.source_remove(discovery_socket.watch_id)
+            discovery_socket.sock.close()
+        self.__sockets.clear()
+        self.emit("finished")
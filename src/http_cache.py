@@ -0,0 +1,313 @@
+import datetime
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence
+
+import httpcore
+import httpx
+from hishel import CacheTransport, Controller, FileStorage, PickleSerializer
+
+
+class CachePolicy(NamedTuple):
+    """Time to live (in seconds) of the cached responses for matching request paths"""
+
+    pattern: re.Pattern
+    ttl: float
+
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+
+# Images are not listed, they are cached by the image cache
+DEFAULT_POLICIES: Sequence[CachePolicy] = (
+    # Server metadata rarely changes
+    CachePolicy(re.compile(r"^/System/Info/Public$"), ttl=1 * HOUR),
+    # User content changes, but not that fast
+    CachePolicy(re.compile(r"^/UserViews$|^/Users/[^/]+/Views$"), ttl=5 * MINUTE),
+    CachePolicy(
+        re.compile(r"^/Items/Latest$|^/Users/[^/]+/Items/Latest$"), ttl=5 * MINUTE
+    ),
+    # Playback state changes whenever something is watched
+    CachePolicy(re.compile(r"^/UserItems/Resume$|^/Shows/NextUp$"), ttl=1 * MINUTE),
+)
+
+
+def get_policy(
+    path: str, policies: Sequence[CachePolicy] = DEFAULT_POLICIES
+) -> Optional[CachePolicy]:
+    """Get the first cache policy applying to a request path, or None"""
+    for policy in policies:
+        if policy.pattern.search(path):
+            return policy
+    return None
+
+
+def generate_cache_key(request: httpcore.Request, body: bytes = b"") -> str:
+    """
+    Generate the cache key of a request.
+
+    The authorization header is part of the key, so that users of the same server
+    never get each other's responses.
+    """
+    key = blake2b(digest_size=16, usedforsecurity=False)
+    key.update(request.method)
+    key.update(bytes(request.url))
+    for name, value in request.headers:
+        if name.lower() == b"x-emby-authorization":
+            key.update(value)
+    key.update(body)
+    return key.hexdigest()
+
+
+class CacheStats:
+    """Thread safe hit and miss counters of a cache"""
+
+    __lock: threading.Lock
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+
+    def record_hit(self) -> None:
+        with self.__lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        with self.__lock:
+            self.misses += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return 0.0 if total == 0 else self.hits / total
+
+    def __str__(self) -> str:
+        return "%d hits, %d misses (%.0f%% hit ratio)" % (
+            self.hits,
+            self.misses,
+            self.hit_ratio * 100,
+        )
+
+
+class PolicyController(Controller):
+    """
+    Cache controller deciding what to store from the cache policies.
+
+    Jellyfin doesn't send caching headers for most of its API,
+    so the usual HTTP caching rules would never store anything.
+    Freshness is enforced by the storage, a retrieved response is always usable.
+    """
+
+    __policies: Sequence[CachePolicy]
+
+    def __init__(self, policies: Sequence[CachePolicy]) -> None:
+        super().__init__(
+            cacheable_methods=["GET"],
+            cacheable_status_codes=[200],
+            key_generator=generate_cache_key,
+        )
+        self.__policies = policies
+
+    def is_cachable(
+        self, request: httpcore.Request, response: httpcore.Response
+    ) -> bool:
+        if request.method != b"GET" or response.status != 200:
+            return False
+        path = request.url.target.split(b"?", 1)[0].decode("ascii")
+        return get_policy(path, self.__policies) is not None
+
+    def construct_response_from_cache(
+        self,
+        request: httpcore.Request,
+        response: httpcore.Response,
+        original_request: httpcore.Request,
+    ) -> httpcore.Response:
+        return response
+
+
+class LRUFileStorage(FileStorage):
+    """
+    File storage for cached responses, bounded in size.
+
+    - Responses older than their policy's TTL are discarded when retrieved
+    - When the total size exceeds `max_size`, the least recently used are evicted
+    - Recency survives restarts, since it is stored as the files' mtime
+    """
+
+    __policies: Sequence[CachePolicy]
+    __max_size: int
+    __index: OrderedDict[str, int]
+    __index_lock: threading.Lock
+    __total_size: int
+
+    def __init__(
+        self,
+        base_path: Path,
+        max_size: int,
+        policies: Sequence[CachePolicy],
+    ) -> None:
+        super().__init__(serializer=PickleSerializer(), base_path=base_path)
+        self.__policies = policies
+        self.__max_size = max_size
+        self.__index_lock = threading.Lock()
+        self.__build_index()
+
+    def __build_index(self) -> None:
+        """Build the LRU index from the files on disk, least recently used first"""
+        entries = []
+        with os.scandir(self._base_path) as iterator:
+            for entry in iterator:
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self.__index = OrderedDict((key, size) for _mtime, key, size in entries)
+        self.__total_size = sum(self.__index.values())
+        logging.debug(
+            "HTTP cache holds %d responses (%d bytes)",
+            len(self.__index),
+            self.__total_size,
+        )
+
+    def __index_set(self, key: str, size: int) -> None:
+        with self.__index_lock:
+            self.__total_size += size - self.__index.get(key, 0)
+            self.__index[key] = size
+            self.__index.move_to_end(key)
+
+    def __index_pop(self, key: str) -> None:
+        with self.__index_lock:
+            self.__total_size -= self.__index.pop(key, 0)
+
+    def __evict(self) -> None:
+        """Remove the least recently used responses until under the size limit"""
+        evicted = []
+        with self.__index_lock:
+            while self.__total_size > self.__max_size and self.__index:
+                key, size = self.__index.popitem(last=False)
+                self.__total_size -= size
+                evicted.append(key)
+        for key in evicted:
+            super().remove(key)
+        if evicted:
+            logging.debug("Evicted %d responses from the HTTP cache", len(evicted))
+
+    def __is_expired(self, request: httpcore.Request, metadata: dict) -> bool:
+        path = request.url.target.split(b"?", 1)[0].decode("ascii")
+        policy = get_policy(path, self.__policies)
+        if policy is None:
+            return True
+        now = datetime.datetime.now(datetime.timezone.utc)
+        age = (now - metadata["created_at"]).total_seconds()
+        return age > policy.ttl
+
+    def store(self, key, response, request, metadata=None) -> None:
+        super().store(key, response, request, metadata)
+        try:
+            size = (self._base_path / key).stat().st_size
+        except FileNotFoundError:
+            return
+        self.__index_set(key, size)
+        self.__evict()
+
+    def retrieve(self, key):
+        try:
+            stored = super().retrieve(key)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Unreadable cache file (eg. interrupted write), treat as a miss
+            logging.warning("Discarding unreadable HTTP cache entry %s", key)
+            self.remove(key)
+            return None
+        if stored is None:
+            self.__index_pop(key)
+            return None
+        _response, request, metadata = stored
+        if self.__is_expired(request, metadata):
+            self.remove(key)
+            return None
+        # Mark as recently used
+        with self.__index_lock:
+            if key in self.__index:
+                self.__index.move_to_end(key)
+        try:
+            os.utime(self._base_path / key)
+        except FileNotFoundError:
+            pass
+        return stored
+
+    def remove(self, key) -> None:
+        super().remove(key)
+        if isinstance(key, str):
+            self.__index_pop(key)
+
+
+class CountingCacheTransport(CacheTransport):
+    """Cache transport that counts hits and misses of cacheable requests"""
+
+    __stats: CacheStats
+    __policies: Sequence[CachePolicy]
+
+    def __init__(
+        self,
+        *args,
+        stats: CacheStats,
+        policies: Sequence[CachePolicy],
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.__stats = stats
+        self.__policies = policies
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = super().handle_request(request)
+        if get_policy(request.url.path, self.__policies) is not None:
+            if response.extensions.get("from_cache", False):
+                self.__stats.record_hit()
+            else:
+                self.__stats.record_miss()
+        return response
+
+
+class HttpCache:
+    """
+    Size bounded disk HTTP cache with per endpoint TTL policies.
+
+    A single instance is meant to be shared by all the HTTP clients,
+    use `wrap` to add the cache on top of a transport.
+    """
+
+    __policies: Sequence[CachePolicy]
+    __storage: LRUFileStorage
+    __controller: PolicyController
+
+    stats: CacheStats
+
+    def __init__(
+        self,
+        directory: Path,
+        max_size: int,
+        policies: Sequence[CachePolicy] = DEFAULT_POLICIES,
+    ) -> None:
+        self.__policies = policies
+        self.__storage = LRUFileStorage(
+            base_path=directory, max_size=max_size, policies=policies
+        )
+        self.__controller = PolicyController(policies=policies)
+        self.stats = CacheStats()
+
+    def wrap(self, transport: httpx.BaseTransport) -> httpx.BaseTransport:
+        """Get a caching transport on top of the given transport"""
+        return CountingCacheTransport(
+            transport=transport,
+            storage=self.__storage,
+            controller=self.__controller,
+            stats=self.stats,
+            policies=self.__policies,
+        )
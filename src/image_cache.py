@@ -0,0 +1,529 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from gi.repository import Gdk, GdkPixbuf, Gio, GLib, GObject
+
+from src.blurhash import decode as decode_blur_hash
+from src.image_format import set_undecodable
+from src.task import Task, TaskPriority
+
+# Number of decoded BlurHash placeholders kept in memory (a few KiB each)
+PLACEHOLDER_MEMORY_COUNT = 512
+
+
+class ImageKey(NamedTuple):
+    """
+    Identity of a rendition of an image.
+    The size is in device pixels, the texture is cropped and scaled to it.
+    The format is the one requested from the server, see `src.image_format`.
+    """
+
+    item_id: str
+    image_type: str
+    image_tag: str
+    width: int
+    height: int
+    image_format: str = ""
+
+    def get_file_name(self) -> str:
+        digest = blake2b(digest_size=16, usedforsecurity=False)
+        digest.update("\0".join(str(part) for part in self).encode())
+        return digest.hexdigest()
+
+
+class ImageDecodeError(Exception):
+    """Error raised when a downloaded image cannot be decoded"""
+
+    image_format: str
+
+    def __init__(self, image_format: str) -> None:
+        super().__init__(f"Couldn't decode {image_format or 'an'} image")
+        self.image_format = image_format
+
+
+class DownloadStats:
+    """Thread safe counters of the images downloaded, per format"""
+
+    __lock: threading.Lock
+    __counts: dict[str, int]
+    __sizes: dict[str, int]
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__counts = {}
+        self.__sizes = {}
+
+    def record_download(self, image_format: str, size: int) -> None:
+        with self.__lock:
+            self.__counts[image_format] = self.__counts.get(image_format, 0) + 1
+            self.__sizes[image_format] = self.__sizes.get(image_format, 0) + size
+
+    def __str__(self) -> str:
+        with self.__lock:
+            if not self.__counts:
+                return "no images downloaded"
+            return ", ".join(
+                "%d %s images downloaded (%d KiB, %.1f KiB each)"
+                % (
+                    count,
+                    image_format or "unknown",
+                    self.__sizes[image_format] // 1024,
+                    self.__sizes[image_format] / count / 1024,
+                )
+                for image_format, count in self.__counts.items()
+            )
+
+
+def _decode_texture(data: bytes, width: int, height: int) -> Gdk.Texture:
+    """
+    Decode an image, cropped and scaled to exactly fill the given size.
+    The texture is then drawn as is, instead of being rescaled every frame.
+    """
+
+    loader = GdkPixbuf.PixbufLoader()
+    loader.write(data)
+    loader.close()
+    pixbuf = loader.get_pixbuf().apply_embedded_orientation()
+    source_width = pixbuf.get_width()
+    source_height = pixbuf.get_height()
+
+    if (source_width, source_height) != (width, height):
+        # Scale to cover the size, then crop the overflow around the center
+        scale = max(width / source_width, height / source_height)
+        composited = GdkPixbuf.Pixbuf.new(
+            GdkPixbuf.Colorspace.RGB, pixbuf.get_has_alpha(), 8, width, height
+        )
+        pixbuf.scale(
+            composited,
+            0,
+            0,
+            width,
+            height,
+            (width - source_width * scale) / 2,
+            (height - source_height * scale) / 2,
+            scale,
+            scale,
+            GdkPixbuf.InterpType.BILINEAR,
+        )
+        pixbuf = composited
+
+    return Gdk.MemoryTexture.new(
+        width,
+        height,
+        (
+            Gdk.MemoryFormat.R8G8B8A8
+            if pixbuf.get_has_alpha()
+            else Gdk.MemoryFormat.R8G8B8
+        ),
+        pixbuf.read_pixel_bytes(),
+        pixbuf.get_rowstride(),
+    )
+
+
+class TextureLRU:
+    """
+    In-memory LRU of decoded textures, bounded by their estimated size in bytes.
+    Must only be used from the main thread.
+    """
+
+    __max_size: int
+    __total_size: int
+    __textures: OrderedDict[ImageKey, Gdk.Texture]
+
+    def __init__(self, max_size: int) -> None:
+        self.__max_size = max_size
+        self.__total_size = 0
+        self.__textures = OrderedDict()
+
+    @staticmethod
+    def __get_texture_size(texture: Gdk.Texture) -> int:
+        return texture.get_width() * texture.get_height() * 4
+
+    def get(self, key: ImageKey) -> Optional[Gdk.Texture]:
+        texture = self.__textures.get(key)
+        if texture is not None:
+            self.__textures.move_to_end(key)
+        return texture
+
+    def put(self, key: ImageKey, texture: Gdk.Texture) -> None:
+        if (previous := self.__textures.pop(key, None)) is not None:
+            self.__total_size -= self.__get_texture_size(previous)
+        self.__textures[key] = texture
+        self.__total_size += self.__get_texture_size(texture)
+        while self.__total_size > self.__max_size and len(self.__textures) > 1:
+            _key, evicted = self.__textures.popitem(last=False)
+            self.__total_size -= self.__get_texture_size(evicted)
+
+
+class ImageFileStore:
+    """
+    Directory of encoded images, bounded in size and age.
+
+    - When the total size exceeds `max_size`, the least recently used are evicted
+    - Images unused for longer than `max_age` seconds are evicted, so that
+      images whose key doesn't change with their content are refreshed
+    - Recency survives restarts, since it is stored as the files' mtime
+    - The directory is scanned on first use, not when created (eg. at startup)
+    - Safe to use from worker threads
+    """
+
+    __directory: Path
+    __max_size: int
+    __max_age: float
+    __total_size: int = 0
+    __index: OrderedDict[str, int]
+    __lock: threading.Lock
+    __index_lock: threading.Lock
+    __is_indexed: bool = False
+
+    def __init__(self, directory: Path, max_size: int, max_age: float) -> None:
+        self.__directory = directory
+        self.__max_size = max_size
+        self.__max_age = max_age
+        self.__index = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__index_lock = threading.Lock()
+
+    def __ensure_index(self) -> None:
+        """Build the index if needed, other threads wait until it is built"""
+        if self.__is_indexed:
+            return
+        with self.__index_lock:
+            if not self.__is_indexed:
+                self.__build_index()
+                self.__is_indexed = True
+
+    def __build_index(self) -> None:
+        """Build the LRU index from the files on disk, least recently used first"""
+        self.__directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        n_expired = 0
+        min_mtime = time.time() - self.__max_age
+        with os.scandir(self.__directory) as iterator:
+            for entry in iterator:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".part"):
+                    # Leftover of an interrupted write
+                    os.unlink(entry.path)
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime < min_mtime:
+                    os.unlink(entry.path)
+                    n_expired += 1
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        with self.__lock:
+            self.__index = OrderedDict((name, size) for _mtime, name, size in entries)
+            self.__total_size = sum(self.__index.values())
+        logging.debug(
+            "Image cache holds %d images (%d bytes), %d expired",
+            len(self.__index),
+            self.__total_size,
+            n_expired,
+        )
+
+    def read(self, key: ImageKey) -> Optional[bytes]:
+        """Get the encoded image, or None if not stored"""
+        self.__ensure_index()
+        name = key.get_file_name()
+        path = self.__directory / name
+        try:
+            if path.stat().st_mtime < time.time() - self.__max_age:
+                self.remove(key)
+                return None
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            with self.__lock:
+                self.__total_size -= self.__index.pop(name, 0)
+            return None
+        with self.__lock:
+            if name in self.__index:
+                self.__index.move_to_end(name)
+        return data
+
+    def remove(self, key: ImageKey) -> None:
+        """Remove an encoded image, if stored"""
+        self.__ensure_index()
+        name = key.get_file_name()
+        try:
+            os.unlink(self.__directory / name)
+        except FileNotFoundError:
+            pass
+        with self.__lock:
+            self.__total_size -= self.__index.pop(name, 0)
+
+    def write(self, key: ImageKey, data: bytes) -> None:
+        """Store an encoded image, evicting the least recently used if needed"""
+        self.__ensure_index()
+        name = key.get_file_name()
+        path = self.__directory / name
+        part_path = path.with_name(f"{name}.{threading.get_ident()}.part")
+        part_path.write_bytes(data)
+        part_path.replace(path)
+        evicted = []
+        with self.__lock:
+            self.__total_size += len(data) - self.__index.get(name, 0)
+            self.__index[name] = len(data)
+            self.__index.move_to_end(name)
+            while self.__total_size > self.__max_size and len(self.__index) > 1:
+                evicted_name, size = self.__index.popitem(last=False)
+                self.__total_size -= size
+                evicted.append(evicted_name)
+        for evicted_name in evicted:
+            try:
+                os.unlink(self.__directory / evicted_name)
+            except FileNotFoundError:
+                pass
+        if evicted:
+            logging.debug("Evicted %d images from the image cache", len(evicted))
+
+
+class _Waiter(NamedTuple):
+    callback: Callable[[Gdk.Texture], None]
+    error_callback: Callable[[Exception], None]
+    cancellable: Optional[Gio.Cancellable]
+
+
+class _LoadClaimedError(Exception):
+    """Error raised by a load task when another task of the same load started first"""
+
+
+class _PendingLoad:
+    """
+    A load of an image, shared by every requester of the same key.
+    It may have several tasks, when it was requested again more urgently,
+    in which case the first to start does the load.
+    """
+
+    cancellable: Gio.Cancellable
+    priority: TaskPriority
+    waiters: list[_Waiter]
+    handlers: list[tuple[Gio.Cancellable, int]]
+    __is_claimed: bool
+    __lock: threading.Lock
+
+    def __init__(self, priority: TaskPriority) -> None:
+        self.cancellable = Gio.Cancellable()
+        self.priority = priority
+        self.waiters = []
+        self.handlers = []
+        self.__is_claimed = False
+        self.__lock = threading.Lock()
+
+    def claim(self) -> None:
+        """Claim the load for the calling task, raises if another task did already"""
+        with self.__lock:
+            if self.__is_claimed:
+                raise _LoadClaimedError()
+            self.__is_claimed = True
+
+    def get_live_waiters(self) -> list[_Waiter]:
+        return [
+            waiter
+            for waiter in self.waiters
+            if waiter.cancellable is None or not waiter.cancellable.is_cancelled()
+        ]
+
+    def disconnect(self) -> None:
+        # Not using Gio.Cancellable.disconnect, it deadlocks from within a handler
+        for cancellable, handler in self.handlers:
+            GObject.signal_handler_disconnect(cancellable, handler)
+        self.handlers.clear()
+
+
+class ImageCache:
+    """
+    Two-tier cache of images: decoded textures in memory, encoded bytes on disk.
+
+    - Memory hits are delivered synchronously, so that widgets never flash empty
+    - Textures are decoded in worker threads, at the exact size of their key
+    - Images that can't be decoded are dropped, and their format isn't requested
+      anymore (see `src.image_format`), loads then fail with `ImageDecodeError`
+    - Concurrent loads of the same image are coalesced into one download
+    - Requesting a queued load more urgently (eg. a prefetched image becoming
+      visible) queues it again with the higher priority
+    - A coalesced download is only cancelled once all of its requesters are
+    - Must be used from the main thread, callbacks are called in the main loop
+    """
+
+    stats: DownloadStats
+
+    __memory: TextureLRU
+    __disk: ImageFileStore
+    __pending: dict[ImageKey, _PendingLoad]
+    __placeholders: OrderedDict[tuple[str, int, int], Gdk.Texture]
+
+    def __init__(
+        self, directory: Path, memory_size: int, disk_size: int, disk_max_age: float
+    ) -> None:
+        self.stats = DownloadStats()
+        self.__memory = TextureLRU(max_size=memory_size)
+        self.__disk = ImageFileStore(
+            directory=directory, max_size=disk_size, max_age=disk_max_age
+        )
+        self.__pending = {}
+        self.__placeholders = OrderedDict()
+
+    def lookup(self, key: ImageKey) -> Optional[Gdk.Texture]:
+        """Get an image from the memory tier, or None"""
+        return self.__memory.get(key)
+
+    def load(
+        self,
+        key: ImageKey,
+        download: Callable[[], bytes],
+        callback: Callable[[Gdk.Texture], None],
+        error_callback: Callable[[Exception], None],
+        cancellable: Optional[Gio.Cancellable] = None,
+        priority: TaskPriority = TaskPriority.VISIBLE_IMAGE,
+        group: Optional[str] = None,
+    ) -> None:
+        """
+        Load an image, from memory, disk or the network in that order.
+
+        `download` is called in a worker thread and must return the encoded image,
+        ideally at least as large as the key's size since it is cropped to it.
+        """
+
+        if (texture := self.__memory.get(key)) is not None:
+            callback(texture)
+            return
+
+        if cancellable is not None and cancellable.is_cancelled():
+            return
+
+        waiter = _Waiter(callback, error_callback, cancellable)
+        pending = self.__pending.get(key)
+        is_new = pending is None
+        if pending is None:
+            pending = self.__pending[key] = _PendingLoad(priority)
+        pending.waiters.append(waiter)
+        if cancellable is not None:
+            handler = cancellable.connect(
+                "cancelled", self.__on_waiter_cancelled, key, pending
+            )
+            pending.handlers.append((cancellable, handler))
+        if not is_new:
+            if priority >= pending.priority:
+                return
+            pending.priority = priority
+
+        task = Task(
+            main=self.__load_texture,
+            main_args=(key, download, pending),
+            callback=self.__on_load_success,
+            callback_args=(key, pending),
+            error_callback=self.__on_load_error,
+            error_callback_args=(key, pending),
+            cancellable=pending.cancellable,
+            priority=priority,
+            group=group,
+        )
+        task.run()
+
+    def load_placeholder(
+        self,
+        blur_hash: str,
+        width: int,
+        height: int,
+        callback: Callable[[Gdk.Texture], None],
+        cancellable: Optional[Gio.Cancellable] = None,
+    ) -> None:
+        """
+        Decode a BlurHash into a small placeholder texture, in a worker thread.
+        Memory hits are delivered synchronously, invalid hashes are only logged.
+        """
+
+        key = (blur_hash, width, height)
+        if (texture := self.__placeholders.get(key)) is not None:
+            self.__placeholders.move_to_end(key)
+            callback(texture)
+            return
+
+        def on_success(texture: Gdk.Texture) -> None:
+            self.__placeholders[key] = texture
+            while len(self.__placeholders) > PLACEHOLDER_MEMORY_COUNT:
+                self.__placeholders.popitem(last=False)
+            callback(texture)
+
+        def on_error(error: Exception) -> None:
+            logging.debug("Couldn't decode BlurHash %s: %s", blur_hash, error)
+
+        task = Task(
+            main=self.__decode_placeholder,
+            main_args=key,
+            callback=on_success,
+            error_callback=on_error,
+            cancellable=cancellable,
+            priority=TaskPriority.VISIBLE_IMAGE,
+        )
+        task.run()
+
+    @staticmethod
+    def __decode_placeholder(blur_hash: str, width: int, height: int) -> Gdk.Texture:
+        pixels = decode_blur_hash(blur_hash, width, height)
+        return Gdk.MemoryTexture.new(
+            width,
+            height,
+            Gdk.MemoryFormat.R8G8B8,
+            GLib.Bytes.new(pixels),
+            width * 3,
+        )
+
+    def __load_texture(
+        self, key: ImageKey, download: Callable[[], bytes], pending: _PendingLoad
+    ) -> Gdk.Texture:
+        """Get the image from disk or download it, then decode it to its size"""
+        pending.claim()
+        data = self.__disk.read(key)
+        if data is None:
+            data = download()
+            self.stats.record_download(key.image_format, len(data))
+            self.__disk.write(key, data)
+        try:
+            return _decode_texture(data, key.width, key.height)
+        except GLib.Error as error:
+            self.__disk.remove(key)
+            if key.image_format:
+                set_undecodable(key.image_format)
+            raise ImageDecodeError(key.image_format) from error
+
+    def __on_waiter_cancelled(self, _cancellable, key: ImageKey, pending: _PendingLoad):
+        if pending.get_live_waiters():
+            return
+        # Nobody wants that image anymore
+        pending.cancellable.cancel()
+        pending.disconnect()
+        if self.__pending.get(key) is pending:
+            del self.__pending[key]
+
+    def __finish(self, key: ImageKey, pending: _PendingLoad) -> list[_Waiter]:
+        pending.disconnect()
+        if self.__pending.get(key) is pending:
+            del self.__pending[key]
+        return pending.get_live_waiters()
+
+    def __on_load_success(
+        self, key: ImageKey, pending: _PendingLoad, texture: Gdk.Texture
+    ) -> None:
+        self.__memory.put(key, texture)
+        for waiter in self.__finish(key, pending):
+            waiter.callback(texture)
+
+    def __on_load_error(
+        self, key: ImageKey, pending: _PendingLoad, error: Exception
+    ) -> None:
+        if isinstance(error, _LoadClaimedError):
+            # Another task of the load started first, it delivers the result
+            return
+        for waiter in self.__finish(key, pending):
+            waiter.error_callback(error)
@@ -0,0 +1,101 @@
+import logging
+import os
+import threading
+from functools import cache
+
+from gi.repository import GdkPixbuf
+
+# Values of the Jellyfin ImageFormat enum, not imported since that loads every model
+WEBP = "Webp"
+JPEG = "Jpg"
+PNG = "Png"
+
+_MIME_TYPES = {
+    WEBP: "image/webp",
+    JPEG: "image/jpeg",
+    PNG: "image/png",
+}
+
+# Formats of the images without transparency, smallest first.
+# PNG is the last resort, every GdkPixbuf build can decode it.
+OPAQUE_IMAGE_FORMATS = (WEBP, JPEG, PNG)
+
+# Image types that may be transparent, shown over other content
+TRANSPARENT_IMAGE_TYPES = frozenset(("Logo", "Art", "Disc"))
+
+# Quality of the lossy formats, from 0 to 100.
+# May be overridden with the `MARMALADE_IMAGE_QUALITY` environment variable.
+DEFAULT_IMAGE_QUALITY = 90
+
+_undecodable_formats: set[str] = set()
+_undecodable_formats_lock = threading.Lock()
+
+
+@cache
+def _get_loader_formats() -> frozenset[str]:
+    """Get the formats that the installed GdkPixbuf loaders can decode"""
+    mime_types = {
+        mime_type
+        for pixbuf_format in GdkPixbuf.Pixbuf.get_formats()
+        if not pixbuf_format.is_disabled()
+        for mime_type in pixbuf_format.get_mime_types()
+    }
+    formats = frozenset(
+        image_format
+        for image_format, mime_type in _MIME_TYPES.items()
+        if mime_type in mime_types
+    )
+    logging.debug("Decodable image formats: %s", ", ".join(sorted(formats)))
+    return formats
+
+
+@cache
+def get_image_quality() -> int:
+    """Get the quality requested for lossy formats"""
+    try:
+        quality = int(os.environ.get("MARMALADE_IMAGE_QUALITY", DEFAULT_IMAGE_QUALITY))
+    except ValueError:
+        logging.warning("Invalid image quality, using %d", DEFAULT_IMAGE_QUALITY)
+        return DEFAULT_IMAGE_QUALITY
+    return min(100, max(1, quality))
+
+
+def get_image_format(image_type: str) -> str:
+    """
+    Get the format to request an image type in.
+
+    - Images that may be transparent are requested as PNG
+    - Others in the smallest format that can be decoded locally
+    """
+    if image_type in TRANSPARENT_IMAGE_TYPES:
+        return PNG
+    decodable = _get_loader_formats()
+    with _undecodable_formats_lock:
+        for image_format in OPAQUE_IMAGE_FORMATS:
+            if image_format in decodable and image_format not in _undecodable_formats:
+                return image_format
+    return PNG
+
+
+def get_image_params(image_format: str) -> dict[str, str | int]:
+    """Get the query parameters requesting an image in a format"""
+    params: dict[str, str | int] = {"format": image_format}
+    if image_format != PNG:
+        params["quality"] = get_image_quality()
+    return params
+
+
+def set_undecodable(image_format: str) -> None:
+    """
+    Stop requesting a format, eg. because its loader failed to decode an image.
+    Safe to call from worker threads.
+    """
+    if image_format == PNG:
+        return
+    with _undecodable_formats_lock:
+        if image_format in _undecodable_formats:
+            return
+        _undecodable_formats.add(image_format)
+    logging.warning(
+        "Couldn't decode a %s image, falling back to another format", image_format
+    )
@@ -0,0 +1,144 @@
+import logging
+from typing import Any, Iterable, Optional
+
+from gi.repository import GObject
+
+# Jellyfin item fields kept in the records, and their record property
+ITEM_FIELDS: dict[str, str] = {
+    "Name": "name",
+    "Type": "item_type",
+    "CollectionType": "collection_type",
+    "SeriesName": "series_name",
+    "ProductionYear": "production_year",
+    "ImageTags": "image_tags",
+    "ImageBlurHashes": "image_blur_hashes",
+}
+
+# Jellyfin user data fields kept in the records, and their record property
+USER_DATA_FIELDS: dict[str, str] = {
+    "Played": "played",
+    "IsFavorite": "is_favorite",
+    "PlaybackPositionTicks": "playback_position_ticks",
+    "PlayedPercentage": "played_percentage",
+    "UnplayedItemCount": "unplayed_item_count",
+}
+
+
+class ItemRecord(GObject.Object):
+    """
+    Compact record of a Jellyfin item, holding what the widgets display.
+
+    - Updated in place by its `ItemStore`, never replaced
+    - Emits "changed" once per update, with the names of the changed properties
+    """
+
+    __gtype_name__ = "MarmaladeItemRecord"
+
+    item_id = GObject.Property(type=str, default="")
+    name = GObject.Property(type=str, default="")
+    item_type = GObject.Property(type=str, default="")
+    collection_type = GObject.Property(type=str, default="")
+    series_name = GObject.Property(type=str, default="")
+    production_year = GObject.Property(type=int, default=0)
+    image_tags = GObject.Property(type=object)
+    image_blur_hashes = GObject.Property(type=object)
+    played = GObject.Property(type=bool, default=False)
+    is_favorite = GObject.Property(type=bool, default=False)
+    playback_position_ticks = GObject.Property(type=GObject.TYPE_INT64, default=0)
+    played_percentage = GObject.Property(type=float, default=0.0)
+    unplayed_item_count = GObject.Property(type=int, default=0)
+
+    @GObject.Signal(name="changed", arg_types=[object])
+    def changed_signal(self, _names: list[str]):
+        """Signal emitted when the record is updated"""
+
+    def __init__(self, item_id: str, **kwargs) -> None:
+        super().__init__(item_id=item_id, **kwargs)
+        self.image_tags = {}
+        self.image_blur_hashes = {}
+
+    def get_image_tag(self, image_type: str) -> str:
+        """Get the tag of one of the item's images, or an empty string"""
+        return (self.image_tags or {}).get(image_type, "")
+
+    def get_image_blur_hash(self, image_type: str) -> str:
+        """Get the BlurHash of one of the item's images, or an empty string"""
+        hashes = (self.image_blur_hashes or {}).get(image_type) or {}
+        return hashes.get(self.get_image_tag(image_type), "")
+
+    def __merge_fields(
+        self, data: dict[str, Any], fields: dict[str, str], changed: list[str]
+    ) -> None:
+        for field, name in fields.items():
+            if field not in data:
+                continue
+            value = data[field]
+            if value is None:
+                value = self.find_property(name).get_default_value()
+            if value != self.get_property(name):
+                self.set_property(name, value)
+                changed.append(name)
+
+    def merge(self, data: dict[str, Any]) -> bool:
+        """
+        Update the record from a (possibly partial) Jellyfin item dict.
+        Only the fields present in the dict are updated.
+        Returns whether anything changed.
+        """
+        changed: list[str] = []
+        with self.freeze_notify():
+            self.__merge_fields(data, ITEM_FIELDS, changed)
+            if isinstance(user_data := data.get("UserData"), dict):
+                self.__merge_fields(user_data, USER_DATA_FIELDS, changed)
+        if changed:
+            self.emit("changed", changed)
+        return bool(changed)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the record as a Jellyfin item dict, that `merge` accepts"""
+        data: dict[str, Any] = {"Id": self.item_id}
+        for field, name in ITEM_FIELDS.items():
+            data[field] = self.get_property(name)
+        data["UserData"] = {
+            field: self.get_property(name) for field, name in USER_DATA_FIELDS.items()
+        }
+        return data
+
+
+class ItemStore:
+    """
+    Store of the items seen during a session, keyed by item id.
+
+    - Each item has a single `ItemRecord`, shared by every widget showing it
+    - Merging an item updates its record, refreshing all those widgets at once
+    - Must be used from the main thread, as the records emit signals
+    """
+
+    __records: dict[str, ItemRecord]
+
+    def __init__(self) -> None:
+        self.__records = {}
+
+    def get(self, item_id: str) -> Optional[ItemRecord]:
+        """Get an item's record, or None if it wasn't merged yet"""
+        return self.__records.get(item_id)
+
+    def merge(self, data: dict[str, Any]) -> ItemRecord:
+        """
+        Merge a (possibly partial) Jellyfin item dict, eg. from `BaseItemDto.to_dict`.
+        Returns the item's record.
+        """
+        item_id = data["Id"]
+        if (record := self.__records.get(item_id)) is None:
+            record = self.__records[item_id] = ItemRecord(item_id)
+        record.merge(data)
+        return record
+
+    def merge_all(self, items: Iterable[dict[str, Any]]) -> list[ItemRecord]:
+        """Merge Jellyfin item dicts, returns their records in the same order"""
+        return [self.merge(data) for data in items]
+
+    def clear(self) -> None:
+        """Forget all the records"""
+        logging.debug("Clearing %d item records", len(self.__records))
+        self.__records.clear()
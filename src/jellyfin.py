@@ -1,12 +1,32 @@
+import logging
 import socket
+import threading
 import time
-from typing import Optional
+from typing import Iterator, Optional, cast
 
-from hishel import CacheTransport, FileStorage
-from httpx import HTTPTransport
+import httpx
+from gi.repository import Gio
+from httpx import HTTPTransport, Limits
 from jellyfin_api_client.client import Client
 
 from src import shared
+from src.http_cache import HttpCache
+from src.task import TaskCancelledError, get_current_cancellable, raise_if_cancelled
+
+HTTP_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+# Interval at which a request waiting for an identical one checks for cancellation
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+# A session mostly talks to a single host, keep a few warm connections to it
+HTTP_CONNECTION_LIMITS = Limits(
+    max_connections=8,
+    max_keepalive_connections=8,
+    keepalive_expiry=120,
+)
+
+_http_cache: Optional[HttpCache] = None
+_http_cache_lock = threading.Lock()
 
 
 def make_device_id() -> str:
@@ -20,6 +40,213 @@ def make_device_id() -> str:
     return device_id
 
 
+def get_http_cache() -> HttpCache:
+    """Get the HTTP cache shared by all the clients, creating it if needed"""
+    global _http_cache  # pylint: disable=global-statement
+    with _http_cache_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache(
+                directory=shared.app_cache_dir / "http-cache",
+                max_size=HTTP_CACHE_MAX_SIZE,
+            )
+        return _http_cache
+
+
+class CancellableStream(httpx.SyncByteStream):
+    """Response body stream that stops reading when its cancellable is cancelled"""
+
+    __stream: httpx.SyncByteStream
+    __cancellable: Gio.Cancellable
+
+    def __init__(self, stream: httpx.SyncByteStream, cancellable: Gio.Cancellable):
+        self.__stream = stream
+        self.__cancellable = cancellable
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.__stream:
+            if self.__cancellable.is_cancelled():
+                # Closing a partially read response drops its connection
+                self.__stream.close()
+                raise TaskCancelledError()
+            yield chunk
+
+    def close(self) -> None:
+        self.__stream.close()
+
+
+class CancellableTransport(httpx.BaseTransport):
+    """
+    Transport aborting the requests of cancelled tasks.
+
+    The cancellable of the task making the request is checked before sending it,
+    then between every chunk of the response body.
+    """
+
+    __transport: httpx.BaseTransport
+
+    def __init__(self, transport: httpx.BaseTransport) -> None:
+        self.__transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        cancellable = get_current_cancellable()
+        raise_if_cancelled(cancellable)
+        response = self.__transport.handle_request(request)
+        if cancellable is None:
+            return response
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=CancellableStream(response.stream, cancellable),  # type: ignore
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        self.__transport.close()
+
+
+class SingleFlightStats:
+    """Thread safe counters of the requests seen by single-flight transports"""
+
+    __lock: threading.Lock
+    sent: int = 0
+    saved: int = 0
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+
+    def record_sent(self) -> None:
+        with self.__lock:
+            self.sent += 1
+
+    def record_saved(self) -> None:
+        with self.__lock:
+            self.saved += 1
+
+    def __str__(self) -> str:
+        return "%d requests sent, %d saved by waiting for an identical one" % (
+            self.sent,
+            self.saved,
+        )
+
+
+_single_flight_stats = SingleFlightStats()
+
+
+def get_single_flight_stats() -> SingleFlightStats:
+    """Get the counters shared by all the clients' single-flight transports"""
+    return _single_flight_stats
+
+
+class _Flight:
+    """An in-flight request, whose outcome is shared with identical requests"""
+
+    done: threading.Event
+    response: Optional[httpx.Response] = None
+    content: bytes = b""
+    error: Optional[Exception] = None
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+    @property
+    def is_abandoned(self) -> bool:
+        """Whether the request ended without an outcome, eg. it was cancelled"""
+        return self.response is None and self.error is None
+
+    def make_response(self) -> httpx.Response:
+        """Get a copy of the shared response, with its own body stream"""
+        response = cast(httpx.Response, self.response)
+        extensions = dict(response.extensions)
+        extensions.pop("network_stream", None)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=httpx.ByteStream(self.content),
+            extensions=extensions,
+        )
+
+
+class SingleFlightTransport(httpx.BaseTransport):
+    """
+    Transport sending only one of identical concurrent GET requests.
+
+    - Requests are identical when their URL (with params) and authorization match
+    - Later callers wait for the in-flight request and get a copy of its response
+    - The shared response's body is read fully before being handed out
+    - Errors are shared too, but if the sender is cancelled the waiters retry
+    """
+
+    __transport: httpx.BaseTransport
+    __stats: SingleFlightStats
+    __flights: dict[tuple[str, Optional[str]], _Flight]
+    __lock: threading.Lock
+
+    def __init__(
+        self, transport: httpx.BaseTransport, stats: SingleFlightStats
+    ) -> None:
+        self.__transport = transport
+        self.__stats = stats
+        self.__flights = {}
+        self.__lock = threading.Lock()
+
+    def __send(
+        self, key: tuple[str, Optional[str]], flight: _Flight, request: httpx.Request
+    ) -> httpx.Response:
+        self.__stats.record_sent()
+        try:
+            response = self.__transport.handle_request(request)
+            try:
+                # Raw bytes, the waiters' clients decode them on their own
+                flight.content = b"".join(response.stream)  # type: ignore
+            finally:
+                response.close()
+            flight.response = response
+        except TaskCancelledError:
+            raise
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            # New requests must not get this outcome once it's handed out
+            with self.__lock:
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+            flight.done.set()
+        return flight.make_response()
+
+    @staticmethod
+    def __wait(flight: _Flight) -> None:
+        """Wait for a flight to end, unless the calling task is cancelled"""
+        cancellable = get_current_cancellable()
+        while not flight.done.wait(SINGLE_FLIGHT_POLL_INTERVAL):
+            raise_if_cancelled(cancellable)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "GET":
+            return self.__transport.handle_request(request)
+        key = (str(request.url), request.headers.get("X-Emby-Authorization"))
+        while True:
+            with self.__lock:
+                flight = self.__flights.get(key)
+                if flight is None:
+                    flight = self.__flights[key] = _Flight()
+                    is_sender = True
+                else:
+                    is_sender = False
+            if is_sender:
+                return self.__send(key, flight, request)
+            self.__wait(flight)
+            if flight.is_abandoned:
+                continue
+            self.__stats.record_saved()
+            if flight.error is not None:
+                raise flight.error
+            return flight.make_response()
+
+    def close(self) -> None:
+        self.__transport.close()
+
+
 class JellyfinClient(Client):
     """
     Subclass of the Jellyfin API Client client.
@@ -27,6 +254,10 @@ class JellyfinClient(Client):
     - Supports proper creation of the Jellyfin/Emby authorization header
     - Supports generating a device_id on the fly
     - The client can be authenticated or not, with the same constructor
+    - Responses are cached on disk, following the policies in `src.http_cache`
+    - Prefer getting clients from `shared.clients` to share connection pools
+    - Requests made from a cancelled `Task` are aborted, closing their connection
+    - Identical concurrent GET requests are sent once, see `SingleFlightTransport`
     """
 
     _version: str = "1.9.1"
@@ -42,16 +273,11 @@ class JellyfinClient(Client):
         token: Optional[str] = None,
         **kwargs,
     ):
-        # TODO enable HTTP caching
-        # httpx_args = {
-        #     "transport": CacheTransport(
-        #         transport=HTTPTransport(),
-        #         storage=FileStorage(
-        #             base_path=shared.app_cache_dir / "http-cache",
-        #         ),
-        #     ),
-        # }
-        httpx_args = {}
+        transport = CancellableTransport(HTTPTransport(limits=HTTP_CONNECTION_LIMITS))
+        transport = SingleFlightTransport(
+            get_http_cache().wrap(transport), stats=get_single_flight_stats()
+        )
+        httpx_args = {"transport": transport}
         super().__init__(*args, **kwargs, httpx_args=httpx_args)
         # Set the client headers
         self._device = socket.gethostname()
@@ -79,6 +305,16 @@ class JellyfinClient(Client):
         header_value = f"MediaBrowser {', '.join(parts)}"
         self._headers["X-Emby-Authorization"] = header_value
 
+    @property
+    def session_key(self) -> tuple[str, str, Optional[str]]:
+        """Key identifying the client's session (address, device id, token)"""
+        return (self._base_url, self._device_id, self._token)
+
+    def close(self) -> None:
+        """Close the client's connection pool"""
+        if self._client is not None:
+            self._client.close()
+
     def __str__(self) -> str:
         return '"%s" Jellyfin Client v%s for %s (%s) on %s' % (
             self._client_name,
@@ -87,3 +323,69 @@ class JellyfinClient(Client):
             self._device_id,
             self._base_url,
         )
+
+
+class JellyfinClientRegistry:
+    """
+    Process-wide registry of Jellyfin clients.
+
+    Hands out a single long-lived client per (address, device_id, token) session,
+    so that every widget talking to a server shares the same connection pool.
+    Clients must be closed through the registry when their session ends.
+    """
+
+    __clients: dict[tuple[str, str, Optional[str]], JellyfinClient]
+    __lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.__clients = {}
+        self.__lock = threading.Lock()
+
+    def __make_key(
+        self, address: str, device_id: Optional[str], token: Optional[str]
+    ) -> tuple[str, str, Optional[str]]:
+        return (address, device_id or JellyfinClient._device_id, token)
+
+    def get(
+        self,
+        address: str,
+        device_id: Optional[str] = None,
+        token: Optional[str] = None,
+    ) -> JellyfinClient:
+        """Get the client for a session, creating it if needed"""
+        key = self.__make_key(address, device_id, token)
+        with self.__lock:
+            client = self.__clients.get(key)
+            if client is None:
+                client = JellyfinClient(address, device_id=device_id, token=token)
+                # Create the httpx client now, so that threads never race to do it
+                client.get_httpx_client()
+                self.__clients[key] = client
+                logging.debug("Created client %s", client)
+        return client
+
+    def close(
+        self,
+        address: str,
+        device_id: Optional[str] = None,
+        token: Optional[str] = None,
+    ) -> None:
+        """Close and forget the client for a session, if any"""
+        key = self.__make_key(address, device_id, token)
+        with self.__lock:
+            client = self.__clients.pop(key, None)
+        if client is not None:
+            logging.debug("Closing client %s", client)
+            client.close()
+
+    def close_client(self, client: JellyfinClient) -> None:
+        """Close and forget a client obtained from the registry"""
+        self.close(*client.session_key)
+
+    def close_all(self) -> None:
+        """Close all the clients"""
+        with self.__lock:
+            clients = list(self.__clients.values())
+            self.__clients.clear()
+        for client in clients:
+            client.close()
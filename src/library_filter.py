@@ -0,0 +1,173 @@
+from array import array
+from itertools import compress
+from typing import Iterable, NamedTuple, Sequence
+
+from src.database.library import LibraryItem
+
+SORT_BY_NAME = "name"
+SORT_BY_YEAR = "year"
+SORT_BY_RATING = "rating"
+SORT_BY_RUNTIME = "runtime"
+SORT_BY_DATE_ADDED = "date-added"
+SORT_KEYS = (
+    SORT_BY_NAME,
+    SORT_BY_YEAR,
+    SORT_BY_RATING,
+    SORT_BY_RUNTIME,
+    SORT_BY_DATE_ADDED,
+)
+
+# Translates a bitset's binary string to a selector byte per item
+_BITS_TO_SELECTORS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+class LibraryFilter(NamedTuple):
+    """
+    Filter of a library's items.
+    An item must match every filter, and one of the values of a set.
+    Empty sets don't filter.
+    """
+
+    genres: frozenset[str] = frozenset()
+    tags: frozenset[str] = frozenset()
+    official_ratings: frozenset[str] = frozenset()
+    years: frozenset[int] = frozenset()
+    unplayed_only: bool = False
+
+
+def _make_bitset(indices: Iterable[int], size: int) -> int:
+    """Make a bitset with the bits of the given indices set"""
+    buffer = bytearray((size + 7) // 8)
+    for index in indices:
+        buffer[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _make_bitsets(values: Iterable[Iterable], size: int) -> dict:
+    """Make a bitset per value, from the values of each item"""
+    indices: dict = {}
+    for index, item_values in enumerate(values):
+        for value in item_values:
+            indices.setdefault(value, []).append(index)
+    return {value: _make_bitset(ids, size) for value, ids in indices.items()}
+
+
+def _parse_date(date: str | None) -> int:
+    """Parse an ISO 8601 date to a sortable YYYYMMDDhhmmss integer, 0 if unknown"""
+    if not date:
+        return 0
+    return int("".join(filter(str.isdigit, date[:19])))
+
+
+class LibraryColumns:
+    """
+    Columnar representation of a library's items, to sort and filter them
+    in a few milliseconds, even for large libraries.
+
+    - Sort keys are typed arrays, and the sort orders are computed upfront
+    - Filter values are bitsets (Python ints, with bit i set for item i),
+      so that a filter is a few big integer operations instead of a loop
+    - Results are permutations of the item indices, to map to the items
+    - Should be built in a worker thread, then is read only
+    """
+
+    __size: int
+    __orders: dict[tuple[str, bool], list[int]]
+    __all: int
+    __unplayed: int
+    __genres: dict[str, int]
+    __tags: dict[str, int]
+    __official_ratings: dict[str, int]
+    __years: dict[int, int]
+
+    def __init__(self, items: Sequence[LibraryItem]) -> None:
+        size = self.__size = len(items)
+
+        # Sort keys
+        columns: dict[str, Sequence] = {
+            SORT_BY_NAME: [(item.sort_name or item.name).casefold() for item in items],
+            SORT_BY_YEAR: array("i", (item.production_year or 0 for item in items)),
+            SORT_BY_RATING: array("d", (item.community_rating or 0 for item in items)),
+            SORT_BY_RUNTIME: array("q", (item.run_time_ticks or 0 for item in items)),
+            SORT_BY_DATE_ADDED: array(
+                "q", (_parse_date(item.date_created) for item in items)
+            ),
+        }
+        # The sorts are stable, equal keys keep the name order
+        self.__orders = {}
+        by_name = sorted(range(size), key=columns[SORT_BY_NAME].__getitem__)
+        for key, column in columns.items():
+            for descending in (False, True):
+                self.__orders[key, descending] = sorted(
+                    by_name, key=column.__getitem__, reverse=descending
+                )
+
+        # Filter bitsets
+        self.__all = (1 << size) - 1
+        self.__unplayed = _make_bitset(
+            (index for index, item in enumerate(items) if not item.played), size
+        )
+        self.__genres = _make_bitsets((item.genres for item in items), size)
+        self.__tags = _make_bitsets((item.tags for item in items), size)
+        self.__official_ratings = _make_bitsets(
+            ((item.official_rating,) if item.official_rating else () for item in items),
+            size,
+        )
+        self.__years = _make_bitsets(
+            ((item.production_year,) if item.production_year else () for item in items),
+            size,
+        )
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def get_genres(self) -> list[str]:
+        return sorted(self.__genres)
+
+    def get_tags(self) -> list[str]:
+        return sorted(self.__tags)
+
+    def get_official_ratings(self) -> list[str]:
+        return sorted(self.__official_ratings)
+
+    def get_years(self) -> list[int]:
+        return sorted(self.__years)
+
+    def __match_any(self, bitsets: dict, values: frozenset) -> int:
+        """Get the bitset of the items matching any of the values"""
+        if not values:
+            return self.__all
+        mask = 0
+        for value in values:
+            mask |= bitsets.get(value, 0)
+        return mask
+
+    def get_mask(self, library_filter: LibraryFilter) -> int:
+        """Get the bitset of the items matching a filter"""
+        mask = self.__unplayed if library_filter.unplayed_only else self.__all
+        mask &= self.__match_any(self.__genres, library_filter.genres)
+        mask &= self.__match_any(self.__tags, library_filter.tags)
+        mask &= self.__match_any(
+            self.__official_ratings, library_filter.official_ratings
+        )
+        mask &= self.__match_any(self.__years, library_filter.years)
+        return mask
+
+    def query(
+        self,
+        sort_by: str = SORT_BY_NAME,
+        descending: bool = False,
+        library_filter: LibraryFilter = LibraryFilter(),
+    ) -> list[int]:
+        """Get the indices of the items matching a filter, in sort order"""
+        order = self.__orders[sort_by, descending]
+        mask = self.get_mask(library_filter)
+        if mask == self.__all:
+            return list(order)
+        if not mask:
+            return []
+        # Item i is selected by the byte i, reversed since the binary string
+        # starts with the most significant bit
+        bits = format(mask, f"0{self.__size}b")[::-1]
+        selectors = bits.encode("ascii").translate(_BITS_TO_SELECTORS)
+        return list(compress(order, map(selectors.__getitem__, order)))
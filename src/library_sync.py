@@ -0,0 +1,299 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Any, Iterator
+
+from jellyfin_api_client.errors import UnexpectedStatus
+
+from src.database.library import LibraryDatabase, LibraryItem
+from src.database.search_index import SearchIndex, SearchItem
+from src.jellyfin import JellyfinClient
+from src.task import raise_if_cancelled
+
+# Minimum time between two syncs, full or delta
+LIBRARY_DELTA_SYNC_INTERVAL_NS = 5 * 60 * 10**9
+# Maximum time between two full syncs, that remove the deleted items
+LIBRARY_FULL_SYNC_INTERVAL_NS = 24 * 60 * 60 * 10**9
+# Deltas start that long before the previous sync, in case the clocks differ
+LIBRARY_DELTA_OVERLAP_NS = 60 * 60 * 10**9
+LIBRARY_SYNC_PAGE_SIZE = 500
+
+LIBRARY_ITEM_TYPES = (
+    "Movie",
+    "Series",
+    "Episode",
+    "BoxSet",
+    "MusicAlbum",
+    "MusicArtist",
+    "Audio",
+    "MusicVideo",
+    "Book",
+)
+
+# Fields that the items don't include by default
+LIBRARY_ITEM_FIELDS = (
+    "SortName",
+    "DateCreated",
+    "Genres",
+    "Tags",
+    "OriginalTitle",
+    "People",
+)
+
+# Libraries that aren't synced
+EXCLUDED_COLLECTION_TYPES = ("livetv",)
+
+
+def query_items(client: JellyfinClient, user_id: str, **params) -> dict[str, Any]:
+    """Query the /Items endpoint for library items, returning the raw JSON result"""
+    params = {
+        "userId": user_id,
+        "recursive": True,
+        "includeItemTypes": ",".join(LIBRARY_ITEM_TYPES),
+        "enableImageTypes": "Primary",
+        "imageTypeLimit": 1,
+        "enableUserData": False,
+        **params,
+    }
+    res = client.get_httpx_client().get("/Items", params=params)
+    if res.status_code != HTTPStatus.OK:
+        raise UnexpectedStatus(res.status_code, res.content)
+    return res.json()
+
+
+def get_library_item(library_id: str, data: dict[str, Any]) -> LibraryItem:
+    """Get the stored fields of a Jellyfin item dict"""
+    user_data = data.get("UserData") or {}
+    return LibraryItem(
+        library_id=library_id,
+        item_id=data["Id"],
+        item_type=data.get("Type") or "",
+        name=data.get("Name") or "",
+        sort_name=data.get("SortName") or "",
+        series_name=data.get("SeriesName") or "",
+        production_year=data.get("ProductionYear"),
+        premiere_date=data.get("PremiereDate"),
+        date_created=data.get("DateCreated"),
+        official_rating=data.get("OfficialRating") or "",
+        community_rating=data.get("CommunityRating"),
+        run_time_ticks=data.get("RunTimeTicks"),
+        genres=tuple(data.get("Genres") or ()),
+        tags=tuple(data.get("Tags") or ()),
+        image_tags=data.get("ImageTags") or {},
+        image_blur_hashes=data.get("ImageBlurHashes") or {},
+        played=bool(user_data.get("Played")),
+        is_favorite=bool(user_data.get("IsFavorite")),
+        playback_position_ticks=user_data.get("PlaybackPositionTicks") or 0,
+        played_percentage=user_data.get("PlayedPercentage") or 0.0,
+        unplayed_item_count=user_data.get("UnplayedItemCount") or 0,
+    )
+
+
+def get_search_item(data: dict[str, Any]) -> SearchItem:
+    """Get the searchable fields of a Jellyfin item dict"""
+    people = " ".join(person.get("Name") or "" for person in data.get("People") or [])
+    primary_image_tag = (data.get("ImageTags") or {}).get("Primary", "")
+    primary_blur_hashes = (data.get("ImageBlurHashes") or {}).get("Primary") or {}
+    return SearchItem(
+        item_id=data["Id"],
+        item_type=data.get("Type") or "",
+        name=data.get("Name") or "",
+        original_title=data.get("OriginalTitle") or "",
+        people=people,
+        genres=" ".join(data.get("Genres") or []),
+        production_year=data.get("ProductionYear"),
+        primary_image_tag=primary_image_tag,
+        primary_image_blur_hash=primary_blur_hashes.get(primary_image_tag, ""),
+    )
+
+
+def _format_date(timestamp_ns: int) -> str:
+    """Format a local timestamp as an ISO 8601 UTC date, for the Jellyfin API"""
+    date = datetime.fromtimestamp(timestamp_ns / 10**9, tz=timezone.utc)
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class LibrarySync:
+    """
+    Background sync of a user's library items into the local database.
+
+    - The first sync fetches every item of every library, in large pages
+    - Later syncs only fetch the deltas, items whose metadata changed through
+      `minDateLastSaved` and items whose user data changed
+      through `minDateLastSavedForUser`
+    - Deltas can't see deleted items, so a full sync runs when the item counts
+      differ from the server's, and at least daily
+    - The search index is filled along the way
+    - Must be run in a worker thread, aborts when its task is cancelled
+    """
+
+    __library: LibraryDatabase
+    __search_index: SearchIndex
+    __client: JellyfinClient
+    __user_id: str
+    __lock: threading.Lock
+
+    def __init__(
+        self,
+        library: LibraryDatabase,
+        search_index: SearchIndex,
+        client: JellyfinClient,
+        user_id: str,
+    ) -> None:
+        self.__library = library
+        self.__search_index = search_index
+        self.__client = client
+        self.__user_id = user_id
+        self.__lock = threading.Lock()
+
+    def __get_address(self) -> str:
+        return self.__client._base_url
+
+    def __query_libraries(self) -> list[str]:
+        """Get the ids of the user's synced libraries"""
+        res = self.__client.get_httpx_client().get(
+            "/UserViews", params={"userId": self.__user_id}
+        )
+        if res.status_code != HTTPStatus.OK:
+            raise UnexpectedStatus(res.status_code, res.content)
+        return [
+            view["Id"]
+            for view in res.json().get("Items") or []
+            if view.get("CollectionType") not in EXCLUDED_COLLECTION_TYPES
+        ]
+
+    def __query_pages(self, library_id: str, **params) -> Iterator[list[dict]]:
+        """Query a library's items page by page"""
+        start_index = 0
+        while True:
+            raise_if_cancelled()
+            result = query_items(
+                self.__client,
+                self.__user_id,
+                parentId=library_id,
+                fields=",".join(LIBRARY_ITEM_FIELDS),
+                enableUserData=True,
+                sortBy="SortName",
+                startIndex=start_index,
+                limit=LIBRARY_SYNC_PAGE_SIZE,
+                **params,
+            )
+            items = result.get("Items") or []
+            if items:
+                yield items
+            start_index += len(items)
+            if not items or start_index >= result.get("TotalRecordCount", 0):
+                break
+
+    def __save_page(
+        self, library_id: str, sync_timestamp: int, items: list[dict]
+    ) -> None:
+        address = self.__get_address()
+        self.__library.save_items(
+            address,
+            self.__user_id,
+            sync_timestamp,
+            [get_library_item(library_id, data) for data in items],
+        )
+        self.__search_index.save_items(
+            address,
+            self.__user_id,
+            sync_timestamp,
+            [get_search_item(data) for data in items],
+        )
+
+    def __full_sync(self, libraries: list[str], sync_timestamp: int) -> None:
+        """Fetch every item, then remove the items that weren't seen"""
+        address = self.__get_address()
+        n_items = 0
+        for library_id in libraries:
+            for items in self.__query_pages(library_id):
+                self.__save_page(library_id, sync_timestamp, items)
+                n_items += len(items)
+        self.__library.finish_full_sync(address, self.__user_id, sync_timestamp)
+        self.__search_index.finish_sync(address, self.__user_id, sync_timestamp)
+        logging.debug("Full library sync: %d items", n_items)
+
+    def __delta_sync(
+        self, libraries: list[str], sync_timestamp: int, since_timestamp: int
+    ) -> None:
+        """Fetch the items changed since a previous sync"""
+        since = _format_date(since_timestamp - LIBRARY_DELTA_OVERLAP_NS)
+        n_items = 0
+        for library_id in libraries:
+            for params in (
+                {"minDateLastSaved": since},
+                {"minDateLastSavedForUser": since},
+            ):
+                for items in self.__query_pages(library_id, **params):
+                    self.__save_page(library_id, sync_timestamp, items)
+                    n_items += len(items)
+        logging.debug("Delta library sync since %s: %d items", since, n_items)
+
+    def __is_complete(self, libraries: list[str]) -> bool:
+        """Check that the local item counts match the server's"""
+        counts = self.__library.count_items(self.__get_address(), self.__user_id)
+        if set(counts) - set(libraries):
+            return False
+        for library_id in libraries:
+            raise_if_cancelled()
+            result = query_items(
+                self.__client,
+                self.__user_id,
+                parentId=library_id,
+                limit=0,
+                enableTotalRecordCount=True,
+            )
+            if result.get("TotalRecordCount", 0) != counts.get(library_id, 0):
+                return False
+        return True
+
+    def __sync(self, force_full: bool) -> None:
+        address = self.__get_address()
+        sync_timestamp = time.time_ns()
+        state = self.__library.get_sync_state(address, self.__user_id)
+        if (
+            not force_full
+            and state is not None
+            and sync_timestamp - state.delta_sync_timestamp
+            < LIBRARY_DELTA_SYNC_INTERVAL_NS
+        ):
+            return
+
+        start = time.perf_counter()
+        libraries = self.__query_libraries()
+        if (
+            force_full
+            or state is None
+            or sync_timestamp - state.full_sync_timestamp
+            >= LIBRARY_FULL_SYNC_INTERVAL_NS
+        ):
+            self.__full_sync(libraries, sync_timestamp)
+        else:
+            self.__delta_sync(libraries, sync_timestamp, state.delta_sync_timestamp)
+            if self.__is_complete(libraries):
+                self.__library.finish_delta_sync(
+                    address, self.__user_id, sync_timestamp
+                )
+            else:
+                logging.debug("Library item counts differ, running a full sync")
+                self.__full_sync(libraries, sync_timestamp)
+        logging.debug(
+            "Synced the library of %s in %.1f s",
+            address,
+            time.perf_counter() - start,
+        )
+
+    def sync(self, force_full: bool = False) -> None:
+        """
+        Sync the library items, if not synced recently unless forced.
+        Does nothing if a sync is already running.
+        """
+        if not self.__lock.acquire(blocking=False):
+            return
+        try:
+            self.__sync(force_full)
+        finally:
+            self.__lock.release()
@@ -0,0 +1,163 @@
+# queue_logging.py
+#
+# Copyright 2023 Geoffrey Coulaud
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import threading
+from enum import StrEnum
+from logging import LogRecord, StreamHandler
+from logging.handlers import QueueHandler, QueueListener
+from queue import Empty, Full, Queue
+
+
+class DropPolicy(StrEnum):
+    """What to do with a record when the log queue is full"""
+
+    BLOCK = "block"
+    DROP_NEW = "drop-new"
+    DROP_OLD = "drop-old"
+
+
+class BatchedStreamHandler(StreamHandler):
+    """
+    A stream handler that doesn't flush after every record.
+    Meant to be used behind a BatchingQueueListener, that flushes after each batch.
+    """
+
+    def emit(self, record: LogRecord) -> None:
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except RecursionError:
+            raise
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.handleError(record)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    A queue handler applying a drop policy when its queue is full.
+    The number of dropped records is logged once the queue has room again.
+    """
+
+    drop_policy: DropPolicy
+
+    __lock: threading.Lock
+    __n_dropped: int
+
+    def __init__(self, queue: Queue, drop_policy: DropPolicy) -> None:
+        super().__init__(queue)
+        self.drop_policy = drop_policy
+        self.__lock = threading.Lock()
+        self.__n_dropped = 0
+
+    def __record_drop(self) -> None:
+        with self.__lock:
+            self.__n_dropped += 1
+
+    def __enqueue_drop_report(self) -> None:
+        with self.__lock:
+            n_dropped, self.__n_dropped = self.__n_dropped, 0
+        if n_dropped == 0:
+            return
+        report = logging.makeLogRecord(
+            {
+                "name": "logging",
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": "Log queue full, dropped %d records" % n_dropped,
+            }
+        )
+        try:
+            self.queue.put_nowait(report)
+        except Full:
+            with self.__lock:
+                self.__n_dropped += n_dropped
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """
+        Merge the message arguments, since they may be mutated after the call.
+        Unlike the default, the exception formatting is left to the listener thread.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        queue: Queue = self.queue  # type: ignore
+        if self.__n_dropped:
+            self.__enqueue_drop_report()
+        match self.drop_policy:
+            case DropPolicy.BLOCK:
+                queue.put(record)
+                return
+            case DropPolicy.DROP_NEW:
+                try:
+                    queue.put_nowait(record)
+                except Full:
+                    self.__record_drop()
+            case DropPolicy.DROP_OLD:
+                while True:
+                    try:
+                        queue.put_nowait(record)
+                        break
+                    except Full:
+                        try:
+                            queue.get_nowait()
+                            queue.task_done()
+                            self.__record_drop()
+                        except Empty:
+                            pass
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    A queue listener handling the queued records in batches.
+    Handlers are flushed once per batch instead of once per record.
+    """
+
+    batch_size: int
+
+    def __init__(self, queue: Queue, *handlers, batch_size: int = 256) -> None:
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self) -> None:
+        # Blocking, so that a full queue can't prevent stopping
+        self.queue.put(self._sentinel)
+
+    def _monitor(self) -> None:
+        queue: Queue = self.queue  # type: ignore
+        while True:
+            records = [queue.get()]
+            try:
+                while len(records) < self.batch_size:
+                    records.append(queue.get_nowait())
+            except Empty:
+                pass
+            is_stopping = False
+            for record in records:
+                if record is self._sentinel:
+                    is_stopping = True
+                    continue
+                self.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+            for _record in records:
+                queue.task_done()
+            if is_stopping:
+                break
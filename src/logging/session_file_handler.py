@@ -17,33 +17,49 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import logging
 import lzma
+import shutil
+import threading
+import time
 from io import TextIOWrapper
-from logging import StreamHandler
-from lzma import FORMAT_XZ, PRESET_DEFAULT
+from lzma import FORMAT_XZ
 from os import PathLike
 from pathlib import Path
 from typing import Optional
 
+from src.logging.queue_logging import BatchedStreamHandler
 
-class SessionFileHandler(StreamHandler):
+
+class SessionFileHandler(BatchedStreamHandler):
     """
     A logging handler that writes to a new file on every app restart.
     The files are compressed and older sessions logs are kept up to a small limit.
+    Records aren't flushed one by one, see BatchedStreamHandler.
+
+    Rotating only renames files, so that the new session's log is ready at once.
+    The previous logs are compressed later, see `compress_in_background`.
     """
 
     NUMBER_SUFFIX_POSITION = 1
+    COMPRESSION_PRESET = 1
+    COMPRESSION_CHUNK_SIZE = 1024 * 1024
 
     backup_count: int
     filename: Path
     log_file: Optional[TextIOWrapper] = None
+    rotate_duration: float = 0.0
 
     def create_dir(self) -> None:
         """Create the log dir if needed"""
         self.filename.parent.mkdir(exist_ok=True, parents=True)
 
     def path_is_logfile(self, path: Path) -> bool:
-        return path.is_file() and path.name.startswith(self.filename.stem)
+        return (
+            path.is_file()
+            and path.name.startswith(self.filename.stem)
+            and not path.name.endswith(".part")
+        )
 
     def path_has_number(self, path: Path) -> bool:
         try:
@@ -82,46 +98,78 @@ class SessionFileHandler(StreamHandler):
         logfiles.sort(key=self.file_sort_key, reverse=True)
         return logfiles
 
+    def remove_partial_files(self) -> None:
+        """Remove the leftovers of an interrupted compression"""
+        for path in self.filename.parent.glob(f"{self.filename.stem}*.part"):
+            path.unlink(missing_ok=True)
+
     def rotate_file(self, path: Path) -> None:
         """Rotate a file's number suffix and remove it if it's too old"""
 
-        # If uncompressed, compress
-        if not path.name.endswith(".xz"):
-            try:
-                with open(path, "r", encoding="utf-8") as original_file:
-                    original_data = original_file.read()
-            except UnicodeDecodeError:
-                # If the file is corrupted, throw it away
-                path.unlink()
-                return
-
-            # Compress the file
-            compressed_path = path.with_suffix(path.suffix + ".xz")
-            with lzma.open(
-                compressed_path,
-                "wt",
-                format=FORMAT_XZ,
-                preset=PRESET_DEFAULT,
-                encoding="utf-8",
-            ) as lzma_file:
-                lzma_file.write(original_data)
-            path.unlink()
-            path = compressed_path
-
-        # Rename with new number suffix
-        new_number = self.get_path_number(path) + 1
-        new_path_name = self.set_path_number(path, new_number)
-        path = path.rename(path.with_name(new_path_name))
-
         # Remove older files
+        new_number = self.get_path_number(path) + 1
         if new_number > self.backup_count:
             path.unlink()
             return
 
+        # Rename with new number suffix
+        new_path_name = self.set_path_number(path, new_number)
+        path.rename(path.with_name(new_path_name))
+
     def rotate(self) -> None:
         """Rotate the numbered suffix on the log files and remove old ones"""
+        start = time.perf_counter()
+        self.remove_partial_files()
         for path in self.get_logfiles():
             self.rotate_file(path)
+        self.rotate_duration = time.perf_counter() - start
+
+    def compress_file(self, path: Path) -> None:
+        """Compress a log file in chunks, replacing it with a .xz file"""
+        compressed_path = path.with_name(path.name + ".xz")
+        part_path = path.with_name(compressed_path.name + ".part")
+        with (
+            open(path, "rb") as original_file,
+            lzma.open(
+                part_path,
+                "wb",
+                format=FORMAT_XZ,
+                preset=self.COMPRESSION_PRESET,
+            ) as lzma_file,
+        ):
+            shutil.copyfileobj(original_file, lzma_file, self.COMPRESSION_CHUNK_SIZE)
+        part_path.rename(compressed_path)
+        path.unlink()
+
+    def compress_old_files(self) -> None:
+        """Compress the rotated log files that aren't compressed yet"""
+        logging.debug("Rotated log files in %.1f ms", self.rotate_duration * 1000)
+        for path in self.get_logfiles():
+            if not self.path_has_number(path) or path.name.endswith(".xz"):
+                continue
+            start = time.perf_counter()
+            try:
+                self.compress_file(path)
+            except OSError as error:
+                logging.warning("Couldn't compress log file %s", path, exc_info=error)
+                continue
+            logging.debug(
+                "Compressed log file %s in %.1f ms",
+                path.name,
+                (time.perf_counter() - start) * 1000,
+            )
+
+    def compress_in_background(self) -> None:
+        """
+        Compress the rotated log files in a background thread.
+        Should be called once logging is set up, to report the time spent.
+        """
+        thread = threading.Thread(
+            target=self.compress_old_files,
+            name="marmalade-log-compression",
+            daemon=True,
+        )
+        thread.start()
 
     def __init__(self, filename: PathLike, backup_count: int = 2) -> None:
         self.filename = Path(filename)
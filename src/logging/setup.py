@@ -17,18 +17,62 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import atexit
 import logging
 import logging.config as logging_dot_config
 import os
 from pathlib import Path
 import platform
 import sys
+from queue import Queue
 
 from src import build_constants
+from src.logging.queue_logging import (
+    BatchingQueueListener,
+    BoundedQueueHandler,
+    DropPolicy,
+)
+from src.logging.session_file_handler import SessionFileHandler
+from src.startup_profiler import profiler
+
+DEFAULT_LOG_QUEUE_SIZE = 10000
+
+_listeners: list[BatchingQueueListener] = []
+
+
+def _move_handlers_to_queue(
+    logger: logging.Logger, queue_size: int, drop_policy: DropPolicy
+) -> None:
+    """
+    Replace the handlers of a logger by a queue handler,
+    the original handlers being called from a listener thread.
+    """
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    queue = Queue(maxsize=queue_size)
+    logger.addHandler(BoundedQueueHandler(queue, drop_policy))
+    listener = BatchingQueueListener(queue, *handlers)
+    listener.start()
+    _listeners.append(listener)
+
+
+def shutdown_logging() -> None:
+    """Write the queued log records and stop the logging threads"""
+    while _listeners:
+        _listeners.pop().stop()
 
 
 def setup_logging(log_filename: Path) -> None:
-    """Intitate the app's logging"""
+    """
+    Intitate the app's logging
+
+    Records are queued and written by a background thread,
+    so that logging doesn't block the calling thread on I/O.
+    - `LOGQUEUESIZE` sets the maximum number of queued records
+    - `LOGDROPPOLICY` sets what happens when the queue is full,
+      one of "drop-new" (default), "drop-old" or "block"
+    """
 
     is_dev = build_constants.PROFILE == "development"
     profile_app_log_level = "DEBUG" if is_dev else "INFO"
@@ -57,12 +101,12 @@ def setup_logging(log_filename: Path) -> None:
                 "backup_count": 2,
             },
             "app_console_handler": {
-                "class": "logging.StreamHandler",
+                "class": "src.logging.queue_logging.BatchedStreamHandler",
                 "formatter": "console_formatter",
                 "level": app_log_level,
             },
             "lib_console_handler": {
-                "class": "logging.StreamHandler",
+                "class": "src.logging.queue_logging.BatchedStreamHandler",
                 "formatter": "console_formatter",
                 "level": lib_log_level,
             },
@@ -81,6 +125,32 @@ def setup_logging(log_filename: Path) -> None:
     }
     logging_dot_config.dictConfig(config)
 
+    # Move the handlers off the logging threads
+    try:
+        queue_size = int(os.environ.get("LOGQUEUESIZE", DEFAULT_LOG_QUEUE_SIZE))
+    except ValueError:
+        logging.warning("Invalid log queue size, using %d", DEFAULT_LOG_QUEUE_SIZE)
+        queue_size = DEFAULT_LOG_QUEUE_SIZE
+    try:
+        drop_policy = DropPolicy(os.environ.get("LOGDROPPOLICY", DropPolicy.DROP_NEW))
+    except ValueError:
+        logging.warning("Invalid log drop policy, using %s", DropPolicy.DROP_NEW.value)
+        drop_policy = DropPolicy.DROP_NEW
+    session_file_handlers = {
+        handler
+        for logger in (logging.getLogger(), logging.getLogger("urllib3"))
+        for handler in logger.handlers
+        if isinstance(handler, SessionFileHandler)
+    }
+    for logger in (logging.getLogger(), logging.getLogger("urllib3")):
+        _move_handlers_to_queue(logger, queue_size, drop_policy)
+    atexit.register(shutdown_logging)
+
+    # Compress the previous sessions' logs, now that logging works
+    for handler in session_file_handlers:
+        profiler.record("log rotation", handler.rotate_duration)
+        handler.compress_in_background()
+
 
 def log_system_info() -> None:
     """Log system debug information"""
@@ -17,15 +17,40 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import logging
 import sys
 from typing import Callable, Optional
 
-from gi.repository import Adw, Gio, GLib, Gtk
+from src.startup_profiler import profiler
+
+profiler.start("imports")
+
+# pylint: disable=wrong-import-position
+from gi.repository import Adw, Gdk, Gio, GLib, Gtk
 
 from src import build_constants, shared  # type: ignore
 from src.components.window import MarmaladeWindow
 from src.database.api import DataHandler
-from src.logging.setup import log_system_info, setup_logging
+from src.database.library import LibraryDatabase
+from src.database.search_index import SearchIndex
+from src.image_cache import ImageCache
+from src.jellyfin import (
+    JellyfinClientRegistry,
+    get_http_cache,
+    get_single_flight_stats,
+)
+from src.logging.setup import log_system_info, setup_logging, shutdown_logging
+from src.snapshots import SnapshotStore
+from src.stall_watchdog import watchdog
+from src.task import dispatcher
+
+# pylint: enable=wrong-import-position
+
+profiler.stop("imports")
+
+IMAGE_CACHE_MEMORY_SIZE = 128 * 1024 * 1024
+IMAGE_CACHE_DISK_SIZE = 512 * 1024 * 1024
+IMAGE_CACHE_DISK_MAX_AGE = 30 * 24 * 60 * 60
 
 
 class MarmaladeApplication(Adw.Application):
@@ -56,7 +81,7 @@ class MarmaladeApplication(Adw.Application):
         if isinstance(param_type, str):
             param_type = GLib.VariantType.new(param_type)
         action = Gio.SimpleAction.new(name, param_type)
-        action.connect("activate", callback)
+        action.connect("activate", watchdog.wrap(f"app.{name}", callback))
         self.add_action(action)
         if shortcuts is not None:
             self.set_accels_for_action(f"app.{name}", shortcuts)
@@ -91,20 +116,51 @@ class MarmaladeApplication(Adw.Application):
             flags=Gio.ApplicationFlags.DEFAULT_FLAGS,
         )
         self.__init_app_dirs()
-        self.__init_logging()
+        with profiler.measure("logging setup"):
+            self.__init_logging()
+        watchdog.start()
         database_file = shared.app_data_dir / "marmalade.db"
-        shared.settings = DataHandler(file=database_file)
+        with profiler.measure("database migration"):
+            shared.settings = DataHandler(file=database_file)
+        shared.search_index = SearchIndex(shared.settings)
+        shared.library = LibraryDatabase(shared.settings)
+        shared.clients = JellyfinClientRegistry()
+        shared.image_cache = ImageCache(
+            directory=shared.app_cache_dir / "images",
+            memory_size=IMAGE_CACHE_MEMORY_SIZE,
+            disk_size=IMAGE_CACHE_DISK_SIZE,
+            disk_max_age=IMAGE_CACHE_DISK_MAX_AGE,
+        )
+        shared.snapshots = SnapshotStore(directory=shared.app_cache_dir / "snapshots")
         self.__create_action("quit", lambda *_: self.quit(), shortcuts=["<primary>q"])
         self.__create_action("about", self.__on_about)
         self.__create_action("error-details", self.__on_error_details, param_type="as")
 
+    def do_shutdown(self):
+        shared.clients.close_all()
+        shared.settings.close()
+        logging.info("HTTP cache: %s", get_http_cache().stats)
+        logging.info("Single-flight: %s", get_single_flight_stats())
+        logging.info("Image downloads: %s", shared.image_cache.stats)
+        watchdog.report()
+        shutdown_logging()
+        Adw.Application.do_shutdown(self)
+
     def do_activate(self):
         window = self.get_active_window()
         if not window:
             # FIXME This no longer displays a window after getting rid of Gtk.Template
             # WHY ???????
-            window = MarmaladeWindow(application=self)
+            with profiler.measure("window creation"):
+                window = MarmaladeWindow(application=self)
         window.present()
+        dispatcher.attach(window.get_frame_clock())
+        if profiler.is_enabled:
+            window.get_frame_clock().connect("after-paint", self.__on_first_frame)
+
+    def __on_first_frame(self, frame_clock: Gdk.FrameClock) -> None:
+        frame_clock.disconnect_by_func(self.__on_first_frame)
+        profiler.report()
 
 
 def main(_version):
@@ -0,0 +1,30 @@
+from typing import Any
+
+from src.database.search_index import SearchItem
+from src.jellyfin import JellyfinClient
+from src.library_sync import query_items
+
+
+def get_item_dict(item: SearchItem) -> dict[str, Any]:
+    """Get a Jellyfin item dict from a search item, eg. to merge it in an `ItemStore`"""
+    data: dict[str, Any] = {
+        "Id": item.item_id,
+        "Type": item.item_type,
+        "Name": item.name,
+        "ProductionYear": item.production_year,
+    }
+    if item.primary_image_tag:
+        data["ImageTags"] = {"Primary": item.primary_image_tag}
+        if item.primary_image_blur_hash:
+            data["ImageBlurHashes"] = {
+                "Primary": {item.primary_image_tag: item.primary_image_blur_hash}
+            }
+    return data
+
+
+def search_remote(
+    client: JellyfinClient, user_id: str, text: str, limit: int = 50
+) -> list[dict[str, Any]]:
+    """Search items on the server, returns Jellyfin item dicts"""
+    result = query_items(client, user_id, searchTerm=text, limit=limit)
+    return result.get("Items") or []
@@ -1,10 +1,23 @@
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from gi.repository import GLib
 
 from src.database.api import DataHandler
 
+if TYPE_CHECKING:
+    from src.database.library import LibraryDatabase
+    from src.database.search_index import SearchIndex
+    from src.image_cache import ImageCache
+    from src.jellyfin import JellyfinClientRegistry
+    from src.snapshots import SnapshotStore
+
 app_data_dir = Path(GLib.get_user_data_dir()) / "marmalade"
 app_cache_dir = Path(GLib.get_user_cache_dir()) / "marmalade"
 app_config_dir = Path(GLib.get_user_config_dir()) / "marmalade"
 settings: DataHandler = None
+clients: "JellyfinClientRegistry" = None
+image_cache: "ImageCache" = None
+snapshots: "SnapshotStore" = None
+search_index: "SearchIndex" = None
+library: "LibraryDatabase" = None
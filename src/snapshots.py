@@ -0,0 +1,53 @@
+import json
+import logging
+import shutil
+import threading
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Optional
+
+
+class SnapshotStore:
+    """
+    JSON snapshots of page contents, per server and user.
+
+    Used to show the last known content of a page instantly,
+    while the up to date content is being queried.
+    Safe to use from worker threads.
+    """
+
+    __directory: Path
+
+    def __init__(self, directory: Path) -> None:
+        self.__directory = directory
+
+    def __get_user_dir(self, address: str, user_id: str) -> Path:
+        digest = blake2b(digest_size=16, usedforsecurity=False)
+        digest.update(f"{address}\0{user_id}".encode())
+        return self.__directory / digest.hexdigest()
+
+    def load(self, address: str, user_id: str, name: str) -> Optional[Any]:
+        """Get a snapshot's content, or None if there is no usable snapshot"""
+        path = self.__get_user_dir(address, user_id) / f"{name}.json"
+        try:
+            with path.open("r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logging.warning("Ignoring unreadable snapshot %s", path, exc_info=error)
+            return None
+
+    def save(self, address: str, user_id: str, name: str, content: Any) -> None:
+        """Save a snapshot's content, replacing the previous one atomically"""
+        user_dir = self.__get_user_dir(address, user_id)
+        user_dir.mkdir(parents=True, exist_ok=True)
+        path = user_dir / f"{name}.json"
+        part_path = path.with_suffix(f".json.{threading.get_ident()}.part")
+        with part_path.open("w", encoding="utf-8") as file:
+            json.dump(content, file)
+        part_path.replace(path)
+
+    def remove(self, address: str, user_id: str) -> None:
+        """Remove all the snapshots of a user"""
+        shutil.rmtree(self.__get_user_dir(address, user_id), ignore_errors=True)
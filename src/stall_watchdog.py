@@ -0,0 +1,199 @@
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from types import FrameType
+from typing import Callable, Iterator, Optional
+
+from gi.repository import GLib
+
+# Interval of the main loop heartbeat, and of the helper thread's checks
+WATCHDOG_HEARTBEAT_MS = 50
+# Time without a heartbeat after which the main thread is considered stalled
+WATCHDOG_STALL_THRESHOLD_S = 0.2
+# Duration of a main loop callback above which it is reported as slow
+WATCHDOG_SLOW_CALLBACK_S = 0.05
+# Entries shown per table of the exit summary
+WATCHDOG_SUMMARY_SIZE = 10
+
+
+class _Totals:
+    """Count, total and maximum of durations"""
+
+    count: int = 0
+    total: float = 0.0
+    maximum: float = 0.0
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
+
+
+def _get_location(frame: FrameType) -> str:
+    """Get the innermost application code location of a stack"""
+    current: Optional[FrameType] = frame
+    while current is not None:
+        module = current.f_globals.get("__name__", "")
+        if module.startswith("src.") and module != __name__:
+            return f"{module}:{current.f_lineno} {current.f_code.co_name}"
+        current = current.f_back
+    return f"{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+def _format_stack(frame: FrameType) -> str:
+    lines = []
+    current: Optional[FrameType] = frame
+    while current is not None:
+        code = current.f_code
+        lines.append(f"\t{code.co_filename}:{current.f_lineno} {code.co_name}")
+        current = current.f_back
+    return "\n".join(reversed(lines))
+
+
+class StallWatchdog:
+    """
+    Reports the main thread stalls, where the UI freezes.
+
+    - The main loop beats every `WATCHDOG_HEARTBEAT_MS`, a helper thread checks
+      the beats and samples the main thread's stack once they are late
+    - A stall is logged when it ends, with its duration and stack sample
+    - `measure` and `wrap` time main loop callbacks (eg. task callbacks and
+      action handlers), slow ones are logged
+    - `report` logs a summary of the stall locations and slow callbacks
+    - Enabled by setting the `MARMALADE_STALL_WATCHDOG` environment variable,
+      otherwise every method is a no-op and the main loop isn't woken up
+    """
+
+    is_enabled: bool
+
+    __lock: threading.Lock
+    __thread: Optional[threading.Thread] = None
+    __main_thread_id: int
+    __last_beat: float
+    __stall_start: Optional[float] = None
+    __stall_sample: Optional[tuple[str, str]] = None
+    __stalls: dict[str, _Totals]
+    __callbacks: dict[str, _Totals]
+
+    def __init__(self, is_enabled: bool) -> None:
+        self.is_enabled = is_enabled
+        self.__lock = threading.Lock()
+        self.__main_thread_id = threading.main_thread().ident or 0
+        self.__last_beat = time.monotonic()
+        self.__stalls = {}
+        self.__callbacks = {}
+
+    def start(self) -> None:
+        """Start watching the main loop, must be called from the main thread"""
+        if not self.is_enabled or self.__thread is not None:
+            return
+        self.__main_thread_id = threading.get_ident()
+        self.__last_beat = time.monotonic()
+        GLib.timeout_add(
+            WATCHDOG_HEARTBEAT_MS, self.__on_heartbeat, priority=GLib.PRIORITY_HIGH
+        )
+        self.__thread = threading.Thread(
+            target=self.__watch, name="marmalade-watchdog", daemon=True
+        )
+        self.__thread.start()
+
+    def __on_heartbeat(self) -> bool:
+        with self.__lock:
+            self.__last_beat = time.monotonic()
+        return GLib.SOURCE_CONTINUE
+
+    def __watch(self) -> None:
+        """Helper thread loop, sampling the main thread when it stalls"""
+        while True:
+            time.sleep(WATCHDOG_HEARTBEAT_MS / 1000)
+            with self.__lock:
+                last_beat = self.__last_beat
+                stall_start = self.__stall_start
+            lateness = time.monotonic() - last_beat
+            if lateness >= WATCHDOG_STALL_THRESHOLD_S and stall_start is None:
+                with self.__lock:
+                    self.__stall_start = last_beat
+                self.__stall_sample = self.__sample()
+            elif lateness < WATCHDOG_STALL_THRESHOLD_S and stall_start is not None:
+                self.__end_stall(last_beat - stall_start)
+
+    def __sample(self) -> Optional[tuple[str, str]]:
+        """Sample the main thread's stack, as its location and formatted stack"""
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        frame = frames.get(self.__main_thread_id)
+        if frame is None:
+            return None
+        # Formatted right away, the frames keep running
+        return _get_location(frame), _format_stack(frame)
+
+    def __end_stall(self, duration: float) -> None:
+        location, stack = self.__stall_sample or ("unknown", "\t(no stack sample)")
+        self.__stall_sample = None
+        with self.__lock:
+            self.__stall_start = None
+            self.__stalls.setdefault(location, _Totals()).add(duration)
+        logging.warning(
+            "Main thread stalled for %.0f ms in %s\n%s",
+            duration * 1000,
+            location,
+            stack,
+        )
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        """Context manager timing a main loop callback"""
+        if not self.is_enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= WATCHDOG_SLOW_CALLBACK_S:
+                with self.__lock:
+                    self.__callbacks.setdefault(name, _Totals()).add(duration)
+                logging.debug("Slow callback %s took %.0f ms", name, duration * 1000)
+
+    def wrap(self, name: str, callback: Callable) -> Callable:
+        """Wrap a main loop callback (eg. a signal handler) to time it"""
+        if not self.is_enabled:
+            return callback
+
+        @wraps(callback)
+        def wrapper(*args, **kwargs):
+            with self.measure(name):
+                return callback(*args, **kwargs)
+
+        return wrapper
+
+    def report(self) -> None:
+        """Log a summary of the stalls and slow callbacks, eg. at exit"""
+        if not self.is_enabled:
+            return
+        with self.__lock:
+            tables = (
+                ("Main thread stalls", dict(self.__stalls)),
+                ("Slow main loop callbacks", dict(self.__callbacks)),
+            )
+        for title, totals in tables:
+            if not totals:
+                logging.info("%s: none", title)
+                continue
+            logging.info("%s:", title)
+            ranked = sorted(totals.items(), key=lambda item: -item[1].total)
+            for name, entry in ranked[:WATCHDOG_SUMMARY_SIZE]:
+                logging.info(
+                    "\t%-56s %4dx %8.0f ms total %6.0f ms max",
+                    name,
+                    entry.count,
+                    entry.total * 1000,
+                    entry.maximum * 1000,
+                )
+
+
+watchdog = StallWatchdog(is_enabled=bool(os.environ.get("MARMALADE_STALL_WATCHDOG")))
@@ -0,0 +1,82 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import psutil
+
+
+class StartupProfiler:
+    """
+    Records how long the startup phases take, and reports them once.
+
+    - Enabled by setting the `MARMALADE_PROFILE_STARTUP` environment variable
+    - Phases are reported in the order they were first recorded
+    - When disabled, every method is a no-op
+    """
+
+    is_enabled: bool
+
+    __origin: float
+    __starts: dict[str, float]
+    __durations: dict[str, float]
+    __is_reported: bool = False
+
+    def __init__(self, is_enabled: bool) -> None:
+        self.is_enabled = is_enabled
+        self.__origin = time.perf_counter()
+        self.__starts = {}
+        self.__durations = {}
+
+    def start(self, phase: str) -> None:
+        """Start timing a phase"""
+        if self.is_enabled:
+            self.__starts[phase] = time.perf_counter()
+
+    def stop(self, phase: str) -> None:
+        """Stop timing a phase started with `start`"""
+        if not self.is_enabled:
+            return
+        start = self.__starts.pop(phase)
+        self.record(phase, time.perf_counter() - start)
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """Context manager timing a phase"""
+        self.start(phase)
+        try:
+            yield
+        finally:
+            self.stop(phase)
+
+    def record(self, phase: str, duration: float) -> None:
+        """Record a phase's duration, measured elsewhere"""
+        if self.is_enabled:
+            self.__durations[phase] = self.__durations.get(phase, 0.0) + duration
+
+    def report(self) -> None:
+        """Log the recorded phases, should be called when the first frame is drawn"""
+        if not self.is_enabled or self.__is_reported:
+            return
+        self.__is_reported = True
+        self.record("first frame", time.perf_counter() - self.__origin)
+        process_duration = self.__get_process_duration()
+        logging.info("Startup profile:")
+        for phase, duration in self.__durations.items():
+            logging.info("\t%-24s %8.1f ms", phase, duration * 1000)
+        if process_duration is not None:
+            logging.info(
+                "\t%-24s %8.1f ms", "first frame (process)", process_duration * 1000
+            )
+
+    @staticmethod
+    def __get_process_duration() -> float | None:
+        """Time since the process started, including the interpreter startup"""
+        try:
+            return time.time() - psutil.Process().create_time()
+        except psutil.Error:
+            return None
+
+
+profiler = StartupProfiler(is_enabled=bool(os.environ.get("MARMALADE_PROFILE_STARTUP")))
@@ -1,43 +1,281 @@
-from functools import partial
+import heapq
+import itertools
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from enum import IntEnum
+from functools import partial, wraps
 from typing import Any, Callable, Iterable, Mapping, Optional
 
-from gi.repository import Gio
+from gi.repository import Gdk, Gio, GLib
+
+from src.stall_watchdog import watchdog
 
 
 def nop(*_args, **_kwargs):
     """A function that does nothing"""
 
 
+class TaskCancelledError(Exception):
+    """Error raised in a task's main function when the task is cancelled"""
+
+
+_worker_state = threading.local()
+
+
+def get_current_cancellable() -> Optional[Gio.Cancellable]:
+    """Get the cancellable of the task running in the current thread, if any"""
+    return getattr(_worker_state, "cancellable", None)
+
+
+def raise_if_cancelled(cancellable: Optional[Gio.Cancellable] = None) -> None:
+    """
+    Raise a TaskCancelledError if the cancellable is cancelled.
+    Defaults to the cancellable of the task running in the current thread.
+    """
+    if cancellable is None:
+        cancellable = get_current_cancellable()
+    if cancellable is not None and cancellable.is_cancelled():
+        raise TaskCancelledError()
+
+
+class TaskPriority(IntEnum):
+    """Scheduling priority of a task, lower values run first"""
+
+    PAGE_DATA = 0
+    VISIBLE_IMAGE = 1
+    PREFETCH = 2
+
+
+class TaskScheduler:
+    """
+    Fixed-size pool of worker threads running jobs by priority.
+
+    - Jobs with a lower priority value run first, in submission order among equals
+    - Jobs sharing a group (eg. a server address) have a bounded concurrency,
+      so that a single server can't occupy all of the workers
+    - Worker threads are started on the first submission
+    """
+
+    __n_workers: int
+    __max_per_group: int
+    __workers: list[threading.Thread]
+    __condition: threading.Condition
+    __counter: itertools.count
+    __queue: list[tuple[int, int, Optional[str], Callable]]
+    __blocked: dict[str, list[tuple[int, int, Optional[str], Callable]]]
+    __running: dict[str, int]
+
+    def __init__(self, n_workers: int = 8, max_per_group: int = 6) -> None:
+        self.__n_workers = n_workers
+        self.__max_per_group = max_per_group
+        self.__workers = []
+        self.__condition = threading.Condition()
+        self.__counter = itertools.count()
+        self.__queue = []
+        self.__blocked = {}
+        self.__running = {}
+
+    def __start_workers(self) -> None:
+        for i in range(len(self.__workers), self.__n_workers):
+            worker = threading.Thread(
+                target=self.__worker_loop,
+                name=f"marmalade-worker-{i}",
+                daemon=True,
+            )
+            worker.start()
+            self.__workers.append(worker)
+
+    def __pop_runnable(self) -> Optional[tuple[int, int, Optional[str], Callable]]:
+        """
+        Pop the highest priority job that may run.
+        Jobs of saturated groups are put aside until a job of their group ends.
+        Must be called with the condition held.
+        """
+        while self.__queue:
+            entry = heapq.heappop(self.__queue)
+            group = entry[2]
+            if group is None:
+                return entry
+            if self.__running.get(group, 0) < self.__max_per_group:
+                self.__running[group] = self.__running.get(group, 0) + 1
+                return entry
+            heapq.heappush(self.__blocked.setdefault(group, []), entry)
+        return None
+
+    def __release_group(self, group: Optional[str]) -> None:
+        """Free a group slot, letting its best blocked job run again"""
+        if group is None:
+            return
+        self.__running[group] -= 1
+        if self.__running[group] == 0:
+            del self.__running[group]
+        if blocked := self.__blocked.get(group):
+            heapq.heappush(self.__queue, heapq.heappop(blocked))
+            if not blocked:
+                del self.__blocked[group]
+            self.__condition.notify()
+
+    def __worker_loop(self) -> None:
+        while True:
+            with self.__condition:
+                while (entry := self.__pop_runnable()) is None:
+                    self.__condition.wait()
+            _priority, _index, group, job = entry
+            try:
+                job()
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                logging.error("Unhandled error in worker job", exc_info=error)
+            finally:
+                with self.__condition:
+                    self.__release_group(group)
+
+    def submit(
+        self,
+        job: Callable[[], Any],
+        priority: TaskPriority = TaskPriority.PAGE_DATA,
+        group: Optional[str] = None,
+    ) -> None:
+        """Queue a job to be run by a worker thread"""
+        with self.__condition:
+            self.__start_workers()
+            entry = (int(priority), next(self.__counter), group, job)
+            heapq.heappush(self.__queue, entry)
+            self.__condition.notify()
+
+
+scheduler = TaskScheduler()
+
+# Time spent delivering results per frame, the rest is left to layout and drawing
+RESULT_DISPATCH_BUDGET_S = 0.004
+# Delay after which results are delivered without a frame, eg. in a hidden window
+RESULT_DISPATCH_FALLBACK_MS = 100
+
+
+class ResultDispatcher:
+    """
+    Delivers the results of the tasks in the main loop, in batches.
+
+    - Results finished between two frames are delivered together, in the frame
+      clock's update phase, so that their widget changes share one layout
+    - A batch stops after `RESULT_DISPATCH_BUDGET_S`, the rest waits for the next frame
+    - Without a frame clock, or when it doesn't tick (eg. the window is hidden),
+      results are delivered from the main loop instead
+    - `push` is safe to call from any thread
+    """
+
+    __lock: threading.Lock
+    __queue: deque[tuple[str, Callable[[], Any]]]
+    __is_scheduled: bool = False
+    __frame_clock: Optional[Gdk.FrameClock] = None
+    __frame_clock_handler: int = 0
+    __fallback_source_id: int = 0
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__queue = deque()
+
+    def attach(self, frame_clock: Optional[Gdk.FrameClock]) -> None:
+        """Deliver the results at the frames of a frame clock, from the main thread"""
+        if self.__frame_clock is not None:
+            self.__frame_clock.disconnect(self.__frame_clock_handler)
+        self.__frame_clock = frame_clock
+        self.__frame_clock_handler = 0
+        if frame_clock is not None:
+            self.__frame_clock_handler = frame_clock.connect("update", self.__on_update)
+
+    def push(self, name: str, deliver: Callable[[], Any]) -> None:
+        """Queue a result delivery, named for the stall watchdog"""
+        with self.__lock:
+            self.__queue.append((name, deliver))
+            if self.__is_scheduled:
+                return
+            self.__is_scheduled = True
+        GLib.idle_add(self.__schedule, priority=GLib.PRIORITY_DEFAULT)
+
+    def __schedule(self) -> bool:
+        """Wait for the next frame to deliver the queued results"""
+        if self.__frame_clock is None:
+            self.__dispatch()
+            return GLib.SOURCE_REMOVE
+        self.__frame_clock.request_phase(Gdk.FrameClockPhase.UPDATE)
+        if not self.__fallback_source_id:
+            self.__fallback_source_id = GLib.timeout_add(
+                RESULT_DISPATCH_FALLBACK_MS, self.__on_fallback_timeout
+            )
+        return GLib.SOURCE_REMOVE
+
+    def __on_update(self, _frame_clock) -> None:
+        with self.__lock:
+            if not self.__is_scheduled:
+                return
+        self.__dispatch()
+
+    def __on_fallback_timeout(self) -> bool:
+        self.__fallback_source_id = 0
+        self.__dispatch()
+        return GLib.SOURCE_REMOVE
+
+    def __dispatch(self) -> None:
+        """Deliver the queued results within the time budget, scheduling the rest"""
+        if self.__fallback_source_id:
+            GLib.source_remove(self.__fallback_source_id)
+            self.__fallback_source_id = 0
+        deadline = time.perf_counter() + RESULT_DISPATCH_BUDGET_S
+        while True:
+            with self.__lock:
+                if not self.__queue:
+                    self.__is_scheduled = False
+                    return
+                name, deliver = self.__queue.popleft()
+            try:
+                with watchdog.measure(name):
+                    deliver()
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                logging.error("Unhandled error in task callback", exc_info=error)
+            if time.perf_counter() >= deadline:
+                break
+        # Leftover results wait for the next frame
+        GLib.idle_add(self.__schedule, priority=GLib.PRIORITY_DEFAULT)
+
+
+dispatcher = ResultDispatcher()
+
+
 class Task:
     """
-    Wrapper around async Gio Tasks.
+    Wrapper around a function run in a worker thread of the scheduler.
 
     - `error_callback` must accept a `error` argument.
     - `callback` must accept a `result` argument.
     - If `main` raises an exception, `error_callback` will receive it.
     - Else, `callback` will receive the return value.
     - If `callback` or `error_callback` are not passed, they will be NOP.
+    - Callbacks are called in the main loop, batched per frame (see `ResultDispatcher`).
     - The task is assigned a Gio.Cancellable, unless one is passed.
-    - By setting `return_on_cancel` to `True`, cancelling will exit `main` immediately.
+    - A task cancelled before it starts doesn't run,
+      its `error_callback` receives a `TaskCancelledError` instead.
+    - By setting `return_on_cancel` to `True` (the default),
+      a cancelled task's callbacks aren't called.
+    - `priority` orders the queued tasks (see `TaskPriority`).
+    - Tasks sharing a `group` (eg. a server address) have a bounded concurrency.
     """
 
-    __gio_task: Gio.Task
     __main: Callable
     __callback: Callable
     __error_callback: Callable
     __cancellable: Gio.Cancellable
+    __priority: TaskPriority
+    __group: Optional[str]
+    __name: str
 
     # Set at run time
     __result: Optional[Any] = None
     __error: Optional[Exception] = None
 
-    @property
-    def return_on_cancel(self) -> bool:
-        return self.__gio_task.get_return_on_cancel()
-
-    @return_on_cancel.setter
-    def return_on_cancel(self, value: bool) -> None:
-        self.__gio_task.set_return_on_cancel(value)
+    return_on_cancel: bool
 
     # pylint: disable=dangerous-default-value
     # Using single-use empty dicts, it doesn't matter.
@@ -54,6 +292,8 @@ class Task:
         error_callback_kwargs: Mapping[str, Any] = {},
         cancellable: Optional[Gio.Cancellable] = None,
         return_on_cancel: bool = True,
+        priority: TaskPriority = TaskPriority.PAGE_DATA,
+        group: Optional[str] = None,
     ) -> None:
         # Create or pass the cancellable
         self.__cancellable = Gio.Cancellable() if cancellable is None else cancellable
@@ -63,31 +303,127 @@ class Task:
         self.__error_callback = partial(
             error_callback, *error_callback_args, **error_callback_kwargs
         )
-        # Create the task
-        self.__gio_task = Gio.Task.new(
-            None, self.__cancellable, self.__gio_callback, None
-        )
         # Configure the task
         self.return_on_cancel = return_on_cancel
+        self.__priority = priority
+        self.__group = group
+        # Named after the callback, or the main function if there is none
+        named = main if getattr(callback, "__wrapped__", callback) is nop else callback
+        self.__name = getattr(named, "__qualname__", repr(named))
 
-    def __gio_callback(self, _source_object, _result, _data) -> None:
+    def __deliver(self) -> None:
+        """Call the appropriate callback, in the main loop"""
+        if self.return_on_cancel and self.__cancellable.is_cancelled():
+            return
         if self.__error is not None:
             self.__error_callback(self.__error)
         else:
             self.__callback(self.__result)
 
-    def __gio_main(self, _task, _source_object, _task_data, _cancellable) -> None:
+    def __worker_main(self) -> None:
+        if self.__cancellable.is_cancelled():
+            # Still delivered, callers may count the completions
+            if not self.return_on_cancel:
+                self.__error = TaskCancelledError()
+                dispatcher.push(self.__name, self.__deliver)
+            return
+        _worker_state.cancellable = self.__cancellable
         try:
             result: object = self.__main()
         except Exception as error:  # pylint: disable=broad-exception-caught
             self.__error = error
         else:
             self.__result = result
+        finally:
+            _worker_state.cancellable = None
+        dispatcher.push(self.__name, self.__deliver)
 
     def run(self) -> None:
-        """Run the task's main function in a separate thread"""
-        self.__gio_task.run_in_thread(self.__gio_main)
+        """Run the task's main function in a worker thread"""
+        scheduler.submit(self.__worker_main, self.__priority, self.__group)
 
     def cancel(self) -> None:
         """Cancel the task"""
         self.__cancellable.cancel()
+
+
+class CancellationScope:
+    """
+    Group of tasks sharing a single Gio.Cancellable.
+
+    - Tasks created with `create_task` are all cancelled by `cancel`
+    - Cancelling a scope also cancels its children scopes
+    - Once cancelled, a scope must be `reset` before starting new tasks
+    - Tasks are pending until their callback returns, so that tasks created
+      from a callback keep the scope pending (see `has_pending_tasks`)
+    - Must only be used from the main thread
+    """
+
+    __cancellable: Gio.Cancellable
+    __children: weakref.WeakSet
+    __n_pending: int
+
+    def __init__(self, parent: Optional["CancellationScope"] = None) -> None:
+        self.__cancellable = Gio.Cancellable()
+        self.__children = weakref.WeakSet()
+        self.__n_pending = 0
+        if parent is not None:
+            parent.add_child(self)
+
+    def add_child(self, child: "CancellationScope") -> None:
+        """Add a child scope, cancelled alongside this one"""
+        self.__children.add(child)
+        if self.is_cancelled():
+            child.cancel()
+
+    def get_cancellable(self) -> Gio.Cancellable:
+        return self.__cancellable
+
+    def is_cancelled(self) -> bool:
+        return self.__cancellable.is_cancelled()
+
+    def has_pending_tasks(self) -> bool:
+        """Whether tasks of the scope or of its children haven't finished"""
+        return self.__n_pending > 0 or any(
+            child.has_pending_tasks() for child in list(self.__children)
+        )
+
+    def cancel(self) -> None:
+        """Cancel the tasks of the scope and of its children"""
+        self.__cancellable.cancel()
+        self.__n_pending = 0
+        for child in list(self.__children):
+            child.cancel()
+
+    def reset(self) -> None:
+        """
+        Get a fresh cancellable, leaving the cancelled tasks cancelled.
+        The children, cancelled alongside, are reset too.
+        """
+        if self.is_cancelled():
+            self.__cancellable = Gio.Cancellable()
+        for child in list(self.__children):
+            child.reset()
+
+    def __track(self, callback: Callable) -> Callable:
+        """Wrap a task callback to mark the task as finished once it returns"""
+        cancellable = self.__cancellable
+
+        @wraps(callback)
+        def tracked(*args, **kwargs):
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                # Tasks of a cancelled generation aren't counted anymore
+                if cancellable is self.__cancellable and not cancellable.is_cancelled():
+                    self.__n_pending -= 1
+
+        return tracked
+
+    def create_task(self, **kwargs) -> Task:
+        """Create a task bound to the scope (see `Task` for the arguments)"""
+        if not self.is_cancelled():
+            self.__n_pending += 1
+            for key in ("callback", "error_callback"):
+                kwargs[key] = self.__track(kwargs.get(key, nop))
+        return Task(cancellable=self.__cancellable, **kwargs)
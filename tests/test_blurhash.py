@@ -0,0 +1,108 @@
+import math
+
+import pytest
+
+from src.blurhash import BlurHashError, decode
+
+# Example hash of the BlurHash reference implementation, 4x3 components
+EXAMPLE_HASH = "LEHV6nWB2yk8pyo0adR*.7kCMdnj"
+
+_BASE83_CHARACTERS = (
+    "0123456789"
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    "abcdefghijklmnopqrstuvwxyz"
+    "#$%*+,-.:;=?@[]^_{|}~"
+)
+
+
+def encode_base83(value: int, length: int) -> str:
+    return "".join(
+        _BASE83_CHARACTERS[value // 83 ** (length - 1 - i) % 83] for i in range(length)
+    )
+
+
+def decode_reference(blur_hash: str, width: int, height: int) -> list[int]:
+    """Direct sum over every component for every pixel, as in the specification"""
+
+    def base83(text: str) -> int:
+        value = 0
+        for character in text:
+            value = value * 83 + _BASE83_CHARACTERS.index(character)
+        return value
+
+    def to_linear(value: int) -> float:
+        value_float = value / 255
+        if value_float <= 0.04045:
+            return value_float / 12.92
+        return ((value_float + 0.055) / 1.055) ** 2.4
+
+    def to_srgb(value: float) -> int:
+        value = min(1.0, max(0.0, value))
+        if value <= 0.0031308:
+            return int(value * 12.92 * 255 + 0.5)
+        return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+    def sign_pow(value: float) -> float:
+        return math.copysign(value * value, value)
+
+    size_flag = base83(blur_hash[0])
+    n_x, n_y = size_flag % 9 + 1, size_flag // 9 + 1
+    max_value = (base83(blur_hash[1]) + 1) / 166
+    dc = base83(blur_hash[2:6])
+    colors = [(to_linear(dc >> 16), to_linear(dc >> 8 & 255), to_linear(dc & 255))]
+    for index in range(1, n_x * n_y):
+        ac = base83(blur_hash[4 + index * 2 : 6 + index * 2])
+        colors.append(
+            tuple(
+                sign_pow((quantized - 9) / 9) * max_value
+                for quantized in (ac // 361, ac // 19 % 19, ac % 19)
+            )
+        )
+    pixels = []
+    for y in range(height):
+        for x in range(width):
+            pixel = [0.0, 0.0, 0.0]
+            for j in range(n_y):
+                for i in range(n_x):
+                    basis = math.cos(math.pi * i * x / width) * math.cos(
+                        math.pi * j * y / height
+                    )
+                    for channel in range(3):
+                        pixel[channel] += colors[j * n_x + i][channel] * basis
+            pixels.extend(to_srgb(value) for value in pixel)
+    return pixels
+
+
+def test_decode_size():
+    assert len(decode(EXAMPLE_HASH, 20, 30)) == 20 * 30 * 3
+
+
+def test_decode_matches_reference():
+    pixels = decode(EXAMPLE_HASH, 20, 30)
+    reference = decode_reference(EXAMPLE_HASH, 20, 30)
+    assert max(abs(a - b) for a, b in zip(pixels, reference)) <= 2
+
+
+def test_decode_solid_color():
+    # Only the DC component, the image is its color
+    blur_hash = "00" + encode_base83((200 << 16) | (100 << 8) | 50, 4)
+    pixels = decode(blur_hash, 4, 4)
+    for offset in range(0, len(pixels), 3):
+        assert all(
+            abs(a - b) <= 1 for a, b in zip(pixels[offset : offset + 3], (200, 100, 50))
+        )
+
+
+@pytest.mark.parametrize(
+    "blur_hash",
+    [
+        "",
+        "LEHV6",
+        EXAMPLE_HASH[:-1],
+        EXAMPLE_HASH + "0",
+        "LEHV6nWB2yk8pyo0adR*.7kCMdn\"",
+    ],
+)
+def test_decode_invalid(blur_hash: str):
+    with pytest.raises(BlurHashError):
+        decode(blur_hash, 4, 4)
@@ -0,0 +1,124 @@
+import datetime
+from pathlib import Path
+
+import httpcore
+import pytest
+
+from src.http_cache import (
+    DEFAULT_POLICIES,
+    LRUFileStorage,
+    PolicyController,
+    generate_cache_key,
+    get_policy,
+)
+
+
+def make_request(url: str, token: str = "a", method: str = "GET") -> httpcore.Request:
+    return httpcore.Request(
+        method, url, headers=[(b"X-Emby-Authorization", token.encode())]
+    )
+
+
+@pytest.mark.parametrize(
+    ("path", "ttl"),
+    [
+        ("/System/Info/Public", 3600),
+        ("/UserViews", 300),
+        ("/Users/abc/Views", 300),
+        ("/Items/Latest", 300),
+        ("/Users/abc/Items/Latest", 300),
+        ("/UserItems/Resume", 60),
+        ("/Shows/NextUp", 60),
+    ],
+)
+def test_policy_ttl(path: str, ttl: float):
+    policy = get_policy(path)
+    assert policy is not None
+    assert policy.ttl == ttl
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/Items",
+        "/Items/abc/Images/Primary",
+        "/System/Info/Public/extra",
+        "/Users/abc/Items/Latest/extra",
+    ],
+)
+def test_no_policy(path: str):
+    assert get_policy(path) is None
+
+
+def test_cache_key_is_stable():
+    url = "http://server/Items/Latest?ParentId=1"
+    assert generate_cache_key(make_request(url)) == generate_cache_key(
+        make_request(url)
+    )
+
+
+def test_cache_key_depends_on_request():
+    key = generate_cache_key(make_request("http://server/Items/Latest?ParentId=1"))
+    assert key != generate_cache_key(
+        make_request("http://server/Items/Latest?ParentId=2")
+    )
+    assert key != generate_cache_key(
+        make_request("http://server/Items/Latest?ParentId=1", method="HEAD")
+    )
+
+
+def test_cache_key_is_per_user():
+    url = "http://server/Items/Latest"
+    assert generate_cache_key(make_request(url, token="a")) != generate_cache_key(
+        make_request(url, token="b")
+    )
+
+
+def test_controller_caches_policy_paths_only():
+    controller = PolicyController(policies=DEFAULT_POLICIES)
+    ok = httpcore.Response(200)
+    assert controller.is_cachable(make_request("http://s/Shows/NextUp?Limit=5"), ok)
+    assert not controller.is_cachable(make_request("http://s/Items"), ok)
+    assert not controller.is_cachable(
+        make_request("http://s/Shows/NextUp", method="POST"), ok
+    )
+    assert not controller.is_cachable(
+        make_request("http://s/Shows/NextUp"), httpcore.Response(500)
+    )
+
+
+def store(storage: LRUFileStorage, url: str, age: float = 0) -> str:
+    request = make_request(url)
+    key = generate_cache_key(request)
+    created_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=age
+    )
+    metadata = {"cache_key": key, "number_of_uses": 0, "created_at": created_at}
+    response = httpcore.Response(200, content=b"x" * 100)
+    response.read()
+    storage.store(key, response, request, metadata)
+    return key
+
+
+def test_storage_expires_by_policy(tmp_path: Path):
+    storage = LRUFileStorage(tmp_path, max_size=10**6, policies=DEFAULT_POLICIES)
+    fresh = store(storage, "http://s/Shows/NextUp", age=30)
+    stale = store(storage, "http://s/UserItems/Resume", age=90)
+    assert storage.retrieve(fresh) is not None
+    assert storage.retrieve(stale) is None
+    assert not (tmp_path / stale).exists()
+
+
+def test_storage_evicts_least_recently_used(tmp_path: Path):
+    first = store(
+        LRUFileStorage(tmp_path, max_size=10**6, policies=DEFAULT_POLICIES),
+        "http://s/Shows/NextUp?i=0",
+    )
+    size = (tmp_path / first).stat().st_size
+    storage = LRUFileStorage(tmp_path, max_size=size * 2, policies=DEFAULT_POLICIES)
+    second = store(storage, "http://s/Shows/NextUp?i=1")
+    assert storage.retrieve(first) is not None
+    third = store(storage, "http://s/Shows/NextUp?i=2")
+    assert storage.retrieve(second) is None
+    assert storage.retrieve(first) is not None
+    assert storage.retrieve(third) is not None
@@ -0,0 +1,142 @@
+from src.database.library import LibraryItem
+from src.library_filter import (
+    SORT_BY_DATE_ADDED,
+    SORT_BY_NAME,
+    SORT_BY_RATING,
+    SORT_BY_YEAR,
+    LibraryColumns,
+    LibraryFilter,
+)
+
+ITEMS = [
+    LibraryItem(
+        library_id="lib",
+        item_id="0",
+        item_type="Movie",
+        name="The Matrix",
+        sort_name="Matrix",
+        production_year=1999,
+        date_created="2024-01-02T10:00:00.0000000Z",
+        official_rating="R",
+        community_rating=8.2,
+        genres=("Action", "Science Fiction"),
+        played=True,
+    ),
+    LibraryItem(
+        library_id="lib",
+        item_id="1",
+        item_type="Movie",
+        name="Amélie",
+        production_year=2001,
+        date_created="2024-03-01T10:00:00.0000000Z",
+        official_rating="R",
+        community_rating=8.3,
+        genres=("Comedy", "Romance"),
+        tags=("French",),
+    ),
+    LibraryItem(
+        library_id="lib",
+        item_id="2",
+        item_type="Movie",
+        name="Zootopia",
+        production_year=2016,
+        date_created="2023-12-25T10:00:00.0000000Z",
+        official_rating="PG",
+        genres=("Animation", "Comedy"),
+        played=True,
+    ),
+    LibraryItem(
+        library_id="lib",
+        item_id="3",
+        item_type="Movie",
+        name="Brazil",
+        production_year=1985,
+        genres=("Science Fiction",),
+    ),
+]
+
+
+def query_ids(columns: LibraryColumns, **kwargs) -> list[str]:
+    return [ITEMS[index].item_id for index in columns.query(**kwargs)]
+
+
+def test_sort_by_name_uses_sort_name():
+    columns = LibraryColumns(ITEMS)
+    assert query_ids(columns) == ["1", "3", "0", "2"]
+    assert query_ids(columns, descending=True) == ["2", "0", "3", "1"]
+
+
+def test_sort_by_keys():
+    columns = LibraryColumns(ITEMS)
+    assert query_ids(columns, sort_by=SORT_BY_YEAR) == ["3", "0", "1", "2"]
+    assert query_ids(columns, sort_by=SORT_BY_DATE_ADDED, descending=True) == [
+        "1",
+        "0",
+        "2",
+        "3",
+    ]
+
+
+def test_sort_is_stable_by_name():
+    # Items without a rating sort as 0, in name order
+    columns = LibraryColumns(ITEMS)
+    assert query_ids(columns, sort_by=SORT_BY_RATING) == ["3", "2", "0", "1"]
+
+
+def test_filter_values():
+    columns = LibraryColumns(ITEMS)
+    assert columns.get_genres() == [
+        "Action",
+        "Animation",
+        "Comedy",
+        "Romance",
+        "Science Fiction",
+    ]
+    assert columns.get_tags() == ["French"]
+    assert columns.get_official_ratings() == ["PG", "R"]
+    assert columns.get_years() == [1985, 1999, 2001, 2016]
+
+
+def test_filter_matches_any_value_of_a_set():
+    columns = LibraryColumns(ITEMS)
+    library_filter = LibraryFilter(genres=frozenset(("Comedy", "Action")))
+    assert query_ids(columns, library_filter=library_filter) == ["1", "0", "2"]
+
+
+def test_filter_matches_every_set():
+    columns = LibraryColumns(ITEMS)
+    library_filter = LibraryFilter(
+        genres=frozenset(("Comedy",)), official_ratings=frozenset(("R",))
+    )
+    assert query_ids(columns, library_filter=library_filter) == ["1"]
+
+
+def test_filter_unplayed_only():
+    columns = LibraryColumns(ITEMS)
+    library_filter = LibraryFilter(unplayed_only=True)
+    assert query_ids(columns, library_filter=library_filter) == ["1", "3"]
+
+
+def test_filter_without_match():
+    columns = LibraryColumns(ITEMS)
+    library_filter = LibraryFilter(years=frozenset((1970,)))
+    assert query_ids(columns, library_filter=library_filter) == []
+
+
+def test_filter_large_library():
+    # Larger than a machine word, the bitsets span several bytes
+    items = [
+        LibraryItem(
+            library_id="lib",
+            item_id=str(index),
+            item_type="Movie",
+            name=f"Item {index:04}",
+            production_year=2000 + index % 3,
+        )
+        for index in range(1000)
+    ]
+    columns = LibraryColumns(items)
+    library_filter = LibraryFilter(years=frozenset((2001,)))
+    indices = columns.query(library_filter=library_filter)
+    assert indices == [index for index in range(1000) if index % 3 == 1]
+    assert len(columns) == 1000
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+Gio = pytest.importorskip("gi.repository.Gio")
+pytest.importorskip("jellyfin_api_client")
+
+# pylint: disable=wrong-import-position
+from src.jellyfin import SingleFlightStats, SingleFlightTransport
+from src.task import Task, TaskCancelledError
+
+URL = "http://server/Items/Latest"
+# Time given to the other requests to reach the in-flight one
+SETTLE_DELAY_S = 0.2
+
+
+class BlockingTransport(httpx.BaseTransport):
+    """Transport answering once released, counting the requests it gets"""
+
+    started: threading.Event
+    release: threading.Event
+    requests: list[httpx.Request]
+    errors: list[Exception]
+
+    def __init__(self, *errors: Exception) -> None:
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.requests = []
+        self.errors = list(errors)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        self.started.set()
+        self.release.wait(5)
+        if self.errors:
+            raise self.errors.pop(0)
+        return httpx.Response(200, content=request.url.path.encode())
+
+
+def send_in_thread(
+    transport: SingleFlightTransport, outcomes: list, url: str = URL
+) -> threading.Thread:
+    def send():
+        try:
+            response = transport.handle_request(httpx.Request("GET", url))
+            outcomes.append(response.read())
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            outcomes.append(error)
+
+    thread = threading.Thread(target=send)
+    thread.start()
+    return thread
+
+
+def test_identical_requests_are_sent_once():
+    inner = BlockingTransport()
+    stats = SingleFlightStats()
+    transport = SingleFlightTransport(inner, stats)
+    outcomes: list = []
+    threads = [send_in_thread(transport, outcomes)]
+    inner.started.wait(5)
+    threads += [send_in_thread(transport, outcomes) for _ in range(3)]
+    time.sleep(SETTLE_DELAY_S)
+    inner.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(inner.requests) == 1
+    assert outcomes == [b"/Items/Latest"] * 4
+    assert (stats.sent, stats.saved) == (1, 3)
+
+
+def test_different_requests_are_all_sent():
+    inner = BlockingTransport()
+    inner.release.set()
+    transport = SingleFlightTransport(inner, SingleFlightStats())
+    outcomes: list = []
+    threads = [
+        send_in_thread(transport, outcomes, f"{URL}?ParentId={index}")
+        for index in range(3)
+    ]
+    for thread in threads:
+        thread.join(5)
+    assert len(inner.requests) == 3
+
+
+def test_errors_are_shared():
+    inner = BlockingTransport(httpx.ConnectError("unreachable"))
+    transport = SingleFlightTransport(inner, SingleFlightStats())
+    outcomes: list = []
+    threads = [send_in_thread(transport, outcomes)]
+    inner.started.wait(5)
+    threads.append(send_in_thread(transport, outcomes))
+    time.sleep(SETTLE_DELAY_S)
+    inner.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(inner.requests) == 1
+    assert [type(outcome) for outcome in outcomes] == [httpx.ConnectError] * 2
+
+
+def test_waiters_retry_when_the_sender_is_cancelled():
+    inner = BlockingTransport(TaskCancelledError())
+    stats = SingleFlightStats()
+    transport = SingleFlightTransport(inner, stats)
+    outcomes: list = []
+    threads = [send_in_thread(transport, outcomes)]
+    inner.started.wait(5)
+    threads.append(send_in_thread(transport, outcomes))
+    time.sleep(SETTLE_DELAY_S)
+    inner.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(inner.requests) == 2
+    assert isinstance(outcomes[0], TaskCancelledError)
+    assert outcomes[1] == b"/Items/Latest"
+    assert (stats.sent, stats.saved) == (2, 0)
+
+
+def test_cancelled_waiter_stops_waiting():
+    inner = BlockingTransport()
+    transport = SingleFlightTransport(inner, SingleFlightStats())
+    outcomes: list = []
+    sender = send_in_thread(transport, outcomes)
+    inner.started.wait(5)
+
+    # The waiter runs as a task, to have a cancellable
+    waiter_outcomes: list = []
+    waiter_done = threading.Event()
+
+    def wait():
+        try:
+            transport.handle_request(httpx.Request("GET", URL))
+        except TaskCancelledError as error:
+            waiter_outcomes.append(error)
+        finally:
+            waiter_done.set()
+
+    cancellable = Gio.Cancellable()
+    Task(main=wait, cancellable=cancellable).run()
+    time.sleep(SETTLE_DELAY_S)
+    cancellable.cancel()
+    assert waiter_done.wait(5)
+    assert len(waiter_outcomes) == 1
+
+    # The request in flight isn't affected
+    inner.release.set()
+    sender.join(5)
+    assert outcomes == [b"/Items/Latest"]
+    assert len(inner.requests) == 1